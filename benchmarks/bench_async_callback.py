@@ -0,0 +1,98 @@
+"""
+Callback throughput of the sync and async views as Flask dispatches them.
+
+Both apps run the full login through the real blueprint with Flask's test
+client, on the same number of worker threads as a threaded WSGI server would
+use, against a local fake Okta answering after a fixed latency in its own
+process. Flask runs each async view in an event loop of its own, so the async
+flow opens and closes an httpx pool per request where the sync flow reuses
+its pooled connections.
+
+    python benchmarks/bench_async_callback.py \\
+        [logins] [latency_ms] [threads]
+"""
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+import requests
+
+from flask import Flask
+
+from fake_okta import start_fake_okta
+from flask_okta import OktaManager
+
+CLIENT_ID = 'benchmark-client'
+CLIENT_SECRET = 'benchmark-secret'
+REDIRECT_URI = 'http://localhost/authorization-code/callback'
+
+def create_app(issuer, use_async):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY = 'benchmark',
+        OKTA_CLIENT_ID = CLIENT_ID,
+        OKTA_CLIENT_SECRET = CLIENT_SECRET,
+        OKTA_ISSUER = issuer,
+        OKTA_DISCOVERY_CACHE = None,
+        OKTA_REDIRECT_URI = REDIRECT_URI,
+        OKTA_ASYNC = use_async,
+    )
+    OktaManager(app, after_authorization=lambda userinfo: userinfo['sub'])
+    return app
+
+def login(app, browser):
+    """
+    One full login as a browser would do it.
+    """
+    client = app.test_client()
+    response = client.get('/redirect-for-okta-login')
+    # the user agent follows the redirect to Okta, which redirects back
+    authorize = browser.get(response.location, allow_redirects=False)
+    callback = urlparse(authorize.headers['Location'])
+    query = parse_qs(callback.query)
+    response = client.get(
+        callback.path,
+        query_string = dict(code=query['code'][0], state=query['state'][0]),
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f'login failed { response.status }')
+
+def run(app, logins, threads):
+    browser = requests.Session()
+    # warm up imports, discovery and signing keys outside the timing
+    login(app, browser)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [
+            executor.submit(login, app, browser)
+            for _ in range(logins)
+        ]
+        for future in futures:
+            future.result()
+    return time.perf_counter() - start
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    logins = int(argv[0]) if len(argv) > 0 else 500
+    latency = float(argv[1]) / 1000 if len(argv) > 1 else 0.05
+    threads = int(argv[2]) if len(argv) > 2 else 8
+
+    process, issuer = start_fake_okta(CLIENT_ID, CLIENT_SECRET, latency)
+    try:
+        sync_elapsed = run(create_app(issuer, False), logins, threads)
+        async_elapsed = run(create_app(issuer, True), logins, threads)
+    finally:
+        process.terminate()
+
+    print(
+        f'{ logins } logins, { latency * 1000:.0f} ms Okta latency, '
+        f'{ threads } threads'
+    )
+    print(f'sync  { logins / sync_elapsed:8.1f} logins/s')
+    print(f'async { logins / async_elapsed:8.1f} logins/s')
+
+if __name__ == '__main__':
+    main()
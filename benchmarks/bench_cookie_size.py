@@ -0,0 +1,83 @@
+"""
+Session cookie bytes after login, tokens in the signed cookie against the
+server-side token store.
+
+Runs the real login and callback views against a local stand-in for Okta
+returning tokens sized like Okta's, then measures the cookie every later
+request, including each Dash callback, sends back.
+
+    python benchmarks/bench_cookie_size.py
+"""
+import secrets
+import tempfile
+import threading
+
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from flask import Flask
+
+from bench_handshakes import CountingServer
+from bench_handshakes import FakeOktaHandler
+from flask_okta import OktaManager
+
+# typical Okta access and id token JWT lengths
+ACCESS_TOKEN_BYTES = 900
+ID_TOKEN_BYTES = 1100
+
+def create_app(base_url, token_store, instance_path):
+    app = Flask(__name__, instance_path=instance_path)
+    app.config.update(
+        SECRET_KEY = 'benchmark',
+        OKTA_CLIENT_ID = 'client',
+        OKTA_CLIENT_SECRET = 'secret',
+        OKTA_AUTH_URI = f'{ base_url }/authorize',
+        OKTA_TOKEN_URI = f'{ base_url }/token',
+        OKTA_USERINFO_URI = f'{ base_url }/userinfo',
+        OKTA_REDIRECT_URI = 'http://localhost/authorization-code/callback',
+        OKTA_TOKEN_STORE = token_store,
+    )
+    OktaManager(app, after_authorization=lambda userinfo: 'logged in')
+    return app
+
+def cookie_bytes(client, app):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return len(cookie.key) + 1 + len(cookie.value)
+
+def login(app):
+    """
+    Cookie bytes after redirecting to Okta and after the callback.
+    """
+    client = app.test_client()
+    response = client.get('/redirect-for-okta-login')
+    query = parse_qs(urlparse(response.location).query)
+    before_callback = cookie_bytes(client, app)
+    response = client.get(
+        '/authorization-code/callback',
+        query_string = dict(code='code', state=query['state'][0]),
+    )
+    assert response.status_code == 200, response.status
+    return before_callback, cookie_bytes(client, app)
+
+def main():
+    FakeOktaHandler.tokens = dict(
+        access_token = secrets.token_urlsafe(ACCESS_TOKEN_BYTES)[:ACCESS_TOKEN_BYTES],
+        id_token = secrets.token_urlsafe(ID_TOKEN_BYTES)[:ID_TOKEN_BYTES],
+    )
+    server = CountingServer(('127.0.0.1', 0), FakeOktaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{ server.server_address[1] }'
+
+    print(f'{ "token store":12} { "redirect":>10} { "logged in":>10}')
+    with tempfile.TemporaryDirectory() as instance_path:
+        for token_store in (None, 'memory', 'sqlite'):
+            app = create_app(base_url, token_store, instance_path)
+            before_callback, logged_in = login(app)
+            print(
+                f'{ str(token_store):12} '
+                f'{ before_callback:10} { logged_in:10} bytes'
+            )
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Count connections opened to Okta per login, module-level `requests` against
+the pooled `OktaClient`.
+
+A local HTTP server stands in for the Okta token and userinfo endpoints and
+counts accepted connections. Every accepted connection is a TCP handshake, and
+a TLS handshake against a real Okta org.
+
+    python benchmarks/bench_handshakes.py [logins]
+"""
+import json
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import requests
+
+from flask import Flask
+
+from flask_okta import OktaManager
+from flask_okta.okta import exchange_for_userinfo
+from flask_okta.okta import get_pending_logins
+
+class CountingServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+class FakeOktaHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    # seconds to wait before responding, stands in for Okta's response time
+    latency = 0
+
+    tokens = dict(
+        access_token = 'access-token',
+        id_token = 'id-token',
+    )
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self._send_json(dict(
+            token_type = 'Bearer',
+            expires_in = 3600,
+            **self.tokens,
+        ))
+
+    def do_GET(self):
+        self._send_json(dict(
+            sub = 'user',
+            email = 'user@example.com',
+            name = 'User',
+        ))
+
+
+def login_module_level(base_url):
+    """
+    The back-channel calls as they were made before OktaClient.
+    """
+    exchange = requests.post(
+        f'{ base_url }/token',
+        data = dict(grant_type='authorization_code', code='code'),
+        auth = ('client', 'secret'),
+    ).json()
+    requests.get(
+        f'{ base_url }/userinfo',
+        headers = {
+            'Authorization': f'Bearer { exchange["access_token"] }',
+        },
+    ).json()
+
+def create_app(base_url):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY = 'benchmark',
+        OKTA_CLIENT_ID = 'client',
+        OKTA_CLIENT_SECRET = 'secret',
+        OKTA_TOKEN_URI = f'{ base_url }/token',
+        OKTA_USERINFO_URI = f'{ base_url }/userinfo',
+    )
+    OktaManager(app, after_authorization=lambda userinfo: '')
+    return app
+
+def run(server, logins, login):
+    server.connections = 0
+    start = time.perf_counter()
+    for _ in range(logins):
+        login()
+    elapsed = time.perf_counter() - start
+    return server.connections, elapsed
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    logins = int(argv[0]) if argv else 200
+
+    server = CountingServer(('127.0.0.1', 0), FakeOktaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{ server.server_address[1] }'
+
+    app = create_app(base_url)
+
+    def login_okta_client():
+        with app.test_request_context('/authorization-code/callback'):
+            get_pending_logins().add('state', 'verifier')
+            exchange_for_userinfo('code', 'state')
+
+    results = [
+        ('module requests', run(
+            server, logins, lambda: login_module_level(base_url))),
+        ('OktaClient', run(server, logins, login_okta_client)),
+    ]
+    server.shutdown()
+
+    print(f'{ logins } logins')
+    for name, (connections, elapsed) in results:
+        print(
+            f'{ name:16} '
+            f'{ connections / logins:6.3f} handshakes/login '
+            f'{ elapsed / logins * 1000:8.3f} ms/login'
+        )
+
+if __name__ == '__main__':
+    main()
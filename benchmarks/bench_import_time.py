@@ -0,0 +1,97 @@
+"""
+Import time budget for flask-okta.
+
+Times imports in fresh interpreters that already imported flask, as the host
+app has, and exits with status 1 when the median time of
+`from flask_okta import OktaManager` exceeds the budget, or when it pulls in
+modules that should only load on first use.
+
+    python benchmarks/bench_import_time.py [--runs N] [--budget-ms MS]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# statements timed, the one apps start with is held to the budget
+STATEMENTS = (
+    'import flask_okta',
+    'from flask_okta import OktaManager',
+    'from flask_okta import init_dash_for_okta',
+)
+CHECKED = 'from flask_okta import OktaManager'
+
+# modules importing OktaManager must not import
+DEFERRED_MODULES = ('asyncio', 'flask_login', 'requests', 'httpx', 'jwt')
+
+PROBE = '''
+import sys
+import time
+import flask
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed)
+# lazily imported modules are registered before they are loaded
+print(' '.join(sorted(
+    name for name, module in list(sys.modules.items())
+    if type(module).__name__ != '_LazyModule'
+)))
+'''
+
+def measure(statement):
+    """
+    Seconds to run statement in a fresh interpreter, and the modules loaded.
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(statement=statement)],
+        capture_output = True,
+        check = True,
+        text = True,
+    ).stdout.splitlines()
+    return float(output[0]), set(output[1].split())
+
+def run(runs):
+    result = {}
+    for statement in STATEMENTS:
+        samples = []
+        for _ in range(runs):
+            seconds, modules = measure(statement)
+            samples.append(seconds * 1000)
+        result[statement] = dict(
+            median_ms = round(statistics.median(samples), 3),
+            max_ms = round(max(samples), 3),
+            # from the last run, imports are deterministic
+            deferred_loaded = sorted(modules.intersection(DEFERRED_MODULES)),
+        )
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--budget-ms', type=float, default=25)
+    args = parser.parse_args(argv)
+
+    result = run(args.runs)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+    checked = result[CHECKED]
+    failures = []
+    if checked['median_ms'] > args.budget_ms:
+        failures.append(
+            f'{ CHECKED } took { checked["median_ms"] } ms, '
+            f'budget is { args.budget_ms } ms'
+        )
+    if checked['deferred_loaded']:
+        failures.append(
+            f'{ CHECKED } imported '
+            f'{ ", ".join(checked["deferred_loaded"]) }'
+        )
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
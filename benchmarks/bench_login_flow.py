@@ -0,0 +1,222 @@
+"""
+End to end login benchmark against a local fake Okta.
+
+Concurrent clients each run the full flow through the real blueprint,
+`redirect_for_okta_login`, Okta's authorize redirect, then
+`authorization_code_callback` and `after_authorization`. Per-stage latency
+percentiles and overall logins/sec are written as JSON for tracking
+regressions over time.
+
+    python benchmarks/bench_login_flow.py \\
+        [--logins N] [--concurrency C] [--latency-ms MS] [--output FILE]
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+import requests
+
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+import flask_okta.okta
+
+from fake_okta import start_fake_okta
+from flask_okta import OktaManager
+
+CLIENT_ID = 'benchmark-client'
+CLIENT_SECRET = 'benchmark-secret'
+REDIRECT_URI = 'http://localhost/authorization-code/callback'
+
+STAGES = ('pkce', 'token_exchange', 'userinfo', 'session_write', 'login')
+
+class StageTimer:
+    """
+    Thread-safe collection of stage durations in seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {stage: [] for stage in STAGES}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        return {
+            stage: percentiles(samples)
+            for stage, samples in self.samples.items()
+            if samples
+        }
+
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def save_session(self, app, session, response):
+        start = time.perf_counter()
+        try:
+            return super().save_session(app, session, response)
+        finally:
+            self.timer.add('session_write', time.perf_counter() - start)
+
+
+def percentiles(samples):
+    ms = sorted(sample * 1000 for sample in samples)
+    if len(ms) > 1:
+        cuts = statistics.quantiles(ms, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return dict(
+        count = len(ms),
+        p50_ms = round(p50, 3),
+        p95_ms = round(p95, 3),
+        p99_ms = round(p99, 3),
+        max_ms = round(ms[-1], 3),
+    )
+
+def instrument(timer):
+    """
+    Time flask-okta stages by wrapping the functions the views call.
+    """
+    okta_module = flask_okta.okta
+
+    generate_code_verifier = okta_module.generate_code_verifier
+    get_code_challenge = okta_module.get_code_challenge
+
+    def pkce_verifier(*args, **kwargs):
+        start = time.perf_counter()
+        verifier = generate_code_verifier(*args, **kwargs)
+        # challenge is computed right after, count both as one stage
+        get_code_challenge(verifier)
+        timer.add('pkce', time.perf_counter() - start)
+        return verifier
+
+    okta_module.generate_code_verifier = pkce_verifier
+    okta_module.post_for_access_code = timer.wrap(
+        'token_exchange',
+        okta_module.post_for_access_code,
+    )
+    okta_module.request_userinfo = timer.wrap(
+        'userinfo',
+        okta_module.request_userinfo,
+    )
+
+def create_app(issuer, timer):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY = 'benchmark',
+        OKTA_CLIENT_ID = CLIENT_ID,
+        OKTA_CLIENT_SECRET = CLIENT_SECRET,
+        OKTA_ISSUER = issuer,
+        OKTA_DISCOVERY_CACHE = None,
+        OKTA_REDIRECT_URI = REDIRECT_URI,
+    )
+    app.session_interface = TimedSessionInterface(timer)
+    OktaManager(app, after_authorization=lambda userinfo: userinfo['sub'])
+    return app
+
+def login(app, browser, timer):
+    """
+    One full login as a browser would do it.
+    """
+    start = time.perf_counter()
+    client = app.test_client()
+    response = client.get('/redirect-for-okta-login')
+    # the user agent follows the redirect to Okta, which redirects back
+    authorize = browser.get(response.location, allow_redirects=False)
+    callback = urlparse(authorize.headers['Location'])
+    query = parse_qs(callback.query)
+    response = client.get(
+        callback.path,
+        query_string = dict(code=query['code'][0], state=query['state'][0]),
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f'login failed { response.status }')
+    timer.add('login', time.perf_counter() - start)
+
+def run(logins, concurrency, latency):
+    process, issuer = start_fake_okta(CLIENT_ID, CLIENT_SECRET, latency)
+    try:
+        timer = StageTimer()
+        app = create_app(issuer, StageTimer())
+        browser = requests.Session()
+
+        # warm up connection pools and key cache outside the measurement
+        login(app, browser, StageTimer())
+
+        app.session_interface.timer = timer
+        instrument(timer)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            futures = [
+                executor.submit(login, app, browser, timer)
+                for _ in range(logins)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+
+    return dict(
+        benchmark = 'login_flow',
+        timestamp = time.time(),
+        python = platform.python_version(),
+        logins = logins,
+        concurrency = concurrency,
+        okta_latency_ms = latency * 1000,
+        elapsed_s = round(elapsed, 3),
+        logins_per_sec = round(logins / elapsed, 1),
+        stages = timer.summary(),
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--logins', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    result = run(args.logins, args.concurrency, args.latency_ms / 1000)
+
+    for stage, stats in result['stages'].items():
+        print(
+            f'{ stage:15} p50 { stats["p50_ms"]:8.3f} ms '
+            f'p95 { stats["p95_ms"]:8.3f} ms p99 { stats["p99_ms"]:8.3f} ms',
+            file = sys.stderr,
+        )
+    print(f'{ result["logins_per_sec"] } logins/s', file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
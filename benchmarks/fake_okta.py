@@ -0,0 +1,100 @@
+"""
+Local stand-in for an Okta authorization server, for benchmarks.
+
+Serves `flask_okta.testing.FakeOkta` over HTTP, so the real flask-okta
+blueprint and its connection pools can be driven end to end without an Okta
+org. Requires PyJWT with cryptography.
+"""
+import multiprocessing
+import time
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from flask_okta.testing import FakeOkta
+
+ISSUER_PATH = '/oauth2/default'
+
+USERINFO = dict(
+    sub = '00uid4BxXw6I6TV4m0g3',
+    name = 'John Doe',
+    email = 'john.doe@example.com',
+    email_verified = True,
+    locale = 'en-US',
+)
+
+class FakeOktaServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, client_id, client_secret, latency=0):
+        super().__init__(address, FakeOktaHandler)
+        self.latency = latency
+        self.issuer = (
+            f'http://{ self.server_address[0] }:{ self.server_address[1] }'
+            f'{ ISSUER_PATH }'
+        )
+        self.okta = FakeOkta(
+            client_id = client_id,
+            client_secret = client_secret,
+            issuer = self.issuer,
+            userinfo = USERINFO,
+        )
+
+
+class FakeOktaHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        server = self.server
+        status, headers, body = server.okta.handle(
+            self.command,
+            f'http://{ self.headers["Host"] }{ self.path }',
+            self.headers,
+            body,
+        )
+        # browser redirects are not back-channel calls and do not wait
+        if server.latency and status != 302:
+            time.sleep(server.latency)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = respond
+
+    do_POST = respond
+
+
+def _serve(client_id, client_secret, latency, issuer_queue):
+    server = FakeOktaServer(
+        ('127.0.0.1', 0),
+        client_id,
+        client_secret,
+        latency = latency,
+    )
+    issuer_queue.put(server.issuer)
+    server.serve_forever()
+
+def start_fake_okta(client_id, client_secret, latency=0):
+    """
+    Run the fake authorization server in a child process, so it does not
+    compete with the benchmark for the GIL. Returns (process, issuer).
+    """
+    issuer_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target = _serve,
+        args = (client_id, client_secret, latency, issuer_queue),
+        daemon = True,
+    )
+    process.start()
+    return process, issuer_queue.get()
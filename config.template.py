@@ -14,6 +14,9 @@ OKTA_AUTH_URI = f'https://{okta_domain}/oauth2/default/v1/authorize'
 # should be able to build this with `url_for`
 OKTA_REDIRECT_URI = f'http://{redirect_domain}/authorization-code/callback'
 
+# OKTA_ISSUER
+# With an issuer the endpoints below are found with OpenID Connect discovery,
+# once at init_app. Any endpoint given here overrides the discovered one.
 #OKTA_ISSUER = f'https://{okta_domain}/oauth2/default'
 #OKTA_TOKEN_URI = f'https://{okta_domain}/oauth2/default/v1/token'
 #OKTA_TOKEN_INTROSPECTION_URI = f'https://{okta_domain}/oauth2/default/v1/introspect'
@@ -24,8 +27,386 @@ OKTA_REDIRECT_URI = f'http://{redirect_domain}/authorization-code/callback'
 # Given here, on init_app, or extension __init__
 #OKTA_REDIRECT_LOGIN_ENDPOINT =
 
+# OKTA_BLUEPRINT_NAME
+# Name of flask-okta's blueprint. The Dash login gate serves it without login.
+# Default 'okta'
+#OKTA_BLUEPRINT_NAME = 'okta'
+
 # OKTA_DEBUG
 # Preview before redirect to Okta
 # Default False
 OKTA_DEBUG = True
 
+
+# OKTA_POOL_CONNECTIONS, OKTA_POOL_MAXSIZE
+# Connection pooling for back-channel requests to Okta. Number of host pools
+# and connections kept open per host.
+# Defaults 4 and 16
+#OKTA_POOL_CONNECTIONS = 4
+#OKTA_POOL_MAXSIZE = 16
+
+# OKTA_KEEP_ALIVE
+# Reuse connections to Okta between requests.
+# Default True
+#OKTA_KEEP_ALIVE = True
+
+# OKTA_USERINFO_CACHE_SIZE, OKTA_USERINFO_CACHE_TTL
+# Cache of /userinfo responses keyed by a hash of the access token. Entries
+# never outlive the access token. A size of 0 disables the cache. The size
+# does not apply to OKTA_SHARED_CACHE.
+# Defaults 1024 entries and 300 seconds
+#OKTA_USERINFO_CACHE_SIZE = 1024
+#OKTA_USERINFO_CACHE_TTL = 300
+
+# OKTA_USERINFO_FROM_ID_TOKEN
+# Skip the /userinfo request at login. The id_token from the token exchange is
+# verified locally against the issuer's cached signing keys and its claims are
+# given to after_authorization. Requires OKTA_ISSUER and PyJWT,
+# `pip install flask_okta[jwt]`.
+# Default False
+#OKTA_USERINFO_FROM_ID_TOKEN = True
+
+# OKTA_JWKS_URI
+# Signing keys for local token verification.
+# Default f'{OKTA_ISSUER}/v1/keys'
+#OKTA_JWKS_URI = f'https://{okta_domain}/oauth2/default/v1/keys'
+
+# OKTA_JWT_LEEWAY
+# Seconds of clock skew allowed checking token expiry.
+# Default 0
+#OKTA_JWT_LEEWAY = 0
+
+# OKTA_DISCOVERY
+# Load /.well-known/openid-configuration from OKTA_ISSUER at init_app.
+# Default True
+#OKTA_DISCOVERY = True
+
+# OKTA_DISCOVERY_CACHE
+# File the discovery document is cached in between restarts and shared by
+# workers. Revalidated with its ETag after the response max-age. None to only
+# keep it in memory. Not used with OKTA_SHARED_CACHE.
+# Default instance folder, okta-discovery.json
+#OKTA_DISCOVERY_CACHE = None
+
+# OKTA_ASYNC
+# Register async callback and userinfo views that await Okta through an httpx
+# connection pool per event loop, closed with the loop. Flask runs each async
+# view in a loop of its own, so under WSGI the pool lasts one request.
+# after_authorization may then be a coroutine function. Requires
+# `pip install flask_okta[async]`.
+# Default False
+#OKTA_ASYNC = True
+
+# OKTA_TOKEN_STORE
+# Keep tokens and login state server-side with only a short opaque handle in
+# the session cookie. 'memory' is per worker process, 'sqlite' is shared by
+# workers on a host. None keeps everything in the session.
+# Default None
+#OKTA_TOKEN_STORE = 'sqlite'
+
+# OKTA_TOKEN_STORE_PATH
+# Database file for the 'sqlite' token store.
+# Default instance folder, okta-tokens.sqlite3
+#OKTA_TOKEN_STORE_PATH = '/var/lib/myapp/okta-tokens.sqlite3'
+
+# OKTA_TOKEN_STORE_SIZE, OKTA_TOKEN_STORE_TTL
+# Entry limit for the 'memory' store and seconds an entry lives after its last
+# change.
+# Defaults 10000 and 86400
+#OKTA_TOKEN_STORE_SIZE = 10000
+#OKTA_TOKEN_STORE_TTL = 86400
+
+# OKTA_SCOPE
+# Space separated scopes requested at login. Add offline_access to get a
+# refresh token and renew access tokens without sending the user to Okta.
+# Checked when the app starts, openid is required and unknown scopes raise
+# ValueError.
+# Default 'openid email profile'
+#OKTA_SCOPE = 'openid email profile offline_access'
+
+# OKTA_REFRESH_LEEWAY
+# Seconds before expiry an access token is renewed with the refresh token.
+# Default 60
+#OKTA_REFRESH_LEEWAY = 60
+
+# OKTA_REFRESH_PROACTIVE
+# Check for renewal before every request instead of only when the access
+# token is used.
+# Default False
+#OKTA_REFRESH_PROACTIVE = True
+
+# OKTA_AUDIENCE
+# Expected aud claim of access tokens accepted by `okta.token_required` and
+# the flask-login request loader. Tokens are verified locally against the
+# issuer's signing keys, requires OKTA_ISSUER and PyJWT.
+# Default 'api://default'
+#OKTA_AUDIENCE = 'api://default'
+
+# OKTA_BEARER_CACHE_SIZE
+# Verified access tokens kept, by token hash, until they expire.
+# Default 10000
+#OKTA_BEARER_CACHE_SIZE = 10000
+
+# OKTA_METRICS
+# Keep in-process histograms and counters of Okta response times and status
+# codes, flow phase durations and session cookie bytes. Phase timings are also
+# sent as the `flask_okta.signals.phase_timed` blinker signal. Wraps the app's
+# session interface to time session writes.
+# Default False
+#OKTA_METRICS = True
+
+# OKTA_METRICS_ENDPOINT
+# Serve the metrics as JSON from the okta blueprint at OKTA_METRICS_PATH.
+# Without it, or without OKTA_METRICS, no route is registered and the app's
+# own rules are untouched.
+# Default False
+#OKTA_METRICS_ENDPOINT = True
+
+# OKTA_METRICS_PATH
+# Rule of the metrics endpoint.
+# Default '/okta/metrics'
+#OKTA_METRICS_PATH = '/okta/metrics'
+
+# OKTA_SERVER_TIMING
+# Add a Server-Timing header with phase durations to okta blueprint
+# responses.
+# Default False
+#OKTA_SERVER_TIMING = True
+
+# OKTA_TENANTS
+# Serve many Okta orgs from one app. A dict of tenant name to overrides of the
+# OKTA_* keys above, or a callable taking a tenant name and returning them,
+# None for unknown tenants which get 404. Credentials, redirect URIs,
+# OKTA_AUDIENCE, issuer and endpoint keys, discovery and pool options can be
+# overridden per tenant. Each tenant gets its own discovery metadata, signing
+# keys and connection pool, created on its first request.
+# Default None, a single org configured by the keys above
+#OKTA_TENANTS = {
+#    'acme.example.com': dict(
+#        OKTA_ISSUER = 'https://acme.okta.com/oauth2/default',
+#        OKTA_CLIENT_ID = 'client id',
+#        OKTA_CLIENT_SECRET = 'client secret',
+#        OKTA_REDIRECT_URI = (
+#            'https://acme.example.com/authorization-code/callback'),
+#    ),
+#}
+
+# OKTA_TENANT_FROM
+# How the tenant name is taken from a request. 'host' for the Host header,
+# 'path' for the first path segment, which also prefixes the okta blueprint
+# routes, or a callable returning the name.
+# Default 'host'
+#OKTA_TENANT_FROM = 'path'
+
+# OKTA_TENANT_CACHE_SIZE
+# Maximum tenants kept per process, least recently used are evicted first.
+# Default 256
+#OKTA_TENANT_CACHE_SIZE = 256
+
+# OKTA_TENANT_IDLE_TTL
+# Seconds after its last request a tenant is evicted.
+# Default 3600
+#OKTA_TENANT_IDLE_TTL = 3600
+
+# OKTA_CONNECT_TIMEOUT
+# OKTA_READ_TIMEOUT
+# Seconds to wait for a connection to Okta, and between bytes of its
+# response. A call that times out raises a 503.
+# Default 3.05 and 10
+#OKTA_CONNECT_TIMEOUT = 3.05
+#OKTA_READ_TIMEOUT = 10
+
+# OKTA_RETRIES
+# Retries of idempotent calls to Okta, GETs such as userinfo, keys and
+# discovery, after connection errors, timeouts and 5xx responses. Token
+# requests are never retried, authorization codes and rotating refresh
+# tokens are single use.
+# Default 2
+#OKTA_RETRIES = 2
+
+# OKTA_RETRY_BACKOFF
+# OKTA_RETRY_BACKOFF_MAX
+# Seconds the first retry waits at most, doubled for each further retry up to
+# the maximum. Waits are randomized between zero and that bound.
+# Default 0.1 and 2
+#OKTA_RETRY_BACKOFF = 0.1
+#OKTA_RETRY_BACKOFF_MAX = 2
+
+# OKTA_BREAKER_THRESHOLD
+# OKTA_BREAKER_RESET
+# Consecutive failures of an Okta endpoint opening its circuit, and seconds
+# calls to it then fail fast with a 503 before one trial call is let through.
+# Default 5 and 30
+#OKTA_BREAKER_THRESHOLD = 5
+#OKTA_BREAKER_RESET = 30
+
+# OKTA_HEALTH_ENDPOINT
+# Serve circuit breaker states as JSON from the okta blueprint at
+# OKTA_HEALTH_PATH, 503 while any circuit is not closed. Without it no route
+# is registered and the app's own rules are untouched.
+# Default False
+#OKTA_HEALTH_ENDPOINT = True
+
+# OKTA_HEALTH_PATH
+# Rule of the health endpoint.
+# Default '/okta/health'
+#OKTA_HEALTH_PATH = '/okta/health'
+
+# OKTA_PENDING_LOGIN_STORE
+# Where logins redirected to Okta wait for their callback, by state, with
+# their PKCE code verifier, nonce and return path. None keeps them in the
+# okta session, 'sqlite' in OKTA_TOKEN_STORE_PATH so callbacks can land on any
+# worker with only the states in the session, 'memory' in the worker process
+# for single process deployments, or an ExpiringStore instance.
+# Default None
+#OKTA_PENDING_LOGIN_STORE = 'sqlite'
+
+# OKTA_PENDING_LOGIN_TTL
+# Seconds a user has to sign in at Okta and come back.
+# Default 600
+#OKTA_PENDING_LOGIN_TTL = 600
+
+# OKTA_PENDING_LOGINS_PER_SESSION
+# Logins one session may have pending, from several tabs or repeated clicks.
+# The oldest is dropped first.
+# Default 5
+#OKTA_PENDING_LOGINS_PER_SESSION = 5
+
+# OKTA_PENDING_LOGIN_STORE_SIZE
+# Maximum pending logins kept by the memory backend.
+# Default 10000
+#OKTA_PENDING_LOGIN_STORE_SIZE = 10000
+
+# OKTA_TRACE_SIZE
+# With OKTA_DEBUG, login attempts kept for the timeline at /okta/trace, each
+# with its requests, flow phases and calls to Okta with status, latency and
+# response bytes. 0 to not record.
+# Default 50
+#OKTA_TRACE_SIZE = 50
+
+# OKTA_INDEXED_CLAIMS
+# Userinfo claims saved to the session at login for `okta.require_groups` and
+# `okta.require_claims`. Add groups to OKTA_SCOPE and a groups claim to the
+# authorization server for group membership.
+# Default ('groups',)
+#OKTA_INDEXED_CLAIMS = ('groups', 'department')
+
+# OKTA_CLAIMS_REVALIDATE
+# Seconds a session's indexed claims are trusted before /userinfo is asked
+# again in a background thread. Checks keep using the current claims until
+# the answer arrives. 0 to only capture claims at login.
+# Default 300
+#OKTA_CLAIMS_REVALIDATE = 300
+
+# OKTA_USER_SNAPSHOT
+# Dash integration. Keep a signed copy of the user's stored claims in the
+# session and rebuild `current_user` from it on Dash callbacks, without
+# loading the user from the user store. Needs a user class with from_claims.
+# Metrics show it as user_snapshot.
+# Default False
+#OKTA_USER_SNAPSHOT = True
+
+# OKTA_USER_SNAPSHOT_TTL
+# Seconds a user snapshot is trusted. A user changed or loaded with other
+# claims in this process is reloaded at once, other processes reload it within
+# this time.
+# Default 300
+#OKTA_USER_SNAPSHOT_TTL = 300
+
+# OKTA_REVOKE_ON_LOGOUT
+# Revoke the session's access and refresh tokens at Okta on logout. Tokens
+# are queued for background workers so logout does not wait on Okta. Queue
+# depth, revocations, retries, failures and drops are in the metrics as
+# revocation.
+# Default False
+#OKTA_REVOKE_ON_LOGOUT = True
+
+# OKTA_REVOCATION_QUEUE_SIZE, OKTA_REVOCATION_WORKERS, OKTA_REVOCATION_RETRIES
+# Revocations queued at most, more are dropped. Worker threads sending them,
+# and retries of a failed revocation. Queued revocations are sent at exit.
+# Defaults 1000, 2 and 3
+#OKTA_REVOCATION_QUEUE_SIZE = 1000
+#OKTA_REVOCATION_WORKERS = 2
+#OKTA_REVOCATION_RETRIES = 3
+
+# OKTA_TRANSPORT
+# Stand-in for the network to Okta, for tests. Every request of the Okta
+# clients is answered by it, see `flask_okta.testing.FakeOkta.app_config`.
+# Default None
+#OKTA_TRANSPORT = FakeOkta()
+
+# OKTA_RATE_LIMIT
+# Token buckets limiting requests to the login redirect and callback by
+# client IP and by session, answered with 429 and Retry-After before any call
+# to Okta. 'memory' limits each worker on its own, 'sqlite' shares the limits
+# of all workers on a host through OKTA_RATE_LIMIT_PATH, or a TokenBuckets
+# instance. None does not limit. Behind a proxy, use werkzeug's ProxyFix so
+# the client IP is the real one. Metrics show it as rate_limit.
+# Default None
+#OKTA_RATE_LIMIT = 'sqlite'
+
+# OKTA_RATE_LIMIT_PATH
+# SQLite file of the 'sqlite' rate limit.
+# Default OKTA_TOKEN_STORE_PATH
+#OKTA_RATE_LIMIT_PATH = '/var/lib/myapp/okta-rate-limits.sqlite3'
+
+# OKTA_RATE_LIMIT_IP_RATE, OKTA_RATE_LIMIT_IP_BURST
+# Requests per second one client IP is allowed over time, and at once. A
+# login is two requests. Keep the burst high when many users share an IP.
+# Defaults 2.0 and 60
+#OKTA_RATE_LIMIT_IP_RATE = 2.0
+#OKTA_RATE_LIMIT_IP_BURST = 60
+
+# OKTA_RATE_LIMIT_SESSION_RATE, OKTA_RATE_LIMIT_SESSION_BURST
+# Requests per second one session is allowed over time, and at once.
+# Defaults 0.2 and 10
+#OKTA_RATE_LIMIT_SESSION_RATE = 0.2
+#OKTA_RATE_LIMIT_SESSION_BURST = 10
+
+# OKTA_RATE_LIMIT_SIZE
+# Buckets kept by the 'memory' rate limit, least recently used dropped first.
+# Default 10000
+#OKTA_RATE_LIMIT_SIZE = 10000
+
+# OKTA_THROTTLE
+# Pace calls to Okta by the X-Rate-Limit-* headers of its responses, so logins
+# slow down before Okta answers 429 instead of failing. Work that can wait is
+# put off first: background claim revalidation, refreshes of access tokens
+# with more than half of OKTA_REFRESH_LEEWAY left, and revocations after
+# logout, held back up to a minute. Metrics show the budget of each endpoint
+# as okta_rate_limits.
+# Default True
+#OKTA_THROTTLE = True
+
+# OKTA_THROTTLE_PACE_BELOW, OKTA_THROTTLE_DEFER_BELOW
+# Share of an endpoint's rate limit left when calls are spread evenly over
+# the rest of its window, and when calls that can wait are put off.
+# Defaults 0.2 and 0.5
+#OKTA_THROTTLE_PACE_BELOW = 0.2
+#OKTA_THROTTLE_DEFER_BELOW = 0.5
+
+# OKTA_THROTTLE_MAX_WAIT
+# Seconds a call is held back at most. Calls that would wait longer for the
+# rate limit to reset fail fast with 503 and Retry-After.
+# Default 2
+#OKTA_THROTTLE_MAX_WAIT = 2
+
+# OKTA_SHARED_CACHE
+# Cache the discovery document, signing keys and /userinfo responses for all
+# workers on a host. 'sqlite' in OKTA_SHARED_CACHE_PATH, or an ExpiringStore
+# instance. One worker refetches an expired entry while the others keep
+# serving it, userinfo excepted, or wait for the fetch. None keeps these
+# caches per process. Metrics show it as shared_cache.
+# Default None
+#OKTA_SHARED_CACHE = 'sqlite'
+
+# OKTA_SHARED_CACHE_PATH
+# SQLite file of the shared cache.
+# Default instance folder, okta-cache.sqlite3
+#OKTA_SHARED_CACHE_PATH = '/var/lib/myapp/okta-cache.sqlite3'
+
+# OKTA_SHARED_CACHE_FILL_TIMEOUT
+# Seconds one worker may hold the right to refetch an entry. A worker that
+# died while fetching holds up the others no longer than this.
+# Default 10
+#OKTA_SHARED_CACHE_FILL_TIMEOUT = 10
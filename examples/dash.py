@@ -9,6 +9,7 @@ from flask_login import current_user
 from flask_login import login_user
 
 from flask_okta import init_dash_for_okta
+from flask_okta.dash import USERS
 from flask_okta.dash import User
 
 dash_app = Dash(__name__)
@@ -58,4 +59,9 @@ def before_request():
     is_authenticated = current_user.is_authenticated
     is_bypass_okta = current_app.config.get('BYPASS_OKTA', False)
     if not is_authenticated and is_bypass_okta:
-        login_user(User('test123', 'test123@email.com', 'Test User'))
+        claims = USERS.set('test123', dict(
+            sub = 'test123',
+            email = 'test123@email.com',
+            name = 'Test User',
+        ))
+        login_user(User.from_claims(claims))
@@ -11,6 +11,7 @@ from flask_login import login_user
 from flask_login import logout_user
 
 from flask_okta import OktaManager
+from flask_okta.dash import USERS
 from flask_okta.dash import User
 
 # configure logging ASAP. before app creation preferred by Flask docs.
@@ -47,13 +48,9 @@ def after_authorization(userinfo):
     instance and log the user object in with flask-login. Finally redirect to
     the greeting endpoint.
     """
-    user_id = userinfo['sub']
-    user = User.get(user_id)
-    if not user:
-        # create user taking some of the user info data from Okta
-        user = User(user_id, userinfo['email'], userinfo['name'])
-        # update "database"
-        USERS[user_id] = user
+    # register or update the user with some of the user info from Okta
+    claims = USERS.set(userinfo['sub'], userinfo)
+    user = User.from_claims(claims)
     # login our user object with flask-login
     login_user(user)
     return redirect(url_for('hello'))
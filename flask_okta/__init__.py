@@ -1,2 +1,24 @@
-from .dash import init_dash_for_okta
-from .extension import OktaManager
+import importlib
+
+# public names and the modules defining them, imported on first access so
+# `import flask_okta` stays cheap for processes using only part of it
+_LAZY_NAMES = {
+    'AsyncOktaClient': '.aio',
+    'OktaClient': '.client',
+    'OktaManager': '.extension',
+    'init_dash_for_okta': '.dash',
+}
+
+__all__ = sorted(_LAZY_NAMES)
+
+def __getattr__(name):
+    module_name = _LAZY_NAMES.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # cache so later access skips this function
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
@@ -0,0 +1,389 @@
+import importlib.util
+import inspect
+import os
+import threading
+import time
+import weakref
+
+from flask import abort
+from flask import current_app
+
+from .cache import token_cache_key
+from .client import DEFAULT_POOL_MAXSIZE
+from .metrics import timed
+from .okta import access_code_request
+from .okta import cache_userinfo
+from .okta import claim_pending_login
+from .okta import get_okta_tenant
+from .okta import get_userinfo_cache
+from .okta import id_token_userinfo
+from .okta import refresh_due
+from .okta import refresh_request
+from .okta import session_access_token
+from .okta import store_claims
+from .okta import store_exchange
+from .okta import store_refresh
+from .okta import userinfo_request
+from .session import okta_session
+from .resilience import DEFAULT_BACKOFF
+from .resilience import DEFAULT_BACKOFF_MAX
+from .resilience import DEFAULT_BREAKER_RESET
+from .resilience import DEFAULT_BREAKER_THRESHOLD
+from .resilience import DEFAULT_CONNECT_TIMEOUT
+from .resilience import DEFAULT_READ_TIMEOUT
+from .resilience import DEFAULT_RETRIES
+from .resilience import Breakers
+from .resilience import RequestAttempts
+
+def require_httpx():
+    """
+    Raise if the optional httpx dependency is missing, without importing it.
+    """
+    if importlib.util.find_spec('httpx') is None:
+        raise RuntimeError(
+            'The async Okta flow requires httpx. '
+            'Install with `pip install flask_okta[async]`.'
+        )
+
+
+class AsyncOktaClient:
+    """
+    Pooled, keep-alive async HTTP client for back-channel requests to Okta.
+
+    An `httpx.AsyncClient` cannot be used across event loops, so one is kept
+    per running loop and closed when the loop shuts down. Flask runs each
+    async view in a loop of its own, so there the pool lives for one request
+    and is closed at its end. Callers on a long lived loop, an ASGI server or
+    a task driving many logins, share one pool.
+
+    Timeouts, retries, circuit breakers and rate limit pacing behave as in
+    `flask_okta.client.OktaClient`.
+    """
+
+    def __init__(
+        self,
+        pool_maxsize = DEFAULT_POOL_MAXSIZE,
+        keep_alive = True,
+        observer = None,
+        connect_timeout = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout = DEFAULT_READ_TIMEOUT,
+        retries = DEFAULT_RETRIES,
+        backoff = DEFAULT_BACKOFF,
+        backoff_max = DEFAULT_BACKOFF_MAX,
+        breaker_threshold = DEFAULT_BREAKER_THRESHOLD,
+        breaker_reset = DEFAULT_BREAKER_RESET,
+        transport = None,
+        throttle = None,
+    ):
+        """
+        :param pool_maxsize:
+            Maximum connections open at once per loop.
+        :param keep_alive:
+            Reuse connections between requests.
+        :param observer:
+            See `flask_okta.client.OktaClient`, as are the remaining
+            parameters.
+        :param transport:
+            Stand-in for the network whose `httpx_transport()` serves every
+            request, see `flask_okta.testing.FakeOkta`.
+        """
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.observer = observer
+        self.transport = transport
+        self.throttle = throttle
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breakers = Breakers(
+            threshold = breaker_threshold,
+            reset_timeout = breaker_reset,
+        )
+        self.retried = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._clients = weakref.WeakKeyDictionary()
+        self._ssl_context = None
+
+    def _create_client(self):
+        # imported on first use, like requests in OktaClient
+        require_httpx()
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections = self.pool_maxsize,
+            max_keepalive_connections = (
+                self.pool_maxsize if self.keep_alive else 0
+            ),
+        )
+        timeout = httpx.Timeout(
+            self.read_timeout,
+            connect = self.connect_timeout,
+        )
+        transport = None
+        if self.transport is not None:
+            transport = self.transport.httpx_transport()
+        if self._ssl_context is None:
+            # loading the CA bundle takes longer than a request to Okta, the
+            # context is shared by the clients of every loop
+            self._ssl_context = httpx.create_ssl_context()
+        return httpx.AsyncClient(
+            limits = limits,
+            timeout = timeout,
+            transport = transport,
+            verify = self._ssl_context,
+        )
+
+    async def _hold(self, loop, client):
+        # asyncio.run, which Flask runs every async view under, closes the
+        # loop's open async generators before the loop itself
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._clients.get(loop, (None,))[0] is client:
+                    del self._clients[loop]
+            await client.aclose()
+
+    async def get_client(self):
+        """
+        `httpx.AsyncClient` for the running loop in this process.
+        """
+        # imported here rather than with the package, which it would slow
+        # down, the caller runs in an event loop so it is loaded already
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        pid = os.getpid()
+        with self._lock:
+            if self._pid != pid:
+                # clients inherited through fork are dropped, not closed
+                self._clients = weakref.WeakKeyDictionary()
+                self._pid = pid
+            entry = self._clients.get(loop)
+            if entry is not None:
+                return entry[0]
+            client = self._create_client()
+            holder = self._hold(loop, client)
+            self._clients[loop] = (client, holder)
+        # runs to the yield without suspending
+        await holder.asend(None)
+        return client
+
+    async def _send(self, method, url, **kwargs):
+        client = await self.get_client()
+        start = time.perf_counter()
+        status = None
+        size = None
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+            # the body is already read, requests to Okta are not streamed
+            size = len(response.content)
+        finally:
+            if self.observer is not None:
+                self.observer(
+                    method,
+                    url,
+                    status,
+                    time.perf_counter() - start,
+                    size,
+                )
+        return response
+
+    async def _send_within_rate_limit(self, method, url, endpoint, **kwargs):
+        import asyncio
+
+        response = await self._send(method, url, **kwargs)
+        throttle = self.throttle
+        if throttle is None:
+            return response
+        wait = throttle.resend_after(
+            endpoint,
+            response.headers,
+            response.status_code,
+        )
+        if wait is not None:
+            await response.aclose()
+            await asyncio.sleep(wait)
+            response = await self._send(method, url, **kwargs)
+            throttle.update(endpoint, response.headers, response.status_code)
+        return response
+
+    async def request(self, method, url, **kwargs):
+        """
+        Send a request to Okta through the pool for the running loop,
+        retrying idempotent requests. Raises `OktaUnavailable` when the
+        endpoint's circuit is open or Okta could not be reached.
+        """
+        # dict lookups once the first client imported them
+        import asyncio
+        import httpx
+
+        attempts = RequestAttempts(self, method, url)
+        for wait in attempts:
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                response = await self._send_within_rate_limit(
+                    method,
+                    url,
+                    attempts.endpoint,
+                    **kwargs,
+                )
+            except httpx.TransportError as exc:
+                attempts.unreachable(exc)
+                continue
+            except Exception:
+                attempts.failed()
+                raise
+            if attempts.finished(response.status_code):
+                return response
+            await response.aclose()
+
+    def stats(self):
+        """
+        Retries sent and circuit breaker state by endpoint.
+        """
+        return dict(
+            retries = self.retried,
+            breakers = self.breakers.stats(),
+        )
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def aclose(self):
+        """
+        Close the pool for the running loop.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(loop)
+        if entry is not None:
+            # the holder removes and closes the client
+            await entry[1].aclose()
+
+
+def get_async_okta_client():
+    """
+    Async pooled client of the current tenant.
+    """
+    return get_okta_tenant().async_client
+
+async def async_post_for_access_code(code, state):
+    """
+    post request for access code after return from redirect authentication.
+    """
+    client = get_async_okta_client()
+    with timed('token'):
+        exchange_response = await client.post(**access_code_request(code))
+    exchange_response.raise_for_status()
+    exchange = exchange_response.json()
+    return exchange
+
+async def async_request_userinfo(access_token):
+    """
+    GET /userinfo with an access token.
+    """
+    client = get_async_okta_client()
+    with timed('userinfo'):
+        userinfo_response = await client.get(**userinfo_request(access_token))
+    userinfo_response.raise_for_status()
+    userinfo = userinfo_response.json()
+    return userinfo
+
+async def async_post_for_refresh(refresh_token):
+    """
+    Async `flask_okta.okta.post_for_refresh`.
+    """
+    client = get_async_okta_client()
+    with timed('refresh'):
+        refresh_response = await client.post(**refresh_request(refresh_token))
+    if refresh_response.status_code in (400, 401):
+        # invalid_grant, revoked or expired refresh token
+        return None
+    refresh_response.raise_for_status()
+    exchange = refresh_response.json()
+    return exchange
+
+async def async_refresh_tokens():
+    """
+    Async `flask_okta.okta.refresh_tokens`, sharing its in-flight refreshes
+    and recent responses.
+    """
+    refresh_token = okta_session.get('_okta_refresh_token')
+    if not refresh_token:
+        return None
+
+    okta = current_app.extensions['okta']
+    key = token_cache_key(refresh_token)
+
+    async def refresh():
+        exchange = okta.recent_refreshes.get(key)
+        if exchange is None:
+            exchange = await async_post_for_refresh(refresh_token)
+            if exchange is not None:
+                okta.recent_refreshes.set(key, exchange)
+        return exchange
+
+    exchange = await okta.refresh_flight.do_async(key, refresh)
+    return store_refresh(exchange)
+
+async def async_get_access_token():
+    """
+    Async `flask_okta.okta.get_access_token`, renewing through the async
+    client so a refresh does not block the event loop.
+    """
+    access_token = session_access_token()
+    if access_token and refresh_due():
+        access_token = await async_refresh_tokens() or access_token
+    return access_token
+
+async def async_exchange_for_userinfo(code, state):
+    """
+    Async `flask_okta.okta.exchange_for_userinfo`.
+    """
+    claim_pending_login(state)
+    exchange = await async_post_for_access_code(code, state)
+    access_token = store_exchange(exchange)
+
+    claims = id_token_userinfo()
+    if claims is not None:
+        store_claims(claims)
+        return claims
+
+    userinfo = await async_request_userinfo(access_token)
+    cache_userinfo(access_token, userinfo)
+    store_claims(userinfo)
+    return userinfo
+
+async def async_authenticated_userinfo():
+    """
+    Async `flask_okta.okta.authenticated_userinfo`.
+    """
+    access_token = await async_get_access_token()
+    if not access_token:
+        abort(401, 'Not authenticated with Okta.')
+    userinfo = get_userinfo_cache().get(token_cache_key(access_token))
+    if userinfo is None:
+        userinfo = await async_request_userinfo(access_token)
+        cache_userinfo(access_token, userinfo)
+    return userinfo
+
+async def call_after_authorization(func, userinfo):
+    """
+    Call an after_authorization callback, awaiting it if it is async.
+    """
+    with timed('after_authorization'):
+        response = func(userinfo)
+        if inspect.isawaitable(response):
+            response = await response
+    return response
@@ -0,0 +1,117 @@
+import time
+
+from functools import wraps
+
+from flask import abort
+from flask import current_app
+from flask import g
+from flask import request
+
+from .cache import token_cache_key
+from .jwks import jwt
+from .okta import get_jwks
+from .okta import get_okta_tenant
+
+def bearer_token():
+    """
+    Token from the request's `Authorization: Bearer` header, or None.
+    """
+    authorization = request.headers.get('Authorization', '')
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return token.strip()
+
+def verify_access_token(token):
+    """
+    Claims of an Okta access token verified locally against the cached
+    signing keys. Verified claims are cached by token hash until the token
+    expires, so repeat calls skip the signature check entirely. Raises
+    `jwt.InvalidTokenError` for invalid tokens.
+    """
+    okta = current_app.extensions['okta']
+    tenant = get_okta_tenant()
+    cache = okta.verified_tokens
+    # a token verified for one tenant says nothing about another
+    key = (tenant.name, token_cache_key(token))
+    claims = cache.get(key)
+    if claims is not None:
+        return claims
+
+    claims = get_jwks().decode(
+        token,
+        issuer = tenant.endpoints.issuer,
+        audience = tenant.audience,
+        leeway = current_app.config.get('OKTA_JWT_LEEWAY', 0),
+    )
+    cache.set(key, claims, claims['exp'] - time.time())
+    return claims
+
+def token_scopes(claims):
+    # Okta puts access token scopes in a list under scp
+    scopes = claims.get('scp', ())
+    if isinstance(scopes, str):
+        scopes = scopes.split()
+    return scopes
+
+def authenticate_bearer():
+    """
+    Verify the request's bearer token and return its claims, aborting 401 for
+    a missing or invalid token. Claims are also kept on
+    `g.okta_token_claims`.
+    """
+    token = bearer_token()
+    if token is None:
+        abort(401, 'Bearer token required.')
+    try:
+        claims = verify_access_token(token)
+    except jwt.InvalidTokenError as exc:
+        abort(401, f'Invalid bearer token. { exc }')
+    g.okta_token_claims = claims
+    return claims
+
+def token_required(func=None, scopes=()):
+    """
+    Decorate a view to require a valid Okta access token, and optionally
+    scopes, in the Authorization header.
+
+    :param scopes:
+        Scopes every token must have, 403 otherwise.
+    """
+    if func is None:
+        def decorator(func):
+            return token_required(func, scopes=scopes)
+        return decorator
+
+    required = frozenset(scopes)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        claims = authenticate_bearer()
+        if required and not required.issubset(token_scopes(claims)):
+            abort(403, 'Insufficient scope.')
+        return func(*args, **kwargs)
+
+    return wrapper
+
+def init_request_loader(login_manager, load_user):
+    """
+    Register a flask-login request loader authenticating bearer tokens.
+
+    :param load_user:
+        Callable receiving verified token claims and returning a user object
+        or None.
+    """
+    @login_manager.request_loader
+    def request_loader(request):
+        token = bearer_token()
+        if token is None:
+            return None
+        try:
+            claims = verify_access_token(token)
+        except jwt.InvalidTokenError:
+            return None
+        g.okta_token_claims = claims
+        return load_user(claims)
+
+    return request_loader
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+
+def token_cache_key(token):
+    """
+    Cache key for a bearer token. Tokens are never kept as keys themselves.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def seconds_until(expires_at, now=None):
+    """
+    Seconds remaining until a unix timestamp, never negative.
+    """
+    if now is None:
+        now = time.time()
+    return max(0, expires_at - now)
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe mapping with per-entry expiry and LRU eviction.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        """
+        :param maxsize:
+            Maximum number of entries. Least recently used entries are evicted
+            past this size.
+        :param ttl:
+            Default seconds an entry lives.
+        :param clock:
+            Monotonic time function.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value for ttl seconds, or the cache default. A ttl of zero or
+        less is not stored.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self.clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is None:
+            return default
+        return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Counters for monitoring.
+        """
+        return dict(
+            size = len(self._data),
+            maxsize = self.maxsize,
+            hits = self.hits,
+            misses = self.misses,
+            evictions = self.evictions,
+        )
+
+
+class _Call:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls by key. The first caller runs the function,
+    callers arriving while it runs wait and share its result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def _join(self, key):
+        # the call for key and whether this caller runs it
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                return call, True
+            self.shared += 1
+            return call, False
+
+    def _done(self, key, call):
+        with self._lock:
+            del self._calls[key]
+        call.event.set()
+
+    def do(self, key, func):
+        call, leader = self._join(key)
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            self._done(key, call)
+        return call.result
+
+    async def do_async(self, key, func):
+        """
+        `do` for a coroutine function, sharing calls with `do`. Waiting
+        callers wait in a thread, not blocking their event loop.
+        """
+        # loaded already, the caller runs in an event loop
+        import asyncio
+
+        call, leader = self._join(key)
+        if not leader:
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                call.event.wait,
+            )
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = await func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            self._done(key, call)
+        return call.result
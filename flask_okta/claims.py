@@ -0,0 +1,268 @@
+import os
+import threading
+import time
+
+from functools import wraps
+
+from flask import abort
+from flask import current_app
+from flask import g
+
+from .cache import TTLCache
+from .cache import token_cache_key
+from .okta import cache_userinfo
+from .okta import get_access_token
+from .okta import get_okta_client
+from .okta import get_okta_endpoints
+from .okta import get_okta_tenant
+from .okta import indexed_claims
+from .okta import store_claims
+from .okta import userinfo_request
+from .resilience import endpoint_name
+from .session import okta_session
+
+# claims captured at login for require_groups and require_claims
+DEFAULT_INDEXED_CLAIMS = ('groups',)
+
+# seconds before a session's claims are fetched again in the background
+DEFAULT_CLAIMS_REVALIDATE = 300
+
+# distinct value sets kept interned
+INTERN_MAXSIZE = 4096
+
+_interned = {}
+_interned_lock = threading.Lock()
+
+def intern_values(values):
+    """
+    Frozenset of values, shared by every session with the same values so
+    thousands of sessions in a handful of groups hold a handful of sets.
+    """
+    values = frozenset(values)
+    interned = _interned.get(values)
+    if interned is None:
+        with _interned_lock:
+            if len(_interned) >= INTERN_MAXSIZE:
+                _interned.clear()
+            interned = _interned.setdefault(values, values)
+    return interned
+
+def claims_index(indexed):
+    """
+    Mapping of claim name to interned frozenset of its values.
+    """
+    return {name: intern_values(values) for name, values in indexed.items()}
+
+
+class ClaimsRevalidator:
+    """
+    Fetch userinfo again off the request thread.
+
+    A session whose claims are older than interval keeps being served from
+    them while a worker thread asks Okta again. The result is picked up by
+    the session's next request, so group changes and revoked tokens take
+    effect within about interval seconds without blocking a request.
+    """
+
+    def __init__(self, interval=DEFAULT_CLAIMS_REVALIDATE, max_workers=2):
+        """
+        :param interval:
+            Seconds claims are used before being revalidated.
+        :param max_workers:
+            Threads fetching userinfo.
+        """
+        self.interval = interval
+        self.max_workers = max_workers
+        # results wait at most one interval for their session
+        self.results = TTLCache(ttl=interval)
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self._pid = None
+        self._executor = None
+        self.revalidated = 0
+        self.failed = 0
+
+    @property
+    def executor(self):
+        """
+        Thread pool for this process, created on first use and after a fork.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # imported here, apps without revalidation never pay for it
+                    from concurrent.futures import ThreadPoolExecutor
+
+                    # threads do not survive a fork, start a new pool
+                    self._executor = ThreadPoolExecutor(
+                        max_workers = self.max_workers,
+                        thread_name_prefix = 'okta-claims',
+                    )
+                    self._inflight = set()
+                    self._pid = pid
+        return self._executor
+
+    def submit(self, key, fetch):
+        """
+        Run fetch in the background unless key is already being fetched.
+        """
+        executor = self.executor
+        with self._lock:
+            if key in self._inflight:
+                return
+            self._inflight.add(key)
+        executor.submit(self._run, key, fetch)
+
+    def _run(self, key, fetch):
+        try:
+            result = fetch()
+        except Exception:
+            # keep serving the current claims, retried on a later request
+            self.failed += 1
+        else:
+            self.results.set(key, result)
+            self.revalidated += 1
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def pop(self, key):
+        """
+        Fetched userinfo for key, None when there is none yet.
+        """
+        return self.results.pop(key)
+
+    def stats(self):
+        return dict(
+            interval = self.interval,
+            inflight = len(self._inflight),
+            revalidated = self.revalidated,
+            failed = self.failed,
+        )
+
+
+def fetch_userinfo(client, request_kwargs):
+    """
+    Function fetching userinfo without a request context. Userinfo is empty
+    once Okta no longer accepts the access token.
+    """
+    def fetch():
+        response = client.get(**request_kwargs)
+        if response.status_code == 401:
+            return {}
+        response.raise_for_status()
+        return response.json()
+    return fetch
+
+def revalidate_claims(access_token):
+    """
+    Use claims fetched in the background, or start fetching them, when the
+    session's claims are older than the revalidation interval.
+    """
+    revalidator = current_app.extensions['okta'].claims_revalidator
+    if revalidator is None:
+        return
+    checked_at = okta_session.get('_okta_claims_at', 0)
+    if time.time() - checked_at < revalidator.interval:
+        return
+    key = token_cache_key(access_token)
+    userinfo = revalidator.pop(key)
+    if userinfo is not None:
+        store_claims(userinfo)
+        if userinfo:
+            cache_userinfo(access_token, userinfo)
+        return
+    throttle = get_okta_tenant().throttle
+    if throttle is not None and throttle.should_defer(
+        endpoint_name(get_okta_endpoints().userinfo)
+    ):
+        # logins come first while the userinfo rate limit runs low, the
+        # current claims stay in use
+        return
+    revalidator.submit(
+        key,
+        fetch_userinfo(get_okta_client(), userinfo_request(access_token)),
+    )
+
+def get_claims_index():
+    """
+    Claims index of the current request, once per request. From the verified
+    bearer token when the request has one, else from the session's claims
+    captured at login. Aborts 401 when not authenticated.
+    """
+    index = g.get('_okta_claims_index')
+    if index is not None:
+        return index
+    token_claims = g.get('okta_token_claims')
+    if token_claims is not None:
+        indexed = indexed_claims(
+            token_claims,
+            current_app.config['OKTA_INDEXED_CLAIMS'],
+        )
+    else:
+        access_token = get_access_token()
+        if not access_token or '_okta_claims' not in okta_session:
+            abort(401, 'Not authenticated with Okta.')
+        revalidate_claims(access_token)
+        indexed = okta_session['_okta_claims']
+    index = g._okta_claims_index = claims_index(indexed)
+    return index
+
+def claim_values(index, name):
+    """
+    Values of an indexed claim. Raises RuntimeError for claims not listed in
+    OKTA_INDEXED_CLAIMS, they are never captured.
+    """
+    values = index.get(name)
+    if values is None:
+        raise RuntimeError(f'Claim { name!r} is not in OKTA_INDEXED_CLAIMS.')
+    return values
+
+def require_groups(*groups, any_of=False):
+    """
+    Decorate a view to require membership of groups, from the groups claim.
+
+    :param any_of:
+        Membership of one of the groups is enough.
+    """
+    required = intern_values(groups)
+
+    def decorator(func):
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            member_of = claim_values(get_claims_index(), 'groups')
+            if any_of:
+                allowed = not required.isdisjoint(member_of)
+            else:
+                allowed = required <= member_of
+            if not allowed:
+                abort(403, 'Insufficient group membership.')
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def require_claims(**claims):
+    """
+    Decorate a view to require claim values, a value given for each claim
+    must be among the user's values of the claim, for example
+    `require_claims(department='Engineering', email_verified=True)`.
+    """
+    required = tuple(claims.items())
+
+    def decorator(func):
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            index = get_claims_index()
+            for name, value in required:
+                if value not in claim_values(index, name):
+                    abort(403, 'Insufficient claims.')
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+
+from .resilience import DEFAULT_BACKOFF
+from .resilience import DEFAULT_BACKOFF_MAX
+from .resilience import DEFAULT_BREAKER_RESET
+from .resilience import DEFAULT_BREAKER_THRESHOLD
+from .resilience import DEFAULT_CONNECT_TIMEOUT
+from .resilience import DEFAULT_READ_TIMEOUT
+from .resilience import DEFAULT_RETRIES
+from .resilience import Breakers
+from .resilience import RequestAttempts
+
+# number of distinct hosts to keep pools for, normally just the Okta org
+DEFAULT_POOL_CONNECTIONS = 4
+
+# connections kept open per host
+DEFAULT_POOL_MAXSIZE = 16
+
+class OktaClient:
+    """
+    Pooled, keep-alive HTTP client for back-channel requests to Okta.
+
+    One `requests.Session` is kept per process so the TCP and TLS handshake to
+    the Okta org is paid once per pooled connection instead of once per
+    request. The session is created lazily and recreated when the process id
+    changes, so a client built before gunicorn forks its workers never shares
+    sockets with them.
+
+    Every request has connect and read timeouts. Idempotent requests are
+    retried with jittered exponential backoff on connection errors, timeouts
+    and 5xx responses. Each endpoint has a circuit breaker failing requests
+    fast with `OktaUnavailable`, a 503, while Okta keeps failing.
+    """
+
+    def __init__(
+        self,
+        pool_connections = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize = DEFAULT_POOL_MAXSIZE,
+        keep_alive = True,
+        observer = None,
+        connect_timeout = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout = DEFAULT_READ_TIMEOUT,
+        retries = DEFAULT_RETRIES,
+        backoff = DEFAULT_BACKOFF,
+        backoff_max = DEFAULT_BACKOFF_MAX,
+        breaker_threshold = DEFAULT_BREAKER_THRESHOLD,
+        breaker_reset = DEFAULT_BREAKER_RESET,
+        transport = None,
+        throttle = None,
+    ):
+        """
+        :param pool_connections:
+            Number of per-host connection pools to cache.
+        :param pool_maxsize:
+            Maximum connections kept open to each host.
+        :param keep_alive:
+            Reuse connections between requests. False sends
+            `Connection: close` and behaves like module-level `requests`.
+        :param observer:
+            Optional callable receiving method, url, status, duration and
+            body size in bytes of every request. Status and size are None
+            when no response was received.
+        :param connect_timeout:
+            Seconds to wait for a connection to Okta.
+        :param read_timeout:
+            Seconds to wait between bytes of a response.
+        :param retries:
+            Retries of idempotent requests after the first attempt.
+        :param backoff:
+            Seconds the backoff before the first retry is jittered under,
+            doubled for each further retry up to backoff_max.
+        :param breaker_threshold:
+            Consecutive failures of an endpoint opening its circuit.
+        :param breaker_reset:
+            Seconds an open circuit fails fast before a trial request.
+        :param transport:
+            Stand-in for the network whose `requests_adapter()` serves every
+            request, see `flask_okta.testing.FakeOkta`.
+        :param throttle:
+            `flask_okta.throttle.OktaThrottle` pacing requests by Okta's
+            rate limit headers, may be shared with other clients of the org.
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.observer = observer
+        self.transport = transport
+        self.throttle = throttle
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breakers = Breakers(
+            threshold = breaker_threshold,
+            reset_timeout = breaker_reset,
+        )
+        self.retried = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+
+    def _create_session(self):
+        # imported on first use, requests is the bulk of this package's
+        # import time and unused by processes never calling Okta
+        import requests
+
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        if self.transport is not None:
+            adapter = self.transport.requests_adapter()
+            # no proxies or netrc in process, and no environment scan per
+            # request
+            session.trust_env = False
+        else:
+            adapter = HTTPAdapter(
+                pool_connections = self.pool_connections,
+                pool_maxsize = self.pool_maxsize,
+            )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    @property
+    def session(self):
+        """
+        Session for this process, created on first use and after a fork.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # NOTE
+                    # - a session inherited from the parent is dropped, not
+                    #   closed, closing it here would disturb the parent's
+                    #   sockets.
+                    self._session = self._create_session()
+                    self._pid = pid
+        return self._session
+
+    def _send(self, method, url, **kwargs):
+        start = time.perf_counter()
+        status = None
+        size = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status = response.status_code
+            # the body is already read, requests to Okta are not streamed
+            size = len(response.content)
+        finally:
+            if self.observer is not None:
+                self.observer(
+                    method,
+                    url,
+                    status,
+                    time.perf_counter() - start,
+                    size,
+                )
+        return response
+
+    def _send_within_rate_limit(self, method, url, endpoint, **kwargs):
+        response = self._send(method, url, **kwargs)
+        throttle = self.throttle
+        if throttle is None:
+            return response
+        wait = throttle.resend_after(
+            endpoint,
+            response.headers,
+            response.status_code,
+        )
+        if wait is not None:
+            response.close()
+            time.sleep(wait)
+            response = self._send(method, url, **kwargs)
+            throttle.update(endpoint, response.headers, response.status_code)
+        return response
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request to Okta through the pooled session, retrying
+        idempotent requests. Raises `OktaUnavailable` when the endpoint's
+        circuit is open or Okta could not be reached, `OktaRateLimited` when
+        its rate limit is spent for longer than the throttle waits.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempts = RequestAttempts(self, method, url)
+        for wait in attempts:
+            if wait:
+                time.sleep(wait)
+            try:
+                response = self._send_within_rate_limit(
+                    method,
+                    url,
+                    attempts.endpoint,
+                    **kwargs,
+                )
+            except OSError as exc:
+                # requests' connection errors and timeouts are OSErrors
+                attempts.unreachable(exc)
+                continue
+            except Exception:
+                attempts.failed()
+                raise
+            if attempts.finished(response.status_code):
+                return response
+            response.close()
+
+    def stats(self):
+        """
+        Retries sent and circuit breaker state by endpoint.
+        """
+        return dict(
+            retries = self.retried,
+            breakers = self.breakers.stats(),
+        )
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """
+        Close pooled connections owned by this process.
+        """
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._session.close()
+            self._session = None
+            self._pid = None
@@ -1,5 +1,6 @@
 from flask import current_app
 from flask import redirect
+from flask import request
 from flask import url_for
 from flask_login import LoginManager
 from flask_login import UserMixin
@@ -8,16 +9,52 @@ from flask_login import login_user
 from flask_login import logout_user
 
 from .extension import OktaManager
+from .okta import get_next_url
+from .snapshot import DEFAULT_SNAPSHOT_TTL
+from .snapshot import UserSnapshots
+from .users import memory_user_store
+from .wrappers import DEFAULT_PUBLIC_ENDPOINTS
+from .wrappers import LoginPolicy
 from .wrappers import wrap_app_login_required
 
 # normally endpoints are named with words but dash
 # names them the same as the path
 DASH_ROOT_ENDPOINT = '/'
-USERS = {}
+
+# dash endpoints served without login, relative to routes_pathname_prefix
+DASH_PUBLIC_PATHS = ('_dash-component-suites/', '_favicon.ico')
+
+# dash callback endpoints that may rebuild the user from a session snapshot,
+# relative to routes_pathname_prefix
+DASH_SNAPSHOT_PATHS = (
+    '_dash-update-component',
+    '_dash-layout',
+    '_dash-dependencies',
+)
+
+# default user registry, bounded and thread-safe, per process
+USERS = memory_user_store()
+
+def dash_login_policy(dash_app):
+    """
+    Login policy for a Dash app. Component bundles, the favicon, assets and
+    static files are public and skip the session; layout, dependencies and
+    callbacks require login.
+    """
+    config = dash_app.config
+    prefix = config.routes_pathname_prefix
+    assets_path = config.assets_url_path.strip('/')
+    return LoginPolicy(
+        public_endpoints = DEFAULT_PUBLIC_ENDPOINTS + ('post_okta_logout',),
+        public_prefixes = tuple(
+            prefix + path for path in DASH_PUBLIC_PATHS
+        ) + (f'{ prefix }{ assets_path }/',),
+    )
+
 
 class User(UserMixin):
     """
-    Simple dictionary-backed user model.
+    Simple user model built from stored userinfo claims.
     """
 
     def __init__(self, id, email, name):
@@ -25,9 +62,17 @@ class User(UserMixin):
         self.email = email
         self.name = name
 
-    @staticmethod
-    def get(user_id):
-        return USERS.get(user_id)
+    @classmethod
+    def from_claims(cls, claims):
+        return cls(claims['sub'], claims.get('email'), claims.get('name'))
+
+    @classmethod
+    def get(cls, user_id, user_store=None):
+        if user_store is None:
+            user_store = USERS
+        claims = user_store.get(user_id)
+        if claims is not None:
+            return cls.from_claims(claims)
 
 
 def init_dash_for_okta(
@@ -35,6 +80,9 @@ def init_dash_for_okta(
     login_manager = None,
     login_view = None,
     user_class = None,
+    user_store = None,
+    login_policy = None,
+    user_snapshot = None,
 ):
     """
     :param dash_app:
@@ -45,7 +93,22 @@ def init_dash_for_okta(
         Defaults to Flask-Okta builtin blueprint view,
         `redirect_for_okta_login`.
     :param user_class:
-        Defaults to `flask_okta.dash.User` class.
+        Defaults to `flask_okta.dash.User` class. A class with a
+        `from_claims(claims)` classmethod is built from the claims kept in
+        user_store. Otherwise users are loaded with `user_class.get(user_id)`,
+        returning None for unknown users, and a user missing after login is
+        created with `user_class(user_id, email, name)`. User snapshots need
+        `from_claims`.
+    :param user_store:
+        `flask_okta.users.UserStore` users are registered in. Defaults to
+        `flask_okta.dash.USERS`, in memory for this process.
+    :param login_policy:
+        `flask_okta.wrappers.LoginPolicy` deciding which requests require
+        login. Defaults to `dash_login_policy`.
+    :param user_snapshot:
+        Rebuild the user on Dash callbacks from a signed snapshot in the
+        session instead of loading it from user_store. Defaults to
+        OKTA_USER_SNAPSHOT in config.
     """
     if login_view is None:
         # flask-okta built in view function endpoint
@@ -54,39 +117,87 @@ def init_dash_for_okta(
     if user_class is None:
         user_class = User
 
+    if user_store is None:
+        user_store = USERS
+
     if login_manager is None:
         login_manager = LoginManager(dash_app.server)
 
     if login_manager.login_view is None:
         login_manager.login_view = login_view
 
+    config = dash_app.server.config
+    if user_snapshot is None:
+        user_snapshot = config.setdefault('OKTA_USER_SNAPSHOT', False)
+    from_claims = getattr(user_class, 'from_claims', None)
+    snapshots = None
+    if user_snapshot and from_claims is not None:
+        snapshots = UserSnapshots(
+            user_store,
+            max_age = config.setdefault(
+                'OKTA_USER_SNAPSHOT_TTL',
+                DEFAULT_SNAPSHOT_TTL,
+            ),
+        )
+        prefix = dash_app.config.routes_pathname_prefix
+        snapshot_paths = frozenset(
+            prefix + path for path in DASH_SNAPSHOT_PATHS
+        )
+
     @login_manager.user_loader
     def user_loader(user_id):
         # required for flask-login
-        # user objects normally comes from a database of some kind
-        return user_class.get(user_id)
-
-    # wrap before adding blueprint routes
-    wrap_app_login_required(dash_app.server)
+        if from_claims is None:
+            # user objects normally comes from a database of some kind
+            return user_class.get(user_id)
+        if snapshots is not None and request.path in snapshot_paths:
+            # a page makes many callbacks, skip the user store for them
+            claims = snapshots.load(user_id)
+            if claims is not None:
+                return from_claims(claims)
+        claims = user_store.get(user_id)
+        if claims is not None:
+            if snapshots is not None:
+                snapshots.save(user_id, claims)
+            return from_claims(claims)
+
+    if login_policy is None:
+        login_policy = dash_login_policy(dash_app)
+
+    # one before_request gate, covers routes added later too
+    wrap_app_login_required(dash_app.server, login_policy)
 
     # Flask-Okta extension, flask app instance required here and enforced by
     # this function's arguments.
     okta = OktaManager(dash_app.server)
+    if okta.metrics is not None:
+        okta.metrics.add_gauge('login_gate', login_policy.stats)
+        if snapshots is not None:
+            okta.metrics.add_gauge('user_snapshot', snapshots.stats)
 
     @okta.after_authorization
     def after_authorization(userinfo):
         """
         View function decorated to respond after Okta authenticated.
         """
+        # register or update the user with some of the user info from Okta
         user_id = userinfo['sub']
-        user = user_class.get(user_id)
-        if not user:
-            # create user taking some of the user info data from Okta
-            user = user_class(user_id, userinfo['email'], userinfo['name'])
-            # update "database"
-            USERS[user_id] = user
+        claims = user_store.set(user_id, userinfo)
+        if from_claims is not None:
+            if snapshots is not None:
+                snapshots.save(user_id, claims)
+            user = from_claims(claims)
+        else:
+            user = user_class.get(user_id)
+            if user is None:
+                user = user_class(
+                    user_id,
+                    userinfo.get('email'),
+                    userinfo.get('name'),
+                )
         login_user(user)
-        return redirect(url_for(DASH_ROOT_ENDPOINT))
+        # back to the page that sent the user to login
+        return redirect(get_next_url() or url_for(DASH_ROOT_ENDPOINT))
 
     @dash_app.server.route('/okta-logout')
     @login_required
@@ -96,6 +207,8 @@ def init_dash_for_okta(
         """
         # logout our user object with flask-login
         logout_user()
+        if snapshots is not None:
+            snapshots.clear()
         # logout of Okta
         # post_logout_redirect_uri must also be configured in Okta to work
         post_logout_redirect_url = url_for(
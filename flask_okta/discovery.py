@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import re
+import time
+
+from dataclasses import dataclass
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+WELL_KNOWN_PATH = '/.well-known/openid-configuration'
+
+# used when the discovery response has no Cache-Control max-age
+DEFAULT_MAX_AGE = 3600
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+# config key for hand configured endpoint, discovery document key
+ENDPOINT_SOURCES = dict(
+    authorization = ('OKTA_AUTH_URI', 'authorization_endpoint'),
+    token = ('OKTA_TOKEN_URI', 'token_endpoint'),
+    userinfo = ('OKTA_USERINFO_URI', 'userinfo_endpoint'),
+    end_session = ('OKTA_LOGOUT_URI', 'end_session_endpoint'),
+    jwks = ('OKTA_JWKS_URI', 'jwks_uri'),
+    introspection = (
+        'OKTA_TOKEN_INTROSPECTION_URI',
+        'introspection_endpoint',
+    ),
+    revocation = ('OKTA_TOKEN_REVOCATION_URI', 'revocation_endpoint'),
+)
+
+@dataclass(frozen=True)
+class OktaEndpoints:
+    """
+    Endpoint URIs resolved once at `init_app`.
+    """
+    issuer: str = None
+    authorization: str = None
+    token: str = None
+    userinfo: str = None
+    end_session: str = None
+    jwks: str = None
+    introspection: str = None
+    revocation: str = None
+
+
+def resolve_endpoints(config, metadata=None):
+    """
+    Endpoints from configuration, falling back to discovery metadata. Hand
+    configured URIs win so a single endpoint can be overridden.
+
+    :param config:
+        Flask config mapping.
+    :param metadata:
+        Optional discovery document mapping.
+    """
+    if metadata is None:
+        metadata = {}
+    issuer = config.get('OKTA_ISSUER') or metadata.get('issuer')
+    endpoints = {}
+    for name, (config_key, metadata_key) in ENDPOINT_SOURCES.items():
+        endpoints[name] = config.get(config_key) or metadata.get(metadata_key)
+    if not endpoints['jwks'] and issuer:
+        # Okta custom authorization server convention
+        endpoints['jwks'] = f'{ issuer }/v1/keys'
+    return OktaEndpoints(issuer=issuer, **endpoints)
+
+def parse_max_age(cache_control, default=DEFAULT_MAX_AGE):
+    if cache_control and 'no-cache' not in cache_control:
+        match = MAX_AGE_RE.search(cache_control)
+        if match:
+            return int(match.group(1))
+    return default
+
+def read_cache_file(path):
+    try:
+        with open(path) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+def write_cache_file(path, cached):
+    """
+    Atomically replace the cache file so concurrent workers never read a
+    partial document.
+    """
+    directory = os.path.dirname(path)
+    try:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{ path }.{ os.getpid() }.tmp'
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(cached, cache_file)
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning('Unable to write discovery cache %s.', path)
+
+def check_issuer(document, issuer):
+    if document.get('issuer') != issuer:
+        raise RuntimeError(
+            f'Discovery issuer { document.get("issuer")!r} does not match'
+            f' OKTA_ISSUER { issuer!r}.'
+        )
+
+def fetch_provider_metadata(client, issuer, default_max_age=DEFAULT_MAX_AGE):
+    """
+    GET the discovery document for issuer. Returns it with the seconds it
+    is fresh for.
+    """
+    response = client.get(issuer.rstrip('/') + WELL_KNOWN_PATH)
+    response.raise_for_status()
+    document = response.json()
+    check_issuer(document, issuer)
+    max_age = parse_max_age(
+        response.headers.get('Cache-Control'),
+        default_max_age,
+    )
+    return document, max_age
+
+def load_provider_metadata(
+    client,
+    issuer,
+    cache_path = None,
+    default_max_age = DEFAULT_MAX_AGE,
+    shared_cache = None,
+):
+    """
+    OpenID Connect discovery document for issuer, read-only.
+
+    A fresh cache file is used without touching the network. A stale one is
+    revalidated with its ETag and used as is if Okta cannot be reached. A
+    shared cache replaces the file, and one worker fetches for all.
+
+    :param client:
+        OktaClient for the request.
+    :param issuer:
+        Authorization server issuer URI.
+    :param cache_path:
+        Optional path of the on-disk cache file.
+    :param default_max_age:
+        Seconds a document is fresh when the response does not say.
+    :param shared_cache:
+        Optional `flask_okta.shared.SharedCache` used instead of cache_path.
+    """
+    if shared_cache is not None:
+        document = shared_cache.get_or_fill(
+            f'discovery:{ issuer }',
+            lambda: fetch_provider_metadata(client, issuer, default_max_age),
+        )
+        return MappingProxyType(document)
+
+    cached = read_cache_file(cache_path) if cache_path else None
+    if cached and cached.get('issuer') != issuer:
+        cached = None
+
+    now = time.time()
+    if cached and cached['expires_at'] > now:
+        return MappingProxyType(cached['document'])
+
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+
+    url = issuer.rstrip('/') + WELL_KNOWN_PATH
+    try:
+        response = client.get(url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+    except Exception:
+        if cached:
+            logger.warning('Using stale discovery document for %s.', issuer)
+            return MappingProxyType(cached['document'])
+        raise
+
+    max_age = parse_max_age(
+        response.headers.get('Cache-Control'),
+        default_max_age,
+    )
+    if response.status_code == 304:
+        document = cached['document']
+        etag = cached.get('etag')
+    else:
+        document = response.json()
+        etag = response.headers.get('ETag')
+        check_issuer(document, issuer)
+
+    if cache_path:
+        write_cache_file(cache_path, dict(
+            issuer = issuer,
+            etag = etag,
+            expires_at = now + max_age,
+            document = document,
+        ))
+    return MappingProxyType(document)
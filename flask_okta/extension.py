@@ -1,5 +1,64 @@
+import os
+
+from .aio import async_authenticated_userinfo
+from .aio import async_get_access_token
+from .aio import require_httpx
+from .bearer import init_request_loader
+from .bearer import token_required
+from .cache import SingleFlight
+from .cache import TTLCache
+from .claims import DEFAULT_CLAIMS_REVALIDATE
+from .claims import DEFAULT_INDEXED_CLAIMS
+from .claims import ClaimsRevalidator
+from .claims import require_claims
+from .claims import require_groups
+from .client import DEFAULT_POOL_CONNECTIONS
+from .client import DEFAULT_POOL_MAXSIZE
+from .metrics import Metrics
+from .metrics import TimedSessionInterface
 from .okta import authenticated_userinfo
+from .okta import get_access_token
+from .okta import invalidate_userinfo
 from .okta import prepare_for_logout_redirect
+from .pending import DEFAULT_PENDING_PER_SESSION
+from .pending import DEFAULT_PENDING_TTL
+from .pending import PendingLogins
+from .resilience import CLOSED
+from .resilience import DEFAULT_BACKOFF
+from .resilience import DEFAULT_BACKOFF_MAX
+from .resilience import DEFAULT_BREAKER_RESET
+from .resilience import DEFAULT_BREAKER_THRESHOLD
+from .resilience import DEFAULT_CONNECT_TIMEOUT
+from .resilience import DEFAULT_READ_TIMEOUT
+from .resilience import DEFAULT_RETRIES
+from .ratelimit import DEFAULT_IP_BURST
+from .ratelimit import DEFAULT_IP_RATE
+from .ratelimit import DEFAULT_SESSION_BURST
+from .ratelimit import DEFAULT_SESSION_RATE
+from .ratelimit import LoginRateLimiter
+from .ratelimit import create_buckets
+from .resilience import endpoint_name
+from .revocation import DEFAULT_REVOCATION_QUEUE_SIZE
+from .revocation import DEFAULT_REVOCATION_RETRIES
+from .revocation import DEFAULT_REVOCATION_WORKERS
+from .revocation import RevocationQueue
+from .revocation import pop_session_tokens
+from .revocation import revoke_session_tokens
+from .session import end_okta_session
+from .settings import DEFAULT_SCOPE
+from .signals import okta_response
+from .signals import phase_timed
+from .shared import DEFAULT_FILL_TIMEOUT
+from .shared import SharedCache
+from .store import create_store
+from .tenants import DEFAULT_MAX_TENANTS
+from .tenants import DEFAULT_TENANT_IDLE_TTL
+from .tenants import TENANT_RESOLVERS
+from .tenants import TenantRegistry
+from .tenants import create_tenant
+from .trace import DEFAULT_TRACE_SIZE
+from .trace import FlowTracer
+from .view import DEFAULT_BLUEPRINT_NAME
 from .view import create_okta_blueprint
 from .wrappers import wrap_app_login_required
 from .wrappers import wrap_view_functions
@@ -15,6 +74,25 @@ class OktaManager:
         after_authorization = None,
     ):
         self._after_authorization = after_authorization
+        self.client = None
+        self.async_client = None
+        self.userinfo_cache = None
+        self.token_store = None
+        self.pending_logins = None
+        self.refresh_flight = None
+        self.recent_refreshes = None
+        self.jwks = None
+        self.verified_tokens = None
+        self.metadata = None
+        self.endpoints = None
+        self.metrics = None
+        self.tenant = None
+        self.tenants = None
+        self.tracer = None
+        self.claims_revalidator = None
+        self.revocations = None
+        self.rate_limiter = None
+        self.shared_cache = None
         if app is not None:
             self.init_app(app)
 
@@ -47,7 +125,7 @@ class OktaManager:
 
         blueprint_name = app.config.setdefault(
             'OKTA_BLUEPRINT_NAME',
-            'okta'
+            DEFAULT_BLUEPRINT_NAME,
         )
 
         blueprint_url_prefix = app.config.setdefault(
@@ -67,22 +145,383 @@ class OktaManager:
 
         self.post_logout_redirect_rule = okta_post_logout_redirect_rule
 
+        # in-process histograms and counters for the flow
+        if app.config.setdefault('OKTA_METRICS', False):
+            self.metrics = Metrics()
+            app.session_interface = TimedSessionInterface(
+                app.session_interface
+            )
+        app.config.setdefault('OKTA_METRICS_ENDPOINT', False)
+        app.config.setdefault('OKTA_METRICS_PATH', '/okta/metrics')
+        app.config.setdefault('OKTA_SERVER_TIMING', False)
+
+        # recent login attempts for the debugging timeline
+        trace_size = app.config.setdefault(
+            'OKTA_TRACE_SIZE',
+            DEFAULT_TRACE_SIZE,
+        )
+        if app.config.get('OKTA_DEBUG') and trace_size:
+            self.tracer = FlowTracer(maxsize=trace_size)
+            phase_timed.connect(self.tracer.on_phase, sender=app)
+            okta_response.connect(self.tracer.on_okta_response, sender=self)
+
+        # pooled keep-alive session for every back-channel request to Okta
+        app.config.setdefault(
+            'OKTA_POOL_CONNECTIONS',
+            DEFAULT_POOL_CONNECTIONS,
+        )
+        app.config.setdefault('OKTA_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE)
+        app.config.setdefault('OKTA_KEEP_ALIVE', True)
+
+        # no call to Okta may hold a worker indefinitely, idempotent calls
+        # are retried and failing endpoints fail fast
+        app.config.setdefault('OKTA_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)
+        app.config.setdefault('OKTA_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)
+        app.config.setdefault('OKTA_RETRIES', DEFAULT_RETRIES)
+        app.config.setdefault('OKTA_RETRY_BACKOFF', DEFAULT_BACKOFF)
+        app.config.setdefault('OKTA_RETRY_BACKOFF_MAX', DEFAULT_BACKOFF_MAX)
+        app.config.setdefault(
+            'OKTA_BREAKER_THRESHOLD',
+            DEFAULT_BREAKER_THRESHOLD,
+        )
+        app.config.setdefault('OKTA_BREAKER_RESET', DEFAULT_BREAKER_RESET)
+        app.config.setdefault('OKTA_HEALTH_ENDPOINT', False)
+        app.config.setdefault('OKTA_HEALTH_PATH', '/okta/health')
+
+        # async views await Okta through a pool shared per event loop
+        use_async = app.config.setdefault('OKTA_ASYNC', False)
+        if use_async:
+            require_httpx()
+
+        # discovery, signing keys and userinfo shared by the workers on a
+        # host, each entry fetched by one worker at a time
+        shared_store = create_store(
+            app.config.setdefault('OKTA_SHARED_CACHE', None),
+            path = app.config.setdefault(
+                'OKTA_SHARED_CACHE_PATH',
+                os.path.join(app.instance_path, 'okta-cache.sqlite3'),
+            ),
+            table = 'okta_cache',
+        )
+        fill_timeout = app.config.setdefault(
+            'OKTA_SHARED_CACHE_FILL_TIMEOUT',
+            DEFAULT_FILL_TIMEOUT,
+        )
+        if shared_store is not None:
+            self.shared_cache = SharedCache(
+                shared_store,
+                prefix = 'metadata:',
+                fill_timeout = fill_timeout,
+            )
+
+        # userinfo by access token hash, entries never outlive the token
+        userinfo_cache_size = app.config.setdefault(
+            'OKTA_USERINFO_CACHE_SIZE',
+            1024,
+        )
+        userinfo_cache_ttl = app.config.setdefault(
+            'OKTA_USERINFO_CACHE_TTL',
+            300,
+        )
+        if shared_store is None or userinfo_cache_size <= 0:
+            self.userinfo_cache = TTLCache(
+                maxsize = userinfo_cache_size,
+                ttl = userinfo_cache_ttl,
+            )
+        else:
+            self.userinfo_cache = SharedCache(
+                shared_store,
+                prefix = 'userinfo:',
+                ttl = userinfo_cache_ttl,
+                # never served past the access token's expiry
+                stale_ttl = 0,
+                fill_timeout = fill_timeout,
+            )
+
+        # offline_access in scope to get refresh tokens
+        app.config.setdefault('OKTA_SCOPE', DEFAULT_SCOPE)
+        app.config.setdefault('OKTA_REFRESH_LEEWAY', 60)
+        app.config.setdefault('OKTA_REFRESH_PROACTIVE', False)
+        # one in-flight refresh per refresh token, and its response kept
+        # briefly for requests still carrying the old token
+        self.refresh_flight = SingleFlight()
+        self.recent_refreshes = TTLCache(maxsize=1024, ttl=30)
+
+        # tokens revoked on logout by background workers, logout never
+        # waits on Okta
+        if app.config.setdefault('OKTA_REVOKE_ON_LOGOUT', False):
+            self.revocations = RevocationQueue(
+                maxsize = app.config.setdefault(
+                    'OKTA_REVOCATION_QUEUE_SIZE',
+                    DEFAULT_REVOCATION_QUEUE_SIZE,
+                ),
+                workers = app.config.setdefault(
+                    'OKTA_REVOCATION_WORKERS',
+                    DEFAULT_REVOCATION_WORKERS,
+                ),
+                retries = app.config.setdefault(
+                    'OKTA_REVOCATION_RETRIES',
+                    DEFAULT_REVOCATION_RETRIES,
+                ),
+            )
+
+        # claims captured at login for group and claim checks, refreshed
+        # from /userinfo in the background
+        app.config.setdefault('OKTA_INDEXED_CLAIMS', DEFAULT_INDEXED_CLAIMS)
+        claims_revalidate = app.config.setdefault(
+            'OKTA_CLAIMS_REVALIDATE',
+            DEFAULT_CLAIMS_REVALIDATE,
+        )
+        if claims_revalidate:
+            self.claims_revalidator = ClaimsRevalidator(claims_revalidate)
+
+        # tokens and login state server-side, only a handle in the cookie
+        app.config.setdefault('OKTA_TOKEN_STORE_TTL', 86400)
+        self.token_store = create_store(
+            app.config.setdefault('OKTA_TOKEN_STORE', None),
+            path = app.config.setdefault(
+                'OKTA_TOKEN_STORE_PATH',
+                os.path.join(app.instance_path, 'okta-tokens.sqlite3'),
+            ),
+            table = 'okta_tokens',
+            maxsize = app.config.setdefault('OKTA_TOKEN_STORE_SIZE', 10000),
+        )
+
+        # logins in flight by state, several per session for multiple tabs
+        self.pending_logins = PendingLogins(
+            store = create_store(
+                app.config.setdefault('OKTA_PENDING_LOGIN_STORE', None),
+                path = app.config['OKTA_TOKEN_STORE_PATH'],
+                table = 'okta_pending_logins',
+                maxsize = app.config.setdefault(
+                    'OKTA_PENDING_LOGIN_STORE_SIZE',
+                    10000,
+                ),
+            ),
+            ttl = app.config.setdefault(
+                'OKTA_PENDING_LOGIN_TTL',
+                DEFAULT_PENDING_TTL,
+            ),
+            per_session = app.config.setdefault(
+                'OKTA_PENDING_LOGINS_PER_SESSION',
+                DEFAULT_PENDING_PER_SESSION,
+            ),
+        )
+
+        # login and callback requests limited by client IP and session, so
+        # no client can spend the org's rate limit at Okta
+        rate_limit_buckets = create_buckets(
+            app.config.setdefault('OKTA_RATE_LIMIT', None),
+            path = app.config.setdefault(
+                'OKTA_RATE_LIMIT_PATH',
+                app.config['OKTA_TOKEN_STORE_PATH'],
+            ),
+            maxsize = app.config.setdefault('OKTA_RATE_LIMIT_SIZE', 10000),
+        )
+        if rate_limit_buckets is not None:
+            self.rate_limiter = LoginRateLimiter(
+                rate_limit_buckets,
+                ip_rate = app.config.setdefault(
+                    'OKTA_RATE_LIMIT_IP_RATE',
+                    DEFAULT_IP_RATE,
+                ),
+                ip_burst = app.config.setdefault(
+                    'OKTA_RATE_LIMIT_IP_BURST',
+                    DEFAULT_IP_BURST,
+                ),
+                session_rate = app.config.setdefault(
+                    'OKTA_RATE_LIMIT_SESSION_RATE',
+                    DEFAULT_SESSION_RATE,
+                ),
+                session_burst = app.config.setdefault(
+                    'OKTA_RATE_LIMIT_SESSION_BURST',
+                    DEFAULT_SESSION_BURST,
+                ),
+            )
+
+        # OpenID Connect discovery, once per process and cached on disk so a
+        # restarted worker does not wait on Okta
+        app.config.setdefault('OKTA_DISCOVERY', True)
+        app.config.setdefault(
+            'OKTA_DISCOVERY_CACHE',
+            os.path.join(app.instance_path, 'okta-discovery.json'),
+        )
+        app.config.setdefault('OKTA_AUDIENCE', 'api://default')
+
+        tenants = app.config.setdefault('OKTA_TENANTS', None)
+        resolver = app.config.setdefault('OKTA_TENANT_FROM', 'host')
+        if tenants is None:
+            # credentials, endpoints, signing keys and pools of the one org
+            self.tenant = create_tenant(
+                None,
+                app.config,
+                observer = self._observe_response,
+                discovery_cache = app.config['OKTA_DISCOVERY_CACHE'],
+                shared_cache = self.shared_cache,
+            )
+            self.client = self.tenant.client
+            self.async_client = self.tenant.async_client
+            self.metadata = self.tenant.metadata
+            self.endpoints = self.tenant.endpoints
+            self.jwks = self.tenant.jwks
+        else:
+            # orgs resolved per request, created lazily and evicted when idle
+            if not callable(resolver):
+                resolver = TENANT_RESOLVERS[resolver]
+            self.tenants = TenantRegistry(
+                app,
+                tenants,
+                resolver = resolver,
+                observer = self._observe_response,
+                maxsize = app.config.setdefault(
+                    'OKTA_TENANT_CACHE_SIZE',
+                    DEFAULT_MAX_TENANTS,
+                ),
+                idle_ttl = app.config.setdefault(
+                    'OKTA_TENANT_IDLE_TTL',
+                    DEFAULT_TENANT_IDLE_TTL,
+                ),
+                shared_cache = self.shared_cache,
+            )
+
+        # bearer token claims verified locally, by token hash until expiry
+        self.verified_tokens = TTLCache(
+            maxsize = app.config.setdefault('OKTA_BEARER_CACHE_SIZE', 10000),
+            ttl = float('inf'),
+        )
+
         # a blueprint to handle redirecting to Okta and requesting data from
         # Okta on the backend.
+        metrics_path = None
+        if self.metrics is not None and app.config['OKTA_METRICS_ENDPOINT']:
+            metrics_path = app.config['OKTA_METRICS_PATH']
         okta_bp = create_okta_blueprint(
             blueprint_name,
             app.name,
             okta_redirect_rule,
             okta_post_logout_redirect_rule,
+            use_async = use_async,
+            tenant_in_path = (
+                tenants is not None
+                and app.config['OKTA_TENANT_FROM'] == 'path'
+            ),
+            metrics_path = metrics_path,
+            health_path = (
+                app.config['OKTA_HEALTH_PATH']
+                if app.config['OKTA_HEALTH_ENDPOINT'] else None
+            ),
         )
         app.register_blueprint(okta_bp)
 
+        if self.metrics is not None:
+            self.metrics.add_gauge('userinfo_cache', self.userinfo_cache.stats)
+            if self.shared_cache is not None:
+                self.metrics.add_gauge('shared_cache', self.shared_cache.stats)
+            self.metrics.add_gauge('bearer_cache', self.verified_tokens.stats)
+            self.metrics.add_gauge('refresh', lambda: dict(
+                shared = self.refresh_flight.shared,
+            ))
+            if self.jwks is not None:
+                self.metrics.add_gauge('jwks', lambda: dict(
+                    refreshes = self.jwks.refreshes,
+                ))
+            if self.tenants is not None:
+                self.metrics.add_gauge('tenants', self.tenants.stats)
+            self.metrics.add_gauge('okta_clients', self.client_stats)
+            self.metrics.add_gauge('okta_rate_limits', self.rate_limit_stats)
+            if self.revocations is not None:
+                self.metrics.add_gauge('revocation', self.revocations.stats)
+            if self.rate_limiter is not None:
+                self.metrics.add_gauge('rate_limit', self.rate_limiter.stats)
+            if self.claims_revalidator is not None:
+                self.metrics.add_gauge(
+                    'claims_revalidation',
+                    self.claims_revalidator.stats,
+                )
+
+    def _observe_response(self, method, url, status, duration, size):
+        """
+        Count and time a response from Okta, by endpoint and status.
+        """
+        endpoint = endpoint_name(url)
+        if self.metrics is not None:
+            self.metrics.observe(f'okta.{ endpoint }', duration)
+            self.metrics.increment(
+                f'okta.{ endpoint }.status.{ status or "error" }'
+            )
+        okta_response.send(
+            self,
+            method = method,
+            url = url,
+            status = status,
+            duration = duration,
+            size = size,
+        )
+
+    def client_stats(self):
+        """
+        Retries and circuit breaker states of the Okta clients, by tenant.
+        """
+        if self.tenants is None:
+            tenants = [self.tenant]
+        else:
+            tenants = self.tenants.loaded()
+        return {
+            tenant.name or 'default': {
+                'sync': tenant.client.stats(),
+                'async': tenant.async_client.stats(),
+            }
+            for tenant in tenants
+        }
+
+    def rate_limit_stats(self):
+        """
+        Okta rate limit left and calls paced, deferred and refused, by
+        tenant and endpoint.
+        """
+        if self.tenants is None:
+            tenants = [self.tenant]
+        else:
+            tenants = self.tenants.loaded()
+        return {
+            tenant.name or 'default': tenant.throttle.stats()
+            for tenant in tenants
+            if tenant.throttle is not None
+        }
+
+    def health(self):
+        """
+        Health of the connection to Okta, degraded while any circuit is not
+        closed.
+        """
+        clients = self.client_stats()
+        not_closed = sorted(
+            f'{ tenant }/{ endpoint }'
+            for tenant, stats in clients.items()
+            for client_stats in stats.values()
+            for endpoint, breaker in client_stats['breakers'].items()
+            if breaker['state'] != CLOSED
+        )
+        return dict(
+            status = 'degraded' if not_closed else 'ok',
+            circuits_not_closed = not_closed,
+            clients = clients,
+        )
+
     # convenient functions to extension instances
 
     wrap_view_functions = staticmethod(wrap_view_functions)
 
     wrap_app_login_required = staticmethod(wrap_app_login_required)
 
+    token_required = staticmethod(token_required)
+
+    require_groups = staticmethod(require_groups)
+
+    require_claims = staticmethod(require_claims)
+
+    init_request_loader = staticmethod(init_request_loader)
+
     def after_authorization(self, func):
         """
         Decorator to hook up callback for after Okta authorization.
@@ -96,6 +535,42 @@ class OktaManager:
         """
         return authenticated_userinfo()
 
+    def access_token(self):
+        """
+        Access token for the current session, renewed with the refresh token
+        shortly before it expires.
+        """
+        return get_access_token()
+
+    async def async_userinfo(self):
+        """
+        Async convenience function to get Okta user info.
+        """
+        return await async_authenticated_userinfo()
+
+    async def async_access_token(self):
+        """
+        Async `access_token`, renewing without blocking the event loop.
+        """
+        return await async_get_access_token()
+
+    def invalidate_userinfo(self, access_token=None):
+        """
+        Drop cached userinfo for an access token, default the current
+        session's. Called on logout.
+        """
+        invalidate_userinfo(access_token)
+
+    def revoke_tokens(self):
+        """
+        Drop the current session's access and refresh tokens, and with
+        OKTA_REVOKE_ON_LOGOUT queue them for revocation in the background.
+        Called on logout.
+        """
+        tokens = pop_session_tokens()
+        if self.revocations is not None:
+            revoke_session_tokens(self.revocations, tokens)
+
     def get_logout_obj(self, post_logout_redirect_uri=None):
         """
         Prepare session and return object with query params and url for
@@ -104,9 +579,13 @@ class OktaManager:
         :param post_logout_redirect_uri:
             See `flask_okta.prepare_for_logout_redirect`
         """
+        self.invalidate_userinfo()
+        self.revoke_tokens()
         logout_redirect = prepare_for_logout_redirect(
             post_logout_redirect_uri
         )
+        # nothing of the login may authorize requests after this
+        end_okta_session()
         return logout_redirect
 
     def logout_url(self, post_logout_redirect_uri=None):
@@ -1,11 +1,12 @@
-from flask import current_app
+import time
 
 from flask import request
-from flask import session
 from flask import url_for
 from markupsafe import Markup
 from markupsafe import escape
 
+from .okta import get_okta_endpoints
+
 def preview_redirect(redirect_authentication):
     """
     Debugging html preview before auth request.
@@ -19,10 +20,10 @@ def preview_redirect(redirect_authentication):
     html.append(flask_okta_debugging_header())
     html.append('<h2>Preview Redirect</h2>')
 
-    # link to test callback to bypass Okta for development
+    # link to test callback to bypass Okta for development, any code passes
     test_callback_url = url_for(
         '.test_callback',
-        code = session['_okta_code_verifier'],
+        code = 'test-callback',
         **redirect_authentication.query,
     )
 
@@ -39,11 +40,17 @@ def preview_redirect(redirect_authentication):
                     href = test_callback_url,
                     title = 'Bypass Okta for debugging.',
                 ),
+                tag('a',
+                    'Timeline',
+                    href = url_for('.trace'),
+                    title = 'Recent login attempts.',
+                ),
             ])))
 
     # display data
+    endpoints = get_okta_endpoints()
     items_list = [
-        ('auth_uri', current_app.config['OKTA_AUTH_URI']),
+        ('auth_uri', endpoints.authorization),
         ('url', redirect_authentication.url),
     ]
     items_list += redirect_authentication.query.items()
@@ -62,8 +69,57 @@ def display_callback():
     html.append('<h2>Success!</h2>')
     html.append('<p>Passed code and state checks.</p>')
     html.extend(dl_for_code(request.args.items()))
+    html.append(tag('a', 'Timeline', href=url_for('.trace')))
     return Markup(''.join(html))
 
+def display_traces(traces):
+    """
+    Debugging timeline of recent login attempts, most recent first.
+    """
+    html = ['<style>']
+    html.extend(dd_code_style())
+    html.append('</style>')
+
+    html.append(flask_okta_debugging_header())
+    html.append('<h2>Login Timeline</h2>')
+    if not traces:
+        html.append('<p>No login attempts recorded.</p>')
+    for trace in traces:
+        started = time.strftime('%H:%M:%S', time.localtime(trace['started']))
+        okta_events = [
+            event for event in trace['events'] if event['kind'] == 'okta'
+        ]
+        okta_ms = sum(event['duration'] for event in okta_events) * 1000
+        okta_bytes = sum(event['size'] or 0 for event in okta_events)
+        html.append(tag('h3', escape(
+            f'{ trace["id"] } at { started }, status { trace["status"] }'
+        )))
+        html.append(tag('p', escape(
+            f'requests { ", ".join(trace["requests"]) }, '
+            f'{ len(okta_events) } calls to Okta taking { okta_ms:.1f} ms '
+            f'for { okta_bytes } bytes'
+        )))
+        html.extend(dl_for_code(
+            (f'+{ event["at"] * 1000:.1f} ms', escape(describe_event(event)))
+            for event in trace['events']
+        ))
+    return Markup(''.join(html))
+
+def describe_event(event):
+    """
+    One line summary of a trace event.
+    """
+    parts = [event['kind'], event['label']]
+    if event['duration'] is not None:
+        parts.append(f'{ event["duration"] * 1000:.1f} ms')
+    if event['kind'] == 'okta':
+        parts.append(f'status { event["status"] or "error" }')
+        if event['size'] is not None:
+            parts.append(f'{ event["size"] } bytes')
+    elif event['kind'] == 'request':
+        parts.append(f'id { event["request_id"] }')
+    return ' '.join(parts)
+
 def flask_okta_debugging_header():
     return '<h1>Flask-Okta Debugging Mode On</h1>'
 
@@ -0,0 +1,183 @@
+import threading
+import time
+
+from .lazy import lazy_import
+
+# PyJWT and cryptography take longer to import than the rest of the package
+jwt = lazy_import('jwt')
+
+# algorithms Okta signs tokens with
+DEFAULT_ALGORITHMS = ('RS256',)
+
+# claims that must be present in any token we accept
+REQUIRED_CLAIMS = ('exp', 'iat', 'iss', 'aud', 'sub')
+
+def require_jwt():
+    """
+    Raise if the optional PyJWT dependency is missing, otherwise finish
+    importing it.
+    """
+    if jwt is None:
+        raise RuntimeError(
+            'Local token verification requires PyJWT. '
+            'Install with `pip install flask_okta[jwt]`.'
+        )
+    # complete the deferred import here, at setup, instead of in whichever
+    # request threads touch it first
+    jwt.InvalidTokenError
+
+
+class JWKSCache:
+    """
+    In-process cache of an authorization server's signing keys by kid.
+
+    Keys are fetched on first use. A token signed with an unknown kid triggers
+    a refresh, for key rotation, but no more often than
+    `min_refresh_interval` so garbage kids cannot hammer the keys endpoint.
+
+    With a `flask_okta.shared.SharedCache` the key set document is fetched
+    by one worker on the host and read from the cache by the rest, and the
+    refresh interval for unknown kids holds across workers.
+    """
+
+    def __init__(
+        self,
+        client,
+        jwks_uri,
+        max_age = 86400,
+        min_refresh_interval = 60,
+        clock = time.monotonic,
+        shared_cache = None,
+    ):
+        """
+        :param client:
+            OktaClient used to fetch the key set.
+        :param jwks_uri:
+            URI of the JSON web key set, `{issuer}/v1/keys` for Okta.
+        :param max_age:
+            Seconds before the key set is refetched regardless of kid.
+        :param min_refresh_interval:
+            Minimum seconds between fetches triggered by unknown kids.
+        :param shared_cache:
+            Optional SharedCache for the key set document.
+        """
+        require_jwt()
+        self.client = client
+        self.jwks_uri = jwks_uri
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.clock = clock
+        self.shared_cache = shared_cache
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def fetch(self):
+        """
+        GET the key set document.
+        """
+        response = self.client.get(self.jwks_uri)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_shared(self, kid=None):
+        """
+        Key set document from the shared cache, fetched by this worker when
+        expired, or when it lacks kid and no worker looked for new keys
+        within the minimum interval.
+        """
+        shared_cache = self.shared_cache
+
+        def fill():
+            return self.fetch(), self.max_age
+
+        def has_kid(jwks):
+            return any(jwk.get('kid') == kid for jwk in jwks.get('keys', []))
+
+        accept = None
+        if kid is not None and shared_cache.claim(
+            f'jwks-refresh:{ self.jwks_uri }',
+            self.min_refresh_interval,
+        ):
+            # this worker looks for the new key, the others take what it
+            # finds or the cached set
+            accept = has_kid
+        return shared_cache.get_or_fill(
+            f'jwks:{ self.jwks_uri }',
+            fill,
+            accept = accept,
+        )
+
+    def load(self, jwks):
+        """
+        Replace keys from a key set document.
+        """
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            if jwk.get('use', 'sig') != 'sig' or 'kid' not in jwk:
+                continue
+            keys[jwk['kid']] = jwt.PyJWK(jwk).key
+        self._keys = keys
+        self._fetched_at = self.clock()
+        self.refreshes += 1
+
+    def refresh(self, force=False, kid=None):
+        """
+        Refetch keys unless it was done within the minimum interval.
+
+        :param kid:
+            Unknown kid the refresh is for.
+        """
+        with self._lock:
+            fetched_at = self._fetched_at
+            if (
+                not force
+                and fetched_at is not None
+                and self.clock() - fetched_at < self.min_refresh_interval
+            ):
+                return
+            if self.shared_cache is None:
+                self.load(self.fetch())
+            else:
+                self.load(self.fetch_shared(kid))
+
+    def get_key(self, kid):
+        """
+        Signing key for kid, refreshing the key set for unknown kids.
+        """
+        fetched_at = self._fetched_at
+        if fetched_at is None or self.clock() - fetched_at > self.max_age:
+            self.refresh(force=True)
+        key = self._keys.get(kid)
+        if key is None:
+            self.refresh(kid=kid)
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f'Unknown signing key { kid!r}.')
+        return key
+
+    def decode(
+        self,
+        token,
+        issuer,
+        audience,
+        leeway = 0,
+        algorithms = DEFAULT_ALGORITHMS,
+    ):
+        """
+        Verify signature, issuer, audience and expiry of a JWT and return its
+        claims. Raises `jwt.InvalidTokenError` for any failure.
+        """
+        header = jwt.get_unverified_header(token)
+        key = self.get_key(header.get('kid'))
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms = list(algorithms),
+            audience = audience,
+            issuer = issuer,
+            leeway = leeway,
+            options = dict(require=list(REQUIRED_CLAIMS)),
+        )
+        return claims
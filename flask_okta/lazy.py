@@ -0,0 +1,20 @@
+import importlib.util
+import sys
+
+def lazy_import(name):
+    """
+    Module whose import runs on first attribute access, or None when it is
+    not installed.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
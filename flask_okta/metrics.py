@@ -0,0 +1,165 @@
+import bisect
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app
+from flask import g
+from flask import has_app_context
+
+from .signals import phase_timed
+
+# upper bounds in seconds
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+# upper bounds in bytes
+SIZE_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192)
+
+class Histogram:
+    """
+    Fixed bucket histogram. Observing is a bisect and three additions.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return dict(
+            count = self.count,
+            sum = self.sum,
+            buckets = dict(zip(bounds, self.counts)),
+        )
+
+
+class Metrics:
+    """
+    In-process histograms and counters for the Okta flow.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        # name -> callable returning a dict, for state owned elsewhere
+        self.gauges = {}
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def add_gauge(self, name, func):
+        self.gauges[name] = func
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(
+                histograms = {
+                    name: histogram.snapshot()
+                    for name, histogram in self.histograms.items()
+                },
+                counters = dict(self.counters),
+            )
+        data['gauges'] = {name: func() for name, func in self.gauges.items()}
+        return data
+
+
+def record_phase(phase, duration):
+    """
+    Record a phase duration in the extension metrics, the request's
+    Server-Timing entries, and send the `phase_timed` signal.
+    """
+    if not has_app_context():
+        return
+    app = current_app._get_current_object()
+    okta = app.extensions.get('okta')
+    if okta is not None and okta.metrics is not None:
+        okta.metrics.observe(phase, duration)
+    timings = g.setdefault('_okta_timings', [])
+    timings.append((phase, duration))
+    phase_timed.send(app, phase=phase, duration=duration)
+
+@contextmanager
+def timed(phase):
+    """
+    Time the block as phase.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - start)
+
+def server_timing_header(timings):
+    """
+    Server-Timing header value for (phase, seconds) pairs.
+    """
+    return ', '.join(
+        f'okta-{ phase.replace(".", "-") };dur={ duration * 1000:.3f}'
+        for phase, duration in timings
+    )
+
+
+class TimedSessionInterface:
+    """
+    Wrap an app's session interface to time session writes and measure the
+    session cookie sent back. Attributes are read from and set on the wrapped
+    interface, so code configuring `app.session_interface` keeps working.
+    """
+
+    def __init__(self, wrapped):
+        object.__setattr__(self, 'wrapped', wrapped)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.wrapped, name, value)
+
+    def open_session(self, app, request):
+        return self.wrapped.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        start = time.perf_counter()
+        try:
+            return self.wrapped.save_session(app, session, response)
+        finally:
+            record_phase('session_write', time.perf_counter() - start)
+            cookie_bytes = session_cookie_bytes(app, response)
+            okta = app.extensions.get('okta')
+            if cookie_bytes and okta is not None and okta.metrics is not None:
+                okta.metrics.observe(
+                    'session_cookie_bytes',
+                    cookie_bytes,
+                    buckets = SIZE_BUCKETS,
+                )
+
+def session_cookie_bytes(app, response):
+    """
+    Bytes of the name=value part of a session Set-Cookie, 0 if not set.
+    """
+    prefix = app.config['SESSION_COOKIE_NAME'] + '='
+    for cookie in response.headers.getlist('Set-Cookie'):
+        if cookie.startswith(prefix):
+            return len(cookie.partition(';')[0])
+    return 0
@@ -25,6 +25,13 @@ def generate_state_token(nbytes=DEFAULT_NBYTES):
     state = secrets.token_urlsafe(nbytes)
     return state
 
+def generate_nonce(nbytes=DEFAULT_NBYTES):
+    """
+    Value Okta copies into the id_token to bind it to this login attempt.
+    """
+    nonce = secrets.token_urlsafe(nbytes)
+    return nonce
+
 def get_code_challenge(code_verifier):
     """
     :param code_verifier:
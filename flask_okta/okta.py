@@ -1,17 +1,25 @@
 import secrets
+import time
 
 from urllib.parse import urlencode
 
-import requests
-
 from flask import abort
 from flask import current_app
+from flask import g
 from flask import request
-from flask import session
 
+from .cache import seconds_until
+from .cache import token_cache_key
+from .jwks import jwt
+from .metrics import timed
 from .oauth import generate_code_verifier
+from .oauth import generate_nonce
 from .oauth import generate_state_token
 from .oauth import get_code_challenge
+from .resilience import endpoint_name
+from .session import okta_session
+from .settings import DEFAULT_SCOPE
+from .settings import RESERVED_SCOPES
 
 # Required Query Parameters for /authenticate:
 
@@ -27,40 +35,98 @@ from .oauth import get_code_challenge
 # - state
 #   - a value returned in token for application use
 
-# https://developer.okta.com/docs/reference/api/oidc/#reserved-scopes
-RESERVED_SCOPES = set([
-    'openid',
-    'profile',
-    'email',
-    'address',
-    'phone',
-    'offline_access',
-    'groups',
-])
+
+def find_okta_tenant():
+    """
+    Okta org serving the current request. The configured one, or with
+    OKTA_TENANTS the one resolved from the request, once per request. None
+    for requests outside every tenant.
+    """
+    okta = current_app.extensions['okta']
+    if okta.tenants is None:
+        return okta.tenant
+    tenant = g.get('_okta_tenant')
+    if tenant is None:
+        tenant = okta.tenants.resolve()
+        if tenant is not None:
+            g._okta_tenant = tenant
+    return tenant
+
+def get_okta_tenant():
+    """
+    Okta org serving the current request, aborts 404 outside every tenant.
+    """
+    tenant = find_okta_tenant()
+    if tenant is None:
+        abort(404, 'Unknown Okta tenant.')
+    return tenant
+
+def get_okta_client():
+    """
+    Pooled HTTP client of the current tenant.
+    """
+    return get_okta_tenant().client
+
+def get_userinfo_cache():
+    """
+    Userinfo cache owned by the registered OktaManager.
+    """
+    return current_app.extensions['okta'].userinfo_cache
+
+def get_okta_endpoints():
+    """
+    Endpoints resolved for the current tenant.
+    """
+    return get_okta_tenant().endpoints
+
+def get_pending_logins():
+    """
+    Pending logins owned by the registered OktaManager.
+    """
+    return current_app.extensions['okta'].pending_logins
+
+def get_jwks():
+    """
+    Signing key cache of the current tenant.
+    """
+    jwks = get_okta_tenant().jwks
+    if jwks is None:
+        raise RuntimeError('OKTA_ISSUER or OKTA_JWKS_URI is not configured.')
+    return jwks
+
 
 class OktaRedirect:
     """
     Convenience object for redirect authentication.
     """
 
-    def __init__(self, base_url, query):
+    def __init__(self, base_url, query, url=None):
+        """
+        :param url:
+            Already encoded URL, when the caller built it from a
+            precomputed prefix.
+        """
         self.base_url = base_url
         self.query = query
+        self._url = url
 
     @property
     def url(self):
         """
-        URL to Okta with query paramaters for redirect operations.
+        URL to Okta with query paramaters for redirect operations, encoded
+        once.
         """
-        url = f'{ self.base_url }?{ urlencode(self.query) }'
-        return url
+        if self._url is None:
+            self._url = f'{ self.base_url }?{ urlencode(self.query) }'
+        return self._url
 
 
 def prepare_redirect_authentication(
-    scope = 'openid email profile',
+    scope = DEFAULT_SCOPE,
     response_type = 'code',
     response_mode = 'query',
     code_challenge_method = 'S256',
+    next_url = None,
 ):
     """
     Prepare session and return object with url for redirect authentication with
@@ -74,45 +140,38 @@ def prepare_redirect_authentication(
         default for redirect authentication.
     :param code_challenge_method:
         default from Okta docs.
+    :param next_url:
+        Path on this site to return to after login, see `get_next_url`.
     """
-    # NOTE
-    # - leaving room for growth with kwargs but nothing else is supported yet.
-    # validate scope
-    scope_set = set(scope.split())
-    assert 'openid' in scope_set, 'openid is required in scope.'
-    unknown_scopes = scope_set.difference(RESERVED_SCOPES)
-    assert not unknown_scopes, f'Unknown scope values { unknown_scopes }.'
-    # validate remaining:
-    assert response_type == 'code', 'Only response type "code" supported.'
-    assert response_mode == 'query', 'Only response mode "query" supported.'
-    assert code_challenge_method == 'S256', \
-        'Only code challenge method "S256" supported.'
+    # validated once per parameter set, raises ValueError
+    settings = get_okta_tenant().authorize_settings(
+        scope = scope,
+        response_type = response_type,
+        response_mode = response_mode,
+        code_challenge_method = code_challenge_method,
+    )
 
     state = generate_state_token()
     code_verifier = generate_code_verifier()
+    nonce = generate_nonce()
 
-    session['_okta_state'] = state
-    session['_okta_code_verifier'] = code_verifier
-
-    client_id = current_app.config['OKTA_CLIENT_ID']
-    client_secret = current_app.config['OKTA_CLIENT_SECRET']
-    redirect_uri = current_app.config['OKTA_REDIRECT_URI']
+    # one pending login per state, so logins in other tabs stay valid
+    get_pending_logins().add(state, code_verifier, nonce, next_url)
 
     code_challenge = get_code_challenge(code_verifier)
 
     query_params = dict(
-        client_id = client_id,
-        redirect_uri = redirect_uri,
-        response_type = response_type,
-        response_mode = response_mode,
-        scope = scope,
+        settings.query,
         state = state,
         code_challenge = code_challenge,
-        code_challenge_method = code_challenge_method,
+        nonce = nonce,
     )
 
-    auth_uri = current_app.config['OKTA_AUTH_URI']
-    redirect_authentication = OktaRedirect(auth_uri, query_params)
+    redirect_authentication = OktaRedirect(
+        settings.authorization,
+        query_params,
+        url = settings.url(state, code_challenge, nonce),
+    )
     return redirect_authentication
 
 def prepare_for_logout_redirect(post_logout_redirect_uri=None):
@@ -123,10 +182,10 @@ def prepare_for_logout_redirect(post_logout_redirect_uri=None):
         URL to redirect back to application from Okta. If None, attempt to
         lookup from config. See prepare_for_logout_redirect
     """
-    state = session['_okta_state'] = generate_state_token()
+    state = okta_session['_okta_state'] = generate_state_token()
 
     query_params = dict(
-        id_token_hint = session['_okta_id_token'],
+        id_token_hint = okta_session['_okta_id_token'],
         state = state,
     )
 
@@ -134,21 +193,52 @@ def prepare_for_logout_redirect(post_logout_redirect_uri=None):
     post_logout_redirect_uri = (
         post_logout_redirect_uri
         or
-        current_app.config.get('OKTA_POST_LOGOUT_REDIRECT_URI')
+        get_okta_tenant().post_logout_redirect_uri
     )
     if post_logout_redirect_uri:
         query_params['post_logout_redirect_uri'] = post_logout_redirect_uri
 
-    logout_uri = current_app.config['OKTA_LOGOUT_URI']
+    logout_uri = get_okta_endpoints().end_session
     logout_redirect = OktaRedirect(logout_uri, query_params)
     return logout_redirect
 
-def post_for_access_code(code, state):
+def claim_pending_login(state):
     """
-    post request for access code after return from redirect authentication.
+    Take this session's pending login for state, aborting 400 when it is
+    unknown, expired or already used. Kept for the rest of the request.
+    """
+    pending_login = get_pending_logins().claim(state)
+    if pending_login is None:
+        abort(400, 'Login expired or already completed, sign in again.')
+    g._okta_pending_login = pending_login
+    return pending_login
+
+def current_pending_login():
+    """
+    Pending login claimed by this request's callback.
+    """
+    pending_login = g.get('_okta_pending_login')
+    if pending_login is None:
+        abort(400, 'No login in progress.')
+    return pending_login
+
+def get_next_url(default=None):
     """
-    exchange_response = requests.post(
-        current_app.config['OKTA_TOKEN_URI'],
+    Path the completed login asked to return to, or default. For use in
+    after_authorization.
+    """
+    pending_login = g.get('_okta_pending_login')
+    if pending_login is None:
+        return default
+    return pending_login.get('next') or default
+
+def access_code_request(code):
+    """
+    Arguments for the token request exchanging an authorization code, shared
+    by the sync and async clients.
+    """
+    return dict(
+        url = get_okta_endpoints().token,
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded',
         },
@@ -156,57 +246,303 @@ def post_for_access_code(code, state):
             grant_type = 'authorization_code',
             code = code,
             redirect_uri = request.base_url,
-            code_verifier = session['_okta_code_verifier'],
+            code_verifier = current_pending_login()['code_verifier'],
         ),
-        auth = (
-            current_app.config['OKTA_CLIENT_ID'],
-            current_app.config['OKTA_CLIENT_SECRET'],
+        auth = client_credentials(),
+    )
+
+def client_credentials():
+    """
+    Client id and secret of the current tenant, for basic auth.
+    """
+    tenant = get_okta_tenant()
+    return (tenant.client_id, tenant.client_secret)
+
+def userinfo_request(access_token):
+    """
+    Arguments for a /userinfo request.
+    """
+    return dict(
+        url = get_okta_endpoints().userinfo,
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+        },
+    )
+
+def refresh_request(refresh_token):
+    """
+    Arguments for the token request renewing tokens with a refresh token.
+    """
+    return dict(
+        url = get_okta_endpoints().token,
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+        },
+        data = dict(
+            grant_type = 'refresh_token',
+            refresh_token = refresh_token,
         ),
+        auth = client_credentials(),
     )
+
+def post_for_access_code(code, state):
+    """
+    post request for access code after return from redirect authentication.
+    """
+    client = get_okta_client()
+    with timed('token'):
+        exchange_response = client.post(**access_code_request(code))
     exchange_response.raise_for_status()
     exchange = exchange_response.json()
     return exchange
 
-def exchange_for_userinfo(code, state):
+def verify_id_token(id_token, nonce):
     """
-    Post for access code and use it to get userinfo data.
+    Verify an id_token locally against the cached signing keys and return its
+    claims. Aborts 403 on a bad signature, issuer, audience, expiry or nonce.
+    """
+    config = current_app.config
+    try:
+        with timed('id_token'):
+            claims = get_jwks().decode(
+                id_token,
+                issuer = get_okta_endpoints().issuer,
+                audience = get_okta_tenant().client_id,
+                leeway = config.get('OKTA_JWT_LEEWAY', 0),
+            )
+    except jwt.InvalidTokenError as exc:
+        abort(403, f'Invalid id_token. { exc }')
+
+    if not nonce or not secrets.compare_digest(claims.get('nonce', ''), nonce):
+        abort(403, 'nonce does not match.')
+
+    return claims
+
+def store_exchange(exchange):
+    """
+    Validate a token response and save its tokens to the session. Returns the
+    access token.
     """
-    # post request for access token
-    exchange = post_for_access_code(code, state)
-
     if not exchange.get('token_type'):
         abort(403, 'Unsupported token type.')
 
     # authorization successful
     access_token = exchange['access_token']
-    id_token = exchange['id_token']
 
     # docs don't show saving this anywhere but it is necessary for other endpoints
-    session['_okta_access_token'] = access_token
-    session['_okta_id_token'] = id_token
-
-    userinfo_response = requests.get(
-        current_app.config['OKTA_USERINFO_URI'],
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-        },
+    okta_session['_okta_access_token'] = access_token
+    # a refresh response may leave out the id_token or keep the refresh token
+    if 'id_token' in exchange:
+        okta_session['_okta_id_token'] = exchange['id_token']
+    if 'refresh_token' in exchange:
+        okta_session['_okta_refresh_token'] = exchange['refresh_token']
+
+    expires_in = exchange.get('expires_in')
+    if expires_in is not None:
+        okta_session['_okta_expires_at'] = int(time.time()) + int(expires_in)
+    else:
+        okta_session.pop('_okta_expires_at', None)
+
+    # tokens are only good for the org that issued them
+    tenant_name = get_okta_tenant().name
+    if tenant_name is not None:
+        okta_session['_okta_tenant'] = tenant_name
+
+    return access_token
+
+def indexed_claims(claims, names):
+    """
+    Values of the named claims as lists, empty for missing claims.
+    """
+    indexed = {}
+    for name in names:
+        value = claims.get(name)
+        if value is None:
+            indexed[name] = []
+        elif isinstance(value, (list, tuple)):
+            indexed[name] = list(value)
+        else:
+            indexed[name] = [value]
+    return indexed
+
+def store_claims(userinfo):
+    """
+    Save the OKTA_INDEXED_CLAIMS of userinfo to the session, for
+    `flask_okta.claims.require_groups` and `require_claims`.
+    """
+    okta_session['_okta_claims'] = indexed_claims(
+        userinfo,
+        current_app.config['OKTA_INDEXED_CLAIMS'],
     )
-    userinfo_response.raise_for_status()
+    okta_session['_okta_claims_at'] = int(time.time())
 
-    userinfo = userinfo_response.json()
+def post_for_refresh(refresh_token):
+    """
+    post request renewing tokens. None if Okta rejects the refresh token.
+    """
+    client = get_okta_client()
+    with timed('refresh'):
+        refresh_response = client.post(**refresh_request(refresh_token))
+    if refresh_response.status_code in (400, 401):
+        # invalid_grant, revoked or expired refresh token
+        return None
+    refresh_response.raise_for_status()
+    exchange = refresh_response.json()
+    return exchange
+
+def refresh_tokens():
+    """
+    Renew the session's tokens with its refresh token and return the new
+    access token, or None if the refresh token is no longer accepted.
+
+    Concurrent requests holding the same refresh token share one request to
+    Okta, and requests arriving shortly after reuse its response, so a burst
+    of requests never spends a rotating refresh token twice.
+    """
+    refresh_token = okta_session.get('_okta_refresh_token')
+    if not refresh_token:
+        return None
+
+    okta = current_app.extensions['okta']
+    key = token_cache_key(refresh_token)
+
+    def refresh():
+        exchange = okta.recent_refreshes.get(key)
+        if exchange is None:
+            exchange = post_for_refresh(refresh_token)
+            if exchange is not None:
+                okta.recent_refreshes.set(key, exchange)
+        return exchange
+
+    exchange = okta.refresh_flight.do(key, refresh)
+    return store_refresh(exchange)
+
+def store_refresh(exchange):
+    """
+    Store the tokens of a refresh and return the new access token. Drops
+    the refresh token when Okta no longer accepted it.
+    """
+    if exchange is None:
+        okta_session.pop('_okta_refresh_token', None)
+        return None
+    return store_exchange(exchange)
+
+def session_access_token():
+    """
+    Access token for the current session as stored, without renewing it.
+    """
+    access_token = okta_session.get('_okta_access_token')
+    if not access_token:
+        return access_token
+    if okta_session.get('_okta_tenant') != get_okta_tenant().name:
+        # logged in with another tenant sharing this session
+        return None
+    return access_token
+
+def refresh_due():
+    """
+    True when the session's access token expires within OKTA_REFRESH_LEEWAY
+    seconds and a refresh token is available. While more than half the
+    leeway is left, the refresh waits when Okta's token rate limit runs low.
+    """
+    expires_at = okta_session.get('_okta_expires_at')
+    if expires_at is None or not okta_session.get('_okta_refresh_token'):
+        return False
+    leeway = current_app.config['OKTA_REFRESH_LEEWAY']
+    expires_in = expires_at - time.time()
+    if expires_in > leeway:
+        return False
+    if expires_in > leeway / 2:
+        throttle = get_okta_tenant().throttle
+        if throttle is not None and throttle.should_defer(
+            endpoint_name(get_okta_endpoints().token)
+        ):
+            # the token is good for a while yet, logins come first
+            return False
+    return True
+
+def get_access_token():
+    """
+    Access token for the current session, renewed first when it expires
+    within OKTA_REFRESH_LEEWAY seconds and a refresh token is available.
+    """
+    access_token = session_access_token()
+    if access_token and refresh_due():
+        access_token = refresh_tokens() or access_token
+    return access_token
+
+def id_token_userinfo():
+    """
+    Verified id_token claims when configured to use them in place of
+    /userinfo, otherwise None.
+    """
+    if current_app.config.get('OKTA_USERINFO_FROM_ID_TOKEN'):
+        nonce = current_pending_login().get('nonce')
+        return verify_id_token(okta_session['_okta_id_token'], nonce)
+
+def exchange_for_userinfo(code, state):
+    """
+    Post for access code and use it to get userinfo data. With
+    OKTA_USERINFO_FROM_ID_TOKEN the verified id_token claims are returned
+    instead of requesting /userinfo.
+    """
+    claim_pending_login(state)
+    # post request for access token
+    exchange = post_for_access_code(code, state)
+    access_token = store_exchange(exchange)
+
+    claims = id_token_userinfo()
+    if claims is not None:
+        store_claims(claims)
+        return claims
+
+    userinfo = request_userinfo(access_token)
+    # the first page after login usually wants userinfo again
+    cache_userinfo(access_token, userinfo)
+    store_claims(userinfo)
     return userinfo
 
-def authenticated_userinfo():
+def request_userinfo(access_token):
     """
-    User information from /userinfo for current authenticated user.
+    GET /userinfo with an access token.
     """
-    access_token = session['_okta_access_token']
-    userinfo_response = requests.get(
-        current_app.config['OKTA_USERINFO_URI'],
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-        },
-    )
+    client = get_okta_client()
+    with timed('userinfo'):
+        userinfo_response = client.get(**userinfo_request(access_token))
     userinfo_response.raise_for_status()
     userinfo = userinfo_response.json()
     return userinfo
+
+def cache_userinfo(access_token, userinfo):
+    """
+    Cache userinfo for an access token, no longer than the token lives.
+    """
+    cache = get_userinfo_cache()
+    ttl = cache.ttl
+    expires_at = okta_session.get('_okta_expires_at')
+    if expires_at is not None:
+        ttl = min(ttl, seconds_until(expires_at))
+    cache.set(token_cache_key(access_token), userinfo, ttl)
+
+def invalidate_userinfo(access_token=None):
+    """
+    Drop cached userinfo for an access token, default the session's.
+    """
+    if access_token is None:
+        access_token = okta_session.get('_okta_access_token')
+    if access_token:
+        get_userinfo_cache().pop(token_cache_key(access_token))
+
+def authenticated_userinfo():
+    """
+    User information from /userinfo for current authenticated user. Served
+    from the userinfo cache while the entry and the access token are live.
+    """
+    access_token = get_access_token()
+    if not access_token:
+        abort(401, 'Not authenticated with Okta.')
+    userinfo = get_userinfo_cache().get(token_cache_key(access_token))
+    if userinfo is None:
+        userinfo = request_userinfo(access_token)
+        cache_userinfo(access_token, userinfo)
+    return userinfo
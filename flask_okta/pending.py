@@ -0,0 +1,127 @@
+import time
+
+from .session import okta_session
+
+# session key of the states of this session's pending logins
+PENDING_KEY = '_okta_pending'
+
+# seconds a user has to finish signing in at Okta
+DEFAULT_PENDING_TTL = 600
+
+# logins one session may have in flight, separate tabs or repeated clicks
+DEFAULT_PENDING_PER_SESSION = 5
+
+def is_safe_next_url(url):
+    """
+    True for a path on this site, so a login cannot redirect elsewhere.
+    """
+    return (
+        bool(url)
+        and url.startswith('/')
+        and not url.startswith('//')
+        and '\\' not in url
+    )
+
+
+class PendingLogins:
+    """
+    Logins redirected to Okta and not yet called back, by state.
+
+    Each holds the PKCE code verifier, nonce and URL to return to. The
+    session lists the states it started, capped at per_session with the
+    oldest dropped first, so every tab gets its own login and a callback is
+    only accepted from the session that started it. Records are kept in the
+    okta session itself, or in an `ExpiringStore` so only the states travel
+    with the session.
+    """
+
+    def __init__(
+        self,
+        store = None,
+        ttl = DEFAULT_PENDING_TTL,
+        per_session = DEFAULT_PENDING_PER_SESSION,
+        clock = time.time,
+    ):
+        """
+        :param store:
+            ExpiringStore for the records, None to keep them in the session.
+            A memory store only serves callbacks landing on the same worker.
+        :param ttl:
+            Seconds a pending login is accepted.
+        :param per_session:
+            Pending logins kept per session.
+        """
+        self.store = store
+        self.ttl = ttl
+        self.per_session = per_session
+        self.clock = clock
+
+    def _expires_at(self, entry):
+        # session entries are [expires_at, record] without a store
+        return entry if self.store is not None else entry[0]
+
+    def _session_pending(self, now):
+        """
+        This session's pending logins that have not expired.
+        """
+        pending = okta_session.get(PENDING_KEY) or {}
+        return {
+            state: entry for state, entry in pending.items()
+            if self._expires_at(entry) > now
+        }
+
+    def add(self, state, code_verifier, nonce=None, next_url=None):
+        """
+        Remember a login redirected to Okta with state.
+        """
+        now = self.clock()
+        expires_at = now + self.ttl
+        record = dict(
+            code_verifier = code_verifier,
+            nonce = nonce,
+            next = next_url if is_safe_next_url(next_url) else None,
+        )
+        pending = self._session_pending(now)
+        if self.store is None:
+            pending[state] = [expires_at, record]
+        else:
+            self.store.set(state, record, expires_at)
+            pending[state] = expires_at
+        while len(pending) > self.per_session:
+            # session JSON sorts keys, so age comes from expiry not order
+            oldest = min(
+                pending,
+                key = lambda key: self._expires_at(pending[key]),
+            )
+            del pending[oldest]
+            if self.store is not None:
+                self.store.delete(oldest)
+        okta_session[PENDING_KEY] = pending
+
+    def __contains__(self, state):
+        pending = okta_session.get(PENDING_KEY) or {}
+        return state in pending
+
+    def claim(self, state):
+        """
+        Remove and return the record of this session's pending login with
+        state, None if it is unknown, expired or already claimed.
+        """
+        pending = okta_session.get(PENDING_KEY) or {}
+        if state not in pending:
+            return None
+        pending = dict(pending)
+        entry = pending.pop(state)
+        if pending:
+            okta_session[PENDING_KEY] = pending
+        else:
+            okta_session.pop(PENDING_KEY, None)
+        if self._expires_at(entry) <= self.clock():
+            if self.store is not None:
+                self.store.delete(state)
+            return None
+        if self.store is None:
+            return entry[1]
+        # taken in one step, a concurrent callback with the same state gets
+        # None
+        return self.store.pop(state)
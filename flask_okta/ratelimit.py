@@ -0,0 +1,249 @@
+import secrets
+import threading
+import time
+
+from collections import Counter
+from collections import OrderedDict
+
+from flask import request
+from flask import session
+
+from .store import SQLiteConnections
+
+# session key of the random id the session's bucket is kept under
+RATE_LIMIT_KEY = '_okta_rate_key'
+
+# tokens per second and bucket size, a login takes two requests
+DEFAULT_IP_RATE = 2.0
+DEFAULT_IP_BURST = 60
+DEFAULT_SESSION_RATE = 0.2
+DEFAULT_SESSION_BURST = 10
+
+# views of the okta blueprint anyone can call, each may end in calls to Okta
+RATE_LIMITED_VIEWS = frozenset([
+    'redirect_for_okta_login',
+    'authorization_code_callback',
+])
+
+def spend(tokens, rate, cost):
+    """
+    Tokens left after spending cost and seconds to wait, 0 when the tokens
+    were there to spend.
+    """
+    if tokens >= cost:
+        return tokens - cost, 0
+    return tokens, (cost - tokens) / rate
+
+
+class TokenBuckets:
+    """
+    Token buckets by key. A bucket holds up to burst tokens, refills at rate
+    tokens per second and starts full.
+    """
+
+    def take(self, key, rate, burst, cost=1):
+        """
+        Take cost tokens from key's bucket. Returns 0 when they were taken,
+        otherwise seconds until they would be there.
+        """
+        raise NotImplementedError
+
+
+class MemoryBuckets(TokenBuckets):
+    """
+    Bounded in-process buckets, least recently used are dropped first. Each
+    worker process limits on its own.
+    """
+
+    def __init__(self, maxsize=10000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, rate, burst, cost=1):
+        with self._lock:
+            now = self.clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = burst
+            else:
+                tokens, updated = bucket
+                tokens = min(burst, tokens + (now - updated) * rate)
+            tokens, wait = spend(tokens, rate, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # a dropped bucket comes back full, so drop the oldest first
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class SQLiteBuckets(TokenBuckets):
+    """
+    Buckets in a SQLite file shared by every worker on a host. Each take is
+    one immediate transaction, so concurrent workers cannot spend the same
+    tokens. Rows of buckets that refilled are purged at most once per
+    purge_interval seconds.
+    """
+
+    def __init__(
+        self,
+        path,
+        table = 'okta_rate_limits',
+        purge_interval = 60,
+        clock = time.time,
+    ):
+        self.path = path
+        self.table = table
+        self.purge_interval = purge_interval
+        self.clock = clock
+        # transactions are begun explicitly, see take
+        self.connections = SQLiteConnections(path, isolation_level=None)
+        self._purged_at = 0
+        self.connection.execute(
+            f'CREATE TABLE IF NOT EXISTS { table } ('
+            ' key TEXT PRIMARY KEY,'
+            ' tokens REAL NOT NULL,'
+            ' updated REAL NOT NULL,'
+            ' full_at REAL NOT NULL)'
+        )
+
+    @property
+    def connection(self):
+        return self.connections.get()
+
+    def take(self, key, rate, burst, cost=1):
+        connection = self.connection
+        # write lock before reading, no other worker updates in between
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = self.clock()
+            row = connection.execute(
+                f'SELECT tokens, updated FROM { self.table } WHERE key = ?',
+                (key,),
+            ).fetchone()
+            if row is None:
+                tokens = burst
+            else:
+                tokens, updated = row
+                tokens = min(burst, tokens + (now - updated) * rate)
+            tokens, wait = spend(tokens, rate, cost)
+            connection.execute(
+                f'INSERT OR REPLACE INTO { self.table }'
+                ' (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (burst - tokens) / rate),
+            )
+            if now - self._purged_at > self.purge_interval:
+                self._purged_at = now
+                # a missing bucket is a full one
+                connection.execute(
+                    f'DELETE FROM { self.table } WHERE full_at <= ?',
+                    (now,),
+                )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return wait
+
+
+def create_buckets(backend, path=None, maxsize=10000):
+    """
+    Token buckets from a configuration value.
+
+    :param backend:
+        'memory', 'sqlite', a TokenBuckets instance, or None to not limit.
+    :param path:
+        SQLite database file, required for 'sqlite'.
+    :param maxsize:
+        Bucket limit for 'memory'.
+    """
+    if backend is None or isinstance(backend, TokenBuckets):
+        return backend
+    if backend == 'memory':
+        return MemoryBuckets(maxsize=maxsize)
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError('sqlite rate limit requires a path.')
+        return SQLiteBuckets(path)
+    raise ValueError(f'Unknown rate limit backend { backend!r}.')
+
+
+class LoginRateLimiter:
+    """
+    Limits requests to the okta blueprint's public views by client IP and by
+    session, before any call to Okta.
+
+    Clients that drop their cookies get a new session every request and are
+    only held by the IP limit. Behind a proxy, make `request.remote_addr`
+    the client's address, with werkzeug's ProxyFix for one.
+    """
+
+    def __init__(
+        self,
+        buckets,
+        ip_rate = DEFAULT_IP_RATE,
+        ip_burst = DEFAULT_IP_BURST,
+        session_rate = DEFAULT_SESSION_RATE,
+        session_burst = DEFAULT_SESSION_BURST,
+    ):
+        """
+        :param buckets:
+            TokenBuckets holding both limits.
+        :param ip_rate:
+            Requests per second a client IP is allowed over time.
+        :param ip_burst:
+            Requests a client IP may make at once.
+        :param session_rate:
+            Requests per second a session is allowed over time.
+        :param session_burst:
+            Requests a session may make at once.
+        """
+        self.buckets = buckets
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def check(self):
+        """
+        Seconds the current request must wait, 0 when it may go on.
+        """
+        wait = self.buckets.take(
+            f'ip:{ request.remote_addr }',
+            self.ip_rate,
+            self.ip_burst,
+        )
+        if wait:
+            self.count('limited_ip')
+            return wait
+        session_key = session.get(RATE_LIMIT_KEY)
+        if session_key is None:
+            session_key = session[RATE_LIMIT_KEY] = secrets.token_urlsafe(16)
+        wait = self.buckets.take(
+            f'session:{ session_key }',
+            self.session_rate,
+            self.session_burst,
+        )
+        if wait:
+            self.count('limited_session')
+            return wait
+        self.count('allowed')
+        return 0
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        for outcome in ('allowed', 'limited_ip', 'limited_session'):
+            counts.setdefault(outcome, 0)
+        return counts
@@ -0,0 +1,238 @@
+import math
+import random
+import threading
+import time
+
+from werkzeug.exceptions import ServiceUnavailable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# methods safe to send again after a timeout or server error, the token
+# endpoint is POST and spends codes and rotating refresh tokens
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+# Okta responses counting as failures, retried for idempotent methods
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.1
+DEFAULT_BACKOFF_MAX = 2
+
+# consecutive failures opening the circuit, seconds before trying again
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET = 30
+
+class OktaUnavailable(ServiceUnavailable):
+    """
+    Okta could not be reached, or its circuit is open. Renders as 503.
+    """
+
+
+def endpoint_name(url):
+    """
+    Last path segment of url, token, userinfo, keys and so on.
+    """
+    return url.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+
+def backoff_delay(attempt, base=DEFAULT_BACKOFF, cap=DEFAULT_BACKOFF_MAX):
+    """
+    Seconds to wait before retry number attempt, from zero. Exponential with
+    full jitter so workers retrying together spread out.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Fail fast once a run of consecutive calls failed.
+
+    After threshold failures the circuit opens and calls are refused for
+    reset_timeout seconds. Then one trial call is let through, half open,
+    and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(
+        self,
+        threshold = DEFAULT_BREAKER_THRESHOLD,
+        reset_timeout = DEFAULT_BREAKER_RESET,
+        clock = time.monotonic,
+    ):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.opened = 0
+
+    def allow(self):
+        """
+        True if a call may go out now.
+        """
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    return False
+                # this caller makes the trial call
+                self.state = HALF_OPEN
+                return True
+            # closed since the check above, or a trial call is in flight
+            return self.state == CLOSED
+
+    def retry_after(self):
+        """
+        Whole seconds until a trial call is allowed.
+        """
+        opened_at = self.opened_at
+        if opened_at is None:
+            return 0
+        remaining = self.reset_timeout - (self.clock() - opened_at)
+        return max(0, math.ceil(remaining))
+
+    def record_success(self):
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+    def stats(self):
+        return dict(
+            state = self.state,
+            failures = self.failures,
+            opened = self.opened,
+        )
+
+
+class Breakers:
+    """
+    Circuit breakers by endpoint, created on first use.
+    """
+
+    def __init__(
+        self,
+        threshold = DEFAULT_BREAKER_THRESHOLD,
+        reset_timeout = DEFAULT_BREAKER_RESET,
+    ):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, endpoint):
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(endpoint)
+                if breaker is None:
+                    breaker = self._breakers[endpoint] = CircuitBreaker(
+                        threshold = self.threshold,
+                        reset_timeout = self.reset_timeout,
+                    )
+        return breaker
+
+    def check(self, endpoint):
+        """
+        Breaker for endpoint, raising OktaUnavailable while it is open.
+        """
+        breaker = self.get(endpoint)
+        if not breaker.allow():
+            raise OktaUnavailable(
+                f'Okta { endpoint } is unavailable, try again later.',
+                retry_after = breaker.retry_after(),
+            )
+        return breaker
+
+    def stats(self):
+        return {
+            endpoint: breaker.stats()
+            for endpoint, breaker in list(self._breakers.items())
+        }
+
+
+class RequestAttempts:
+    """
+    Retry, circuit breaker and rate limit decisions for one request to Okta,
+    shared by the sync and async clients. Iterating it yields the seconds to
+    wait before each attempt, the client sends and reports the outcome.
+    """
+
+    def __init__(self, client, method, url):
+        """
+        :param client:
+            `OktaClient` or `AsyncOktaClient` whose retry settings, breakers
+            and throttle apply.
+        """
+        self.client = client
+        self.endpoint = endpoint_name(url)
+        self.attempts = 1
+        if method in IDEMPOTENT_METHODS:
+            self.attempts += client.retries
+        self.attempt = 0
+        self.breaker = None
+
+    def __iter__(self):
+        client = self.client
+        for attempt in range(self.attempts):
+            self.attempt = attempt
+            wait = 0
+            if attempt:
+                client.retried += 1
+                wait = backoff_delay(
+                    attempt - 1,
+                    client.backoff,
+                    client.backoff_max,
+                )
+            if client.throttle is not None:
+                # before the breaker, a call held back is not a failure
+                wait += client.throttle.delay(self.endpoint)
+            self.breaker = client.breakers.check(self.endpoint)
+            yield wait
+
+    @property
+    def last(self):
+        return self.attempt + 1 == self.attempts
+
+    def unreachable(self, exc):
+        """
+        Count an attempt that got no response. Raises `OktaUnavailable` after
+        the last one.
+        """
+        self.breaker.record_failure()
+        if self.last:
+            raise OktaUnavailable(
+                f'Okta { self.endpoint } did not respond.'
+            ) from exc
+
+    def failed(self):
+        """
+        Count an attempt that raised and is not retried.
+        """
+        self.breaker.record_failure()
+
+    def finished(self, status):
+        """
+        Count an attempt answered with status. True when its response is
+        the one to return, a success or the last attempt's.
+        """
+        if status not in RETRY_STATUSES:
+            self.breaker.record_success()
+            return True
+        self.breaker.record_failure()
+        return self.last
@@ -0,0 +1,264 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from .okta import client_credentials
+from .okta import get_okta_client
+from .okta import get_okta_endpoints
+from .resilience import DEFAULT_BACKOFF
+from .resilience import DEFAULT_BACKOFF_MAX
+from .resilience import OktaUnavailable
+from .resilience import RETRY_STATUSES
+from .resilience import backoff_delay
+from .resilience import endpoint_name
+from .session import okta_session
+
+DEFAULT_REVOCATION_QUEUE_SIZE = 1000
+DEFAULT_REVOCATION_WORKERS = 2
+DEFAULT_REVOCATION_RETRIES = 3
+
+# seconds allowed at exit to send what is still queued
+DEFAULT_DRAIN_TIMEOUT = 5
+
+# seconds a revocation waits at most while Okta's rate limit runs low, about
+# one of its windows
+DEFAULT_REVOCATION_DEFER = 60
+
+# seconds between looks at the rate limit while deferring
+DEFER_POLL_INTERVAL = 1
+
+# session keys of the tokens revoked on logout, with their type hints
+REVOKED_TOKENS = (
+    ('_okta_refresh_token', 'refresh_token'),
+    ('_okta_access_token', 'access_token'),
+)
+
+_STOP = object()
+
+class RevocationQueue:
+    """
+    Bounded queue of tokens to revoke, drained by worker threads.
+
+    Logout only enqueues, so it never waits on Okta. Workers send one
+    /revoke request per token, the only kind Okta accepts, over the client's
+    pooled connections. Failed revocations are retried with jittered backoff.
+    While the client's throttle says Okta's rate limit for /revoke runs low,
+    workers hold revocations back for up to defer seconds. Workers start on
+    first use, again after a fork, and are drained at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        maxsize = DEFAULT_REVOCATION_QUEUE_SIZE,
+        workers = DEFAULT_REVOCATION_WORKERS,
+        retries = DEFAULT_REVOCATION_RETRIES,
+        backoff = DEFAULT_BACKOFF,
+        backoff_max = DEFAULT_BACKOFF_MAX,
+        drain_timeout = DEFAULT_DRAIN_TIMEOUT,
+        defer = DEFAULT_REVOCATION_DEFER,
+    ):
+        """
+        :param maxsize:
+            Revocations queued at most, more are dropped and counted.
+        :param workers:
+            Threads sending revocations.
+        :param retries:
+            Retries of a revocation after the first attempt.
+        :param drain_timeout:
+            Seconds `shutdown` waits for queued revocations at exit.
+        :param defer:
+            Seconds a revocation is held back at most while Okta's rate
+            limit runs low.
+        """
+        self.maxsize = maxsize
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.drain_timeout = drain_timeout
+        self.defer = defer
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._threads = []
+        self._registered = False
+        self.submitted = 0
+        self.revoked = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self.deferred = 0
+
+    def _start(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # threads and whatever they held do not survive a fork
+            self._stopping = False
+            self._queue = queue.Queue(self.maxsize)
+            self._threads = [
+                threading.Thread(
+                    target = self._work,
+                    name = f'okta-revocation-{ index }',
+                    daemon = True,
+                )
+                for index in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            if not self._registered:
+                atexit.register(self.shutdown)
+                self._registered = True
+            self._pid = pid
+
+    def submit(self, client, url, auth, token, token_type_hint):
+        """
+        Queue a token for revocation. False when the queue is full and the
+        token was dropped.
+        """
+        self._start()
+        item = (client, url, auth, token, token_type_hint)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def _work(self):
+        work_queue = self._queue
+        while True:
+            item = work_queue.get()
+            # one stop sentinel per worker
+            if item is _STOP:
+                return
+            self._revoke(*item)
+
+    def _wait_for_rate_limit(self, client, url):
+        # revocations can wait, what is left of the rate limit is for logins
+        throttle = client.throttle
+        if throttle is None:
+            return
+        endpoint = endpoint_name(url)
+        deadline = time.monotonic() + self.defer
+        deferred = False
+        while (
+            not self._stopping
+            and time.monotonic() < deadline
+            and throttle.should_defer(endpoint)
+        ):
+            deferred = True
+            time.sleep(DEFER_POLL_INTERVAL)
+        if deferred:
+            self.deferred += 1
+
+    def _revoke(self, client, url, auth, token, token_type_hint):
+        self._wait_for_rate_limit(client, url)
+        for attempt in range(1 + self.retries):
+            if attempt:
+                self.retried += 1
+                time.sleep(backoff_delay(
+                    attempt - 1,
+                    self.backoff,
+                    self.backoff_max,
+                ))
+            try:
+                response = client.post(
+                    url,
+                    data = dict(
+                        token = token,
+                        token_type_hint = token_type_hint,
+                    ),
+                    auth = auth,
+                )
+            except (OktaUnavailable, OSError):
+                continue
+            if response.status_code in RETRY_STATUSES:
+                continue
+            if response.ok:
+                self.revoked += 1
+            else:
+                # rejected client or request, sending it again will not help
+                self.failed += 1
+            return
+        self.failed += 1
+
+    def depth(self):
+        """
+        Revocations waiting in the queue.
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return 0
+        return self._queue.qsize()
+
+    def shutdown(self, timeout=None):
+        """
+        Stop the workers after they sent what is queued, waiting at most
+        timeout seconds, default drain_timeout.
+        """
+        if self._pid != os.getpid():
+            return
+        if timeout is None:
+            timeout = self.drain_timeout
+        # send what is queued now, there is no waiting out the rate limit
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                # waits while the queue is full, workers are emptying it
+                self._queue.put(
+                    _STOP,
+                    timeout = max(0, deadline - time.monotonic()),
+                )
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        with self._lock:
+            self._pid = None
+            self._threads = []
+
+    def stats(self):
+        return dict(
+            depth = self.depth(),
+            submitted = self.submitted,
+            revoked = self.revoked,
+            retried = self.retried,
+            failed = self.failed,
+            dropped = self.dropped,
+            deferred = self.deferred,
+        )
+
+
+def pop_session_tokens():
+    """
+    Remove the session's refresh and access tokens and return them with their
+    type hints. The id_token stays for the logout redirect.
+    """
+    tokens = []
+    for key, token_type_hint in REVOKED_TOKENS:
+        token = okta_session.pop(key, None)
+        if token:
+            tokens.append((token, token_type_hint))
+    okta_session.pop('_okta_expires_at', None)
+    return tokens
+
+def revoke_session_tokens(revocations, tokens):
+    """
+    Queue tokens taken from the session with `pop_session_tokens` for
+    revocation.
+    """
+    url = get_okta_endpoints().revocation
+    if not url or not tokens:
+        return
+    client = get_okta_client()
+    auth = client_credentials()
+    for token, token_type_hint in tokens:
+        revocations.submit(client, url, auth, token, token_type_hint)
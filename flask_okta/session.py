@@ -0,0 +1,106 @@
+import secrets
+import time
+
+from collections.abc import MutableMapping
+
+from flask import current_app
+from flask import g
+from flask import session
+from werkzeug.local import LocalProxy
+
+# session key of the opaque handle for server-side okta values
+HANDLE_KEY = '_okta_handle'
+
+# okta values of a login, all removed at logout
+LOGIN_KEYS = (
+    '_okta_access_token',
+    '_okta_refresh_token',
+    '_okta_expires_at',
+    '_okta_id_token',
+    '_okta_tenant',
+    '_okta_claims',
+    '_okta_claims_at',
+    '_okta_state',
+)
+
+class StoredOktaSession(MutableMapping):
+    """
+    Flask-Okta session values kept in a token store. Only an opaque handle is
+    written to the Flask session. Every change is written through to the
+    store.
+    """
+
+    def __init__(self, store, handle, data, ttl):
+        self.store = store
+        self.handle = handle
+        self.ttl = ttl
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self.save()
+
+    def __delitem__(self, key):
+        del self._data[key]
+        self.save()
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def save(self):
+        if self.handle is None:
+            self.handle = session[HANDLE_KEY] = secrets.token_urlsafe(24)
+        self.store.set(self.handle, self._data, time.time() + self.ttl)
+
+    def clear(self):
+        self._data = {}
+        if self.handle is not None:
+            self.store.delete(self.handle)
+            session.pop(HANDLE_KEY, None)
+            self.handle = None
+
+
+def get_okta_session():
+    """
+    Mapping of Flask-Okta values for the current session. The Flask session
+    itself without a token store.
+    """
+    okta = current_app.extensions['okta']
+    store = okta.token_store
+    if store is None:
+        return session._get_current_object()
+
+    okta_session = g.get('_okta_session')
+    if okta_session is None:
+        handle = session.get(HANDLE_KEY)
+        data = store.get(handle) if handle else None
+        if data is None:
+            handle = None
+            data = {}
+        okta_session = g._okta_session = StoredOktaSession(
+            store,
+            handle,
+            data,
+            current_app.config['OKTA_TOKEN_STORE_TTL'],
+        )
+    return okta_session
+
+def end_okta_session():
+    """
+    Remove the current login's tokens and claims. With a token store the
+    session's entry is deleted from the store.
+    """
+    current = get_okta_session()
+    if isinstance(current, StoredOktaSession):
+        current.clear()
+    else:
+        for key in LOGIN_KEYS:
+            current.pop(key, None)
+
+okta_session = LocalProxy(get_okta_session)
@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+from dataclasses import field
+from types import MappingProxyType
+from urllib.parse import urlencode
+
+# https://developer.okta.com/docs/reference/api/oidc/#reserved-scopes
+RESERVED_SCOPES = frozenset([
+    'openid',
+    'profile',
+    'email',
+    'address',
+    'phone',
+    'offline_access',
+    'groups',
+])
+
+DEFAULT_SCOPE = 'openid email profile'
+
+def validate_scope(scope):
+    """
+    Raise ValueError unless scope is space separated reserved scopes
+    including openid.
+    """
+    scope_set = set(scope.split())
+    if 'openid' not in scope_set:
+        raise ValueError('openid is required in scope.')
+    unknown_scopes = scope_set.difference(RESERVED_SCOPES)
+    if unknown_scopes:
+        raise ValueError(f'Unknown scope values { sorted(unknown_scopes) }.')
+
+@dataclass(frozen=True)
+class AuthorizeSettings:
+    """
+    Validated parameters shared by a tenant's authorize requests, with the
+    URL they encode to computed once. Redirects append their own state, code
+    challenge and nonce.
+    """
+    authorization: str
+    client_id: str
+    redirect_uri: str
+    scope: str = DEFAULT_SCOPE
+    response_type: str = 'code'
+    response_mode: str = 'query'
+    code_challenge_method: str = 'S256'
+    query: MappingProxyType = field(init=False, repr=False, compare=False)
+    url_prefix: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # real exceptions, these checks must survive python -O
+        validate_scope(self.scope)
+        if self.response_type != 'code':
+            raise ValueError('Only response type "code" supported.')
+        if self.response_mode != 'query':
+            raise ValueError('Only response mode "query" supported.')
+        if self.code_challenge_method != 'S256':
+            raise ValueError('Only code challenge method "S256" supported.')
+        query = dict(
+            client_id = self.client_id,
+            redirect_uri = self.redirect_uri,
+            response_type = self.response_type,
+            response_mode = self.response_mode,
+            scope = self.scope,
+            code_challenge_method = self.code_challenge_method,
+        )
+        object.__setattr__(self, 'query', MappingProxyType(query))
+        object.__setattr__(
+            self,
+            'url_prefix',
+            f'{ self.authorization }?{ urlencode(query) }',
+        )
+
+    def url(self, state, code_challenge, nonce):
+        """
+        Authorize URL for one redirect. The values are url-safe base64 and
+        need no quoting.
+        """
+        return (
+            f'{ self.url_prefix }&state={ state }'
+            f'&code_challenge={ code_challenge }&nonce={ nonce }'
+        )
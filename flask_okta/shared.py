@@ -0,0 +1,188 @@
+import secrets
+import threading
+import time
+
+from collections import Counter
+
+# seconds one worker may hold the right to fill a key, a crashed filler
+# blocks others no longer than this
+DEFAULT_FILL_TIMEOUT = 10
+
+# seconds an expired entry is still served while another worker refills it,
+# or when refilling fails
+DEFAULT_STALE_TTL = 300
+
+# seconds between looks at the store while waiting for another worker's fill
+DEFAULT_POLL_INTERVAL = 0.05
+
+class SharedCache:
+    """
+    Cache in an `flask_okta.store.ExpiringStore`, shared by every worker on
+    a host with a SQLite store.
+
+    Entries live for the ttl they were set with. `get_or_fill` fills a
+    missing or expired entry in one worker at a time: the first takes a fill
+    lock in the store, the rest serve the expired entry for up to stale_ttl
+    more seconds or, without one, wait for the fill. Values must be JSON
+    serializable.
+    """
+
+    def __init__(
+        self,
+        store,
+        prefix = '',
+        ttl = 300,
+        stale_ttl = DEFAULT_STALE_TTL,
+        fill_timeout = DEFAULT_FILL_TIMEOUT,
+        poll_interval = DEFAULT_POLL_INTERVAL,
+        clock = time.time,
+    ):
+        """
+        :param store:
+            ExpiringStore holding the entries and fill locks.
+        :param prefix:
+            Prefix of this cache's keys, to share one store.
+        :param ttl:
+            Default seconds an entry is fresh.
+        :param stale_ttl:
+            Seconds an expired entry may still be served by `get_or_fill`.
+            `get` never serves expired entries.
+        :param fill_timeout:
+            Seconds a fill lock is held at most.
+        """
+        self.store = store
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.fill_timeout = fill_timeout
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def _entry(self, key, accept=None):
+        # [fresh until, value], kept in the store until stale_ttl after
+        entry = self.store.get(self.prefix + key)
+        if entry is None:
+            return None, False
+        fresh_until, value = entry
+        if accept is not None and not accept(value):
+            return None, False
+        return value, fresh_until > self.clock()
+
+    def get(self, key, default=None):
+        """
+        Fresh value of key, default when missing or expired.
+        """
+        value, fresh = self._entry(key)
+        if not fresh:
+            self.count('miss')
+            return default
+        self.count('hit')
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value for ttl seconds, or the cache default. A ttl of zero or
+        less is not stored.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        fresh_until = self.clock() + ttl
+        self.store.set(
+            self.prefix + key,
+            [fresh_until, value],
+            fresh_until + self.stale_ttl,
+        )
+
+    def pop(self, key, default=None):
+        value, fresh = self._entry(key)
+        self.store.delete(self.prefix + key)
+        return value if fresh else default
+
+    def claim(self, key, seconds):
+        """
+        True for the one caller, across workers, claiming key within
+        seconds of the last successful claim.
+        """
+        return self.store.add(
+            f'{ self.prefix }{ key }:claim',
+            True,
+            self.clock() + seconds,
+        )
+
+    def get_or_fill(self, key, fill, accept=None):
+        """
+        Value of key, calling fill once across workers when it is missing or
+        expired.
+
+        :param fill:
+            Callable returning the new value and its ttl. When it raises, an
+            expired value is served if there is one.
+        :param accept:
+            Optional callable, False for a value that must be refilled even
+            though fresh, like a key set missing a new signing key.
+        """
+        value, fresh = self._entry(key, accept)
+        if fresh:
+            self.count('hit')
+            return value
+        lock_key = f'{ self.prefix }{ key }:fill'
+        token = secrets.token_hex(8)
+        waited = False
+        while True:
+            if self.store.add(
+                lock_key,
+                token,
+                self.clock() + self.fill_timeout,
+            ):
+                try:
+                    return self._fill(key, fill, accept)
+                finally:
+                    # the lock may have timed out and gone to another worker
+                    if self.store.get(lock_key) == token:
+                        self.store.delete(lock_key)
+            if value is not None:
+                # another worker is filling, the expired value will do
+                self.count('stale')
+                return value
+            if not waited:
+                self.count('wait')
+                waited = True
+            time.sleep(self.poll_interval)
+            value, fresh = self._entry(key, accept)
+            if fresh:
+                return value
+
+    def _fill(self, key, fill, accept):
+        # filled by another worker between our look and the lock
+        value, fresh = self._entry(key, accept)
+        if fresh:
+            self.count('hit')
+            return value
+        try:
+            new_value, ttl = fill()
+        except Exception:
+            if value is None:
+                raise
+            self.count('stale_error')
+            return value
+        self.set(key, new_value, ttl)
+        self.count('fill')
+        return new_value
+
+    def stats(self):
+        """
+        Counters of this process, for monitoring.
+        """
+        with self._lock:
+            counts = dict(self.counts)
+        for outcome in ('hit', 'miss', 'fill', 'stale', 'wait', 'stale_error'):
+            counts.setdefault(outcome, 0)
+        return counts
@@ -0,0 +1,12 @@
+from blinker import Namespace
+
+okta_signals = Namespace()
+
+# sent with phase and duration, in seconds, for each timed part of the flow:
+# token, userinfo, refresh, jwks, after_authorization, session_write and
+# route.<endpoint>
+phase_timed = okta_signals.signal('phase-timed')
+
+# sent with method, url, status, duration and size, the response body bytes,
+# for every request to Okta
+okta_response = okta_signals.signal('okta-response')
@@ -0,0 +1,127 @@
+import threading
+
+from collections import Counter
+
+from flask import current_app
+from flask import session
+from itsdangerous import BadSignature
+from itsdangerous import SignatureExpired
+from itsdangerous import URLSafeTimedSerializer
+
+from .users import claims_version
+
+# session key of the signed user snapshot
+SNAPSHOT_KEY = '_okta_user'
+
+SNAPSHOT_SALT = 'flask-okta-user-snapshot'
+
+# seconds a snapshot is trusted, bounds how long other workers serve a user
+# changed elsewhere
+DEFAULT_SNAPSHOT_TTL = 300
+
+class UserSnapshots:
+    """
+    Signed copy of the current user's stored claims in the session.
+
+    Requests that accept a snapshot rebuild the user from it instead of
+    loading the user from the user store. A snapshot carries the
+    `claims_version` of its claims and is refused once this process stored,
+    loaded or deleted other claims for the user, or once it is older than
+    max_age. The session is only written when its snapshot is missing or no
+    longer matches the stored claims.
+    """
+
+    def __init__(self, user_store, max_age=DEFAULT_SNAPSHOT_TTL):
+        """
+        :param user_store:
+            `flask_okta.users.UserStore` whose versions snapshots follow.
+        :param max_age:
+            Seconds a snapshot is trusted.
+        """
+        self.user_store = user_store
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._serializers = {}
+        self.counts = Counter()
+
+    def serializer(self):
+        """
+        Serializer signing with the current app's secret key.
+        """
+        secret_key = current_app.secret_key
+        serializer = self._serializers.get(secret_key)
+        if serializer is None:
+            serializer = self._serializers[secret_key] = (
+                URLSafeTimedSerializer(secret_key, salt=SNAPSHOT_SALT)
+            )
+        return serializer
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def _read(self):
+        # outcome and [user id, version, claims] of the session's snapshot
+        signed = session.get(SNAPSHOT_KEY)
+        if signed is None:
+            return 'miss', None
+        try:
+            snapshot = self.serializer().loads(signed, max_age=self.max_age)
+        except SignatureExpired:
+            return 'expired', None
+        except BadSignature:
+            return 'invalid', None
+        return 'valid', snapshot
+
+    def load(self, user_id):
+        """
+        Claims of user_id from the session's snapshot, None without a
+        valid, current snapshot of that user.
+        """
+        outcome, snapshot = self._read()
+        if snapshot is None:
+            self.count(outcome)
+            return None
+        snapshot_user_id, version, claims = snapshot
+        known = self.user_store.version(user_id)
+        if (
+            snapshot_user_id != user_id
+            or (known is not None and known != version)
+        ):
+            self.count('stale')
+            return None
+        self.count('hit')
+        return claims
+
+    def save(self, user_id, claims):
+        """
+        Snapshot claims of user_id, just loaded from the user store, unless
+        the session holds a valid snapshot of them already.
+        """
+        version = claims_version(claims)
+        _, snapshot = self._read()
+        if snapshot is not None and snapshot[:2] == [user_id, version]:
+            self.count('current')
+            return
+        session[SNAPSHOT_KEY] = self.serializer().dumps(
+            [user_id, version, claims]
+        )
+        self.count('saved')
+
+    def clear(self):
+        session.pop(SNAPSHOT_KEY, None)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        for outcome in (
+            'hit',
+            'miss',
+            'expired',
+            'invalid',
+            'stale',
+            'saved',
+            'current',
+        ):
+            counts.setdefault(outcome, 0)
+        return counts
@@ -0,0 +1,250 @@
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+class ExpiringStore:
+    """
+    Key-value store whose entries expire at a unix timestamp. Values must be
+    JSON serializable so every backend can hold them.
+    """
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, expires_at):
+        raise NotImplementedError
+
+    def add(self, key, value, expires_at):
+        """
+        Set key only if it has no live entry, atomically. True when set.
+        """
+        raise NotImplementedError
+
+    def pop(self, key, default=None):
+        """
+        Remove key and return its live value, atomically, so only one caller
+        gets it. default when missing or expired.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class MemoryStore(ExpiringStore):
+    """
+    Bounded in-process store, least recently used entries are evicted first.
+    Only visible to the worker process that wrote it.
+    """
+
+    def __init__(self, maxsize=10000, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, expires_at):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > self.clock():
+                return False
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is None or item[0] <= self.clock():
+            return default
+        return item[1]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteConnections:
+    """
+    Connections to a SQLite file shared by every worker on a host, one per
+    thread and reopened after a fork. WAL lets workers read while one writes.
+    """
+
+    def __init__(self, path, **connect_options):
+        """
+        :param connect_options:
+            Further `sqlite3.connect` arguments.
+        """
+        self.path = path
+        self.connect_options = connect_options
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connect(self):
+        # imported here, only SQLite backends need it
+        import sqlite3
+
+        connection = sqlite3.connect(
+            self.path,
+            timeout = 5,
+            **self.connect_options,
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def get(self):
+        """
+        Connection for the current thread, reopened after a fork.
+        """
+        local = self._local
+        pid = os.getpid()
+        if getattr(local, 'pid', None) != pid:
+            local.connection = self.connect()
+            local.pid = pid
+        return local.connection
+
+
+class SQLiteStore(ExpiringStore):
+    """
+    Store in a SQLite file shared by every worker on a host. Expired rows are
+    purged at most once per `purge_interval` seconds, on write.
+    """
+
+    def __init__(
+        self,
+        path,
+        table = 'flask_okta_store',
+        purge_interval = 60,
+        clock = time.time,
+    ):
+        self.path = path
+        self.table = table
+        self.purge_interval = purge_interval
+        self.clock = clock
+        self.connections = SQLiteConnections(path)
+        self._purged_at = 0
+        with self.connection as connection:
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS { table } ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL)'
+            )
+
+    @property
+    def connection(self):
+        return self.connections.get()
+
+    def get(self, key, default=None):
+        row = self.connection.execute(
+            f'SELECT value FROM { self.table }'
+            ' WHERE key = ? AND expires_at > ?',
+            (key, self.clock()),
+        ).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value, expires_at):
+        now = self.clock()
+        with self.connection as connection:
+            connection.execute(
+                f'INSERT OR REPLACE INTO { self.table }'
+                ' (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at),
+            )
+            if now - self._purged_at > self.purge_interval:
+                self._purged_at = now
+                connection.execute(
+                    f'DELETE FROM { self.table } WHERE expires_at <= ?',
+                    (now,),
+                )
+
+    def add(self, key, value, expires_at):
+        with self.connection as connection:
+            # one statement, so two workers cannot both see the key free
+            cursor = connection.execute(
+                f'INSERT INTO { self.table } (key, value, expires_at)'
+                ' VALUES (?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET'
+                ' value = excluded.value, expires_at = excluded.expires_at'
+                f' WHERE { self.table }.expires_at <= ?',
+                (key, json.dumps(value), expires_at, self.clock()),
+            )
+            return cursor.rowcount == 1
+
+    def pop(self, key, default=None):
+        with self.connection as connection:
+            # one statement, so two workers cannot both take the entry
+            row = connection.execute(
+                f'DELETE FROM { self.table } WHERE key = ?'
+                ' RETURNING value, expires_at',
+                (key,),
+            ).fetchone()
+        if row is None or row[1] <= self.clock():
+            return default
+        return json.loads(row[0])
+
+    def delete(self, key):
+        with self.connection as connection:
+            connection.execute(
+                f'DELETE FROM { self.table } WHERE key = ?',
+                (key,),
+            )
+
+
+def create_store(backend, path=None, table=None, maxsize=10000):
+    """
+    Store from a configuration value.
+
+    :param backend:
+        'memory', 'sqlite', an ExpiringStore instance, or None for no store.
+    :param path:
+        SQLite database file, required for 'sqlite'.
+    :param table:
+        SQLite table name, to share one file between stores.
+    :param maxsize:
+        Entry limit for 'memory'.
+    """
+    if backend is None or isinstance(backend, ExpiringStore):
+        return backend
+    if backend == 'memory':
+        return MemoryStore(maxsize=maxsize)
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError('sqlite store requires a path.')
+        kwargs = {}
+        if table:
+            kwargs['table'] = table
+        return SQLiteStore(path, **kwargs)
+    raise ValueError(f'Unknown store backend { backend!r}.')
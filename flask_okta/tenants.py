@@ -0,0 +1,411 @@
+import hashlib
+import os
+import threading
+import time
+
+from collections import ChainMap
+from collections import OrderedDict
+
+from flask import request
+
+from .aio import AsyncOktaClient
+from .cache import SingleFlight
+from .client import DEFAULT_POOL_CONNECTIONS
+from .client import DEFAULT_POOL_MAXSIZE
+from .client import OktaClient
+from .resilience import DEFAULT_BACKOFF
+from .resilience import DEFAULT_BACKOFF_MAX
+from .resilience import DEFAULT_BREAKER_RESET
+from .resilience import DEFAULT_BREAKER_THRESHOLD
+from .resilience import DEFAULT_CONNECT_TIMEOUT
+from .resilience import DEFAULT_READ_TIMEOUT
+from .resilience import DEFAULT_RETRIES
+from .discovery import load_provider_metadata
+from .discovery import resolve_endpoints
+from .jwks import JWKSCache
+from .jwks import jwt
+from .jwks import require_jwt
+from .settings import AuthorizeSettings
+from .settings import DEFAULT_SCOPE
+from .throttle import DEFAULT_DEFER_BELOW
+from .throttle import DEFAULT_MAX_WAIT
+from .throttle import DEFAULT_PACE_BELOW
+from .throttle import OktaThrottle
+
+DEFAULT_MAX_TENANTS = 256
+
+# seconds a tenant is kept after its last request
+DEFAULT_TENANT_IDLE_TTL = 3600
+
+# distinct authorize parameter sets a tenant keeps encoded
+MAX_AUTHORIZE_SETTINGS = 32
+
+class OktaTenant:
+    """
+    Everything specific to one Okta org or authorization server: client
+    credentials, discovered endpoints, signing keys and connection pools.
+    """
+
+    __slots__ = (
+        'name',
+        'client_id',
+        'client_secret',
+        'redirect_uri',
+        'post_logout_redirect_uri',
+        'audience',
+        'client',
+        'async_client',
+        'throttle',
+        'metadata',
+        'endpoints',
+        'jwks',
+        'last_used',
+        '_authorize_settings',
+    )
+
+    def __init__(
+        self,
+        name,
+        client_id,
+        client_secret,
+        redirect_uri,
+        post_logout_redirect_uri,
+        audience,
+        client,
+        async_client,
+        metadata,
+        endpoints,
+        jwks,
+        throttle = None,
+    ):
+        self.name = name
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.post_logout_redirect_uri = post_logout_redirect_uri
+        self.audience = audience
+        self.client = client
+        self.async_client = async_client
+        self.throttle = throttle
+        self.metadata = metadata
+        self.endpoints = endpoints
+        self.jwks = jwks
+        self.last_used = time.monotonic()
+        self._authorize_settings = {}
+
+    def __repr__(self):
+        return f'<OktaTenant { self.name!r} { self.endpoints.issuer!r}>'
+
+    def authorize_settings(
+        self,
+        scope = DEFAULT_SCOPE,
+        response_type = 'code',
+        response_mode = 'query',
+        code_challenge_method = 'S256',
+    ):
+        """
+        Validated `flask_okta.settings.AuthorizeSettings` for these
+        parameters, built once per parameter set. Raises ValueError for
+        unsupported parameters.
+        """
+        key = (scope, response_type, response_mode, code_challenge_method)
+        settings = self._authorize_settings.get(key)
+        if settings is None:
+            settings = AuthorizeSettings(
+                authorization = self.endpoints.authorization,
+                client_id = self.client_id,
+                redirect_uri = self.redirect_uri,
+                scope = scope,
+                response_type = response_type,
+                response_mode = response_mode,
+                code_challenge_method = code_challenge_method,
+            )
+            # parameters normally come from config, bounded all the same
+            if len(self._authorize_settings) < MAX_AUTHORIZE_SETTINGS:
+                self._authorize_settings[key] = settings
+        return settings
+
+
+def create_tenant(
+    name,
+    config,
+    observer = None,
+    discovery_cache = None,
+    shared_cache = None,
+):
+    """
+    Build a tenant from OKTA_* configuration, running discovery when
+    OKTA_ISSUER is set.
+
+    :param config:
+        Mapping of OKTA_* keys, a Flask config or tenant overrides chained
+        over it.
+    :param observer:
+        See `flask_okta.client.OktaClient`.
+    :param discovery_cache:
+        Path discovery metadata is cached at, None to not cache.
+    :param shared_cache:
+        `flask_okta.shared.SharedCache` for discovery metadata and signing
+        keys, shared by the workers on a host. Takes over from
+        discovery_cache.
+    """
+    pool_maxsize = config.get('OKTA_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE)
+    keep_alive = config.get('OKTA_KEEP_ALIVE', True)
+    # timeouts, retries and circuit breakers, same for both clients
+    resilience = dict(
+        connect_timeout = config.get(
+            'OKTA_CONNECT_TIMEOUT',
+            DEFAULT_CONNECT_TIMEOUT,
+        ),
+        read_timeout = config.get('OKTA_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+        retries = config.get('OKTA_RETRIES', DEFAULT_RETRIES),
+        backoff = config.get('OKTA_RETRY_BACKOFF', DEFAULT_BACKOFF),
+        backoff_max = config.get(
+            'OKTA_RETRY_BACKOFF_MAX',
+            DEFAULT_BACKOFF_MAX,
+        ),
+        breaker_threshold = config.get(
+            'OKTA_BREAKER_THRESHOLD',
+            DEFAULT_BREAKER_THRESHOLD,
+        ),
+        breaker_reset = config.get(
+            'OKTA_BREAKER_RESET',
+            DEFAULT_BREAKER_RESET,
+        ),
+    )
+    # stand-in for the network in tests, see flask_okta.testing
+    transport = config.get('OKTA_TRANSPORT')
+    # Okta's rate limits are per org, both clients pace by one budget
+    throttle = None
+    if config.get('OKTA_THROTTLE', True):
+        throttle = OktaThrottle(
+            pace_below = config.get(
+                'OKTA_THROTTLE_PACE_BELOW',
+                DEFAULT_PACE_BELOW,
+            ),
+            defer_below = config.get(
+                'OKTA_THROTTLE_DEFER_BELOW',
+                DEFAULT_DEFER_BELOW,
+            ),
+            max_wait = config.get('OKTA_THROTTLE_MAX_WAIT', DEFAULT_MAX_WAIT),
+        )
+    client = OktaClient(
+        pool_connections = config.get(
+            'OKTA_POOL_CONNECTIONS',
+            DEFAULT_POOL_CONNECTIONS,
+        ),
+        pool_maxsize = pool_maxsize,
+        keep_alive = keep_alive,
+        observer = observer,
+        transport = transport,
+        throttle = throttle,
+        **resilience,
+    )
+    async_client = AsyncOktaClient(
+        pool_maxsize = pool_maxsize,
+        keep_alive = keep_alive,
+        observer = observer,
+        transport = transport,
+        throttle = throttle,
+        **resilience,
+    )
+
+    metadata = None
+    issuer = config.get('OKTA_ISSUER')
+    if issuer and config.get('OKTA_DISCOVERY', True):
+        metadata = load_provider_metadata(
+            client,
+            issuer,
+            cache_path = discovery_cache,
+            shared_cache = shared_cache,
+        )
+    endpoints = resolve_endpoints(config, metadata)
+
+    if config.get('OKTA_USERINFO_FROM_ID_TOKEN'):
+        require_jwt()
+        if not endpoints.issuer:
+            raise RuntimeError(
+                'OKTA_USERINFO_FROM_ID_TOKEN requires OKTA_ISSUER.')
+    jwks = None
+    if endpoints.jwks and jwt is not None:
+        jwks = JWKSCache(
+            client,
+            endpoints.jwks,
+            shared_cache = shared_cache,
+        )
+
+    tenant = OktaTenant(
+        name = name,
+        client_id = config.get('OKTA_CLIENT_ID'),
+        client_secret = config.get('OKTA_CLIENT_SECRET'),
+        redirect_uri = config.get('OKTA_REDIRECT_URI'),
+        post_logout_redirect_uri = config.get(
+            'OKTA_POST_LOGOUT_REDIRECT_URI'
+        ),
+        audience = config.get('OKTA_AUDIENCE', 'api://default'),
+        client = client,
+        async_client = async_client,
+        metadata = metadata,
+        endpoints = endpoints,
+        jwks = jwks,
+        throttle = throttle,
+    )
+    # fail at startup, not on the first login, for a bad OKTA_SCOPE
+    tenant.authorize_settings(config.get('OKTA_SCOPE', DEFAULT_SCOPE))
+    return tenant
+
+def tenant_from_host():
+    """
+    Tenant name from the request's Host header.
+    """
+    return request.host.lower()
+
+def tenant_from_path():
+    """
+    Tenant name from the first segment of the request path.
+    """
+    return request.path.split('/', 2)[1] or None
+
+TENANT_RESOLVERS = dict(
+    host = tenant_from_host,
+    path = tenant_from_path,
+)
+
+class TenantRegistry:
+    """
+    Tenants created on first use and kept while in use. Least recently used
+    tenants are evicted once there are more than maxsize, and tenants idle
+    for idle_ttl seconds are evicted on the next lookup.
+    """
+
+    def __init__(
+        self,
+        app,
+        tenants,
+        resolver = tenant_from_host,
+        observer = None,
+        maxsize = DEFAULT_MAX_TENANTS,
+        idle_ttl = DEFAULT_TENANT_IDLE_TTL,
+        clock = time.monotonic,
+        shared_cache = None,
+    ):
+        """
+        :param app:
+            Flask app whose OKTA_* configuration tenants override.
+        :param tenants:
+            Mapping of tenant name to OKTA_* overrides, or callable returning
+            the overrides for a name, None for unknown tenants.
+        :param resolver:
+            Callable returning the current request's tenant name.
+        :param shared_cache:
+            See `create_tenant`.
+        """
+        self.config = app.config
+        self.instance_path = app.instance_path
+        self.tenants = tenants
+        self.resolver = resolver
+        self.observer = observer
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self.shared_cache = shared_cache
+        self._tenants = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.created = 0
+        self.evicted = 0
+
+    def overrides(self, name):
+        if callable(self.tenants):
+            return self.tenants(name)
+        return self.tenants.get(name)
+
+    def discovery_cache(self, name, overrides):
+        """
+        Discovery cache file for a tenant, one per tenant next to the app's.
+        """
+        if 'OKTA_DISCOVERY_CACHE' in overrides:
+            return overrides['OKTA_DISCOVERY_CACHE']
+        if not self.config.get('OKTA_DISCOVERY_CACHE'):
+            return None
+        digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+        return os.path.join(
+            self.instance_path,
+            f'okta-discovery-{ digest }.json',
+        )
+
+    def get(self, name):
+        """
+        Tenant by name, created on first use. None for unknown tenants.
+        """
+        now = self.clock()
+        with self._lock:
+            self._evict(now)
+            tenant = self._tenants.get(name)
+            if tenant is not None:
+                tenant.last_used = now
+                self._tenants.move_to_end(name)
+                return tenant
+        # concurrent first requests for a tenant share one discovery
+        return self._flight.do(name, lambda: self._create(name))
+
+    def _create(self, name):
+        with self._lock:
+            tenant = self._tenants.get(name)
+        if tenant is not None:
+            return tenant
+        overrides = self.overrides(name)
+        if overrides is None:
+            return None
+        tenant = create_tenant(
+            name,
+            ChainMap(overrides, self.config),
+            observer = self.observer,
+            discovery_cache = self.discovery_cache(name, overrides),
+            shared_cache = self.shared_cache,
+        )
+        now = self.clock()
+        tenant.last_used = now
+        with self._lock:
+            self._tenants[name] = tenant
+            self.created += 1
+            self._evict(now)
+        return tenant
+
+    def _evict(self, now):
+        # least recently used first, so stop at the first keeper
+        tenants = self._tenants
+        while tenants:
+            name, tenant = next(iter(tenants.items()))
+            if (
+                len(tenants) <= self.maxsize
+                and now - tenant.last_used <= self.idle_ttl
+            ):
+                break
+            # dropped rather than closed, a request may still be using its
+            # pool, connections close when it is collected
+            del tenants[name]
+            self.evicted += 1
+
+    def loaded(self):
+        """
+        Tenants currently kept, least recently used first.
+        """
+        with self._lock:
+            return list(self._tenants.values())
+
+    def resolve(self):
+        """
+        Tenant of the current request, None for unknown tenants.
+        """
+        name = self.resolver()
+        return self.get(name) if name else None
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                size = len(self._tenants),
+                maxsize = self.maxsize,
+                created = self.created,
+                evicted = self.evicted,
+            )
@@ -0,0 +1,494 @@
+"""
+In-process stand-in for Okta, for test suites.
+
+    fake = FakeOkta()
+    app.config.update(fake.app_config())
+    okta = OktaManager(app)
+    response = fake.login(app.test_client())
+
+`FakeOkta` serves discovery, authorize, token, userinfo, keys, revoke and
+logout with PKCE checks and RS256 signed tokens. Set as OKTA_TRANSPORT, the
+Okta clients send every request to it instead of opening sockets. Requires
+PyJWT with cryptography, and httpx for the async clients.
+"""
+import base64
+import hashlib
+import json
+import secrets
+import threading
+import time
+
+from http import HTTPStatus
+from urllib.parse import parse_qs
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+import jwt
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import url_for
+from jwt.algorithms import RSAAlgorithm
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_ISSUER = 'https://okta.test/oauth2/default'
+
+DEFAULT_USERINFO = dict(
+    sub = '00utest0000000000000',
+    name = 'Test User',
+    email = 'test.user@example.com',
+    email_verified = True,
+    locale = 'en-US',
+)
+
+RATE_LIMIT_SUMMARY = (
+    'API call exceeded rate limit due to too many requests.'
+)
+
+_key_lock = threading.Lock()
+_signing_key = None
+
+def signing_key():
+    """
+    RSA key signing fake tokens, generated once per process.
+    """
+    global _signing_key
+    if _signing_key is None:
+        with _key_lock:
+            if _signing_key is None:
+                _signing_key = rsa.generate_private_key(
+                    public_exponent = 65537,
+                    key_size = 2048,
+                )
+    return _signing_key
+
+def code_challenge(code_verifier):
+    digest = hashlib.sha256(code_verifier.encode()).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+
+
+class FakeOkta:
+    """
+    Okta authorization server answering in process.
+
+    Requests made are recorded in `requests` as (method, path) pairs, and
+    revoked tokens in `revoked`, for assertions.
+    """
+
+    def __init__(
+        self,
+        client_id = 'test-client-id',
+        client_secret = 'test-client-secret',
+        issuer = DEFAULT_ISSUER,
+        userinfo = None,
+        audience = 'api://default',
+        token_lifetime = 3600,
+        rate_limit = None,
+        rate_limit_window = 60,
+    ):
+        """
+        :param userinfo:
+            Claims of the user logging in, default `DEFAULT_USERINFO`.
+            `login` takes claims for other users.
+        :param audience:
+            Audience of issued access tokens.
+        :param rate_limit:
+            Requests per endpoint and window, answered with Okta's
+            `X-Rate-Limit-*` headers and 429 once spent. None for no limit.
+        :param rate_limit_window:
+            Seconds of a rate limit window.
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.issuer = issuer.rstrip('/')
+        self.userinfo = dict(userinfo or DEFAULT_USERINFO)
+        self.audience = audience
+        self.token_lifetime = token_lifetime
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.key = signing_key()
+        self.kid = hashlib.sha256(self.issuer.encode()).hexdigest()[:16]
+        self._lock = threading.Lock()
+        # authorization code -> authorize parameters and userinfo
+        self.codes = {}
+        # refresh token -> scope and userinfo
+        self.refresh_tokens = {}
+        # sub -> userinfo of users who logged in
+        self.users = {}
+        self.revoked = set()
+        self.requests = []
+        # path -> unix time its window resets and requests made in it
+        self.rate_limit_windows = {}
+
+    def app_config(self, redirect_uri=None):
+        """
+        OKTA_* configuration pointing an app at this fake.
+
+        :param redirect_uri:
+            Callback URL, default the blueprint's on the test client's host.
+        """
+        return dict(
+            OKTA_ISSUER = self.issuer,
+            OKTA_CLIENT_ID = self.client_id,
+            OKTA_CLIENT_SECRET = self.client_secret,
+            OKTA_REDIRECT_URI = (
+                redirect_uri
+                or 'http://localhost/authorization-code/callback'
+            ),
+            OKTA_DISCOVERY_CACHE = None,
+            OKTA_TRANSPORT = self,
+        )
+
+    # transports
+
+    def requests_adapter(self):
+        """
+        `requests` transport adapter answering from this fake.
+        """
+        return FakeOktaAdapter(self)
+
+    def httpx_transport(self):
+        """
+        `httpx` transport answering from this fake.
+        """
+        import httpx
+
+        def handle(request):
+            status, headers, body = self.handle(
+                request.method,
+                str(request.url),
+                request.headers,
+                request.content,
+            )
+            return httpx.Response(status, headers=headers, content=body)
+
+        return httpx.MockTransport(handle)
+
+    # flows
+
+    def login(self, client, userinfo=None, next_url=None, login_path=None):
+        """
+        Sign in through the app's okta blueprint with a Flask test client and
+        return the callback's response.
+
+        :param userinfo:
+            Claims of the user signing in, default this fake's userinfo.
+        :param next_url:
+            Page to return to after login.
+        :param login_path:
+            Path redirecting to Okta, default the blueprint's.
+        """
+        app = client.application
+        if login_path is None:
+            blueprint_name = app.config['OKTA_BLUEPRINT_NAME']
+            with app.test_request_context():
+                login_path = url_for(
+                    f'{ blueprint_name }.redirect_for_okta_login'
+                )
+        response = client.get(
+            login_path,
+            query_string = {'next': next_url} if next_url else None,
+        )
+        if response.status_code != 302:
+            raise AssertionError(
+                f'{ login_path } answered { response.status_code }, not a '
+                f'redirect to Okta. Is OKTA_DEBUG on?'
+            )
+        callback = urlsplit(self.authorize(response.location, userinfo))
+        return client.get(callback.path, query_string=callback.query)
+
+    def authorize(self, url, userinfo=None):
+        """
+        Answer a redirect to the authorize endpoint as a signed in user
+        would, returning the URL Okta redirects back to.
+        """
+        query = {
+            key: values[0]
+            for key, values in parse_qs(urlsplit(url).query).items()
+        }
+        if query.get('client_id') != self.client_id:
+            raise AssertionError('Unknown client_id.')
+        if (
+            query.get('response_type') != 'code'
+            or query.get('code_challenge_method') != 'S256'
+            or not query.get('code_challenge')
+            or not query.get('redirect_uri')
+            or 'openid' not in query.get('scope', '').split()
+        ):
+            raise AssertionError(f'Invalid authorize request { query }.')
+        code = secrets.token_urlsafe(32)
+        with self._lock:
+            self.codes[code] = dict(
+                query,
+                userinfo = dict(userinfo or self.userinfo),
+            )
+        return query['redirect_uri'] + '?' + urlencode(dict(
+            code = code,
+            state = query.get('state', ''),
+        ))
+
+    # endpoints
+
+    def handle(self, method, url, headers, body):
+        """
+        Answer one request. Returns status, headers and body bytes.
+        """
+        parts = urlsplit(url)
+        origin = f'{ parts.scheme }://{ parts.netloc }'
+        issuer = urlsplit(self.issuer)
+        path = parts.path
+        if origin != f'{ issuer.scheme }://{ issuer.netloc }':
+            return self.json(dict(error='unknown_host'), 404)
+        path = path.removeprefix(issuer.path)
+        with self._lock:
+            self.requests.append((method, path))
+        if isinstance(body, str):
+            body = body.encode()
+        form = {
+            key: values[0]
+            for key, values in parse_qs((body or b'').decode()).items()
+        }
+        query = {
+            key: values[0] for key, values in parse_qs(parts.query).items()
+        }
+        routes = {
+            ('GET', '/.well-known/openid-configuration'): self.discovery,
+            ('GET', '/v1/keys'): self.keys,
+            ('GET', '/v1/authorize'): self.authorize_endpoint,
+            ('POST', '/v1/token'): self.token,
+            ('GET', '/v1/userinfo'): self.userinfo_endpoint,
+            ('POST', '/v1/revoke'): self.revoke,
+            ('GET', '/v1/logout'): self.logout,
+        }
+        route = routes.get((method, path))
+        if route is None:
+            return self.json(dict(error='not_found'), 404)
+        if self.rate_limit is None:
+            return route(
+                headers = headers,
+                query = query,
+                form = form,
+                url = url,
+            )
+        limit_headers, limited = self.count_request(path)
+        if limited:
+            status, response_headers, body = self.json(
+                dict(
+                    errorCode = 'E0000047',
+                    errorSummary = RATE_LIMIT_SUMMARY,
+                ),
+                429,
+            )
+        else:
+            status, response_headers, body = route(
+                headers = headers,
+                query = query,
+                form = form,
+                url = url,
+            )
+        response_headers.update(limit_headers)
+        return status, response_headers, body
+
+    def count_request(self, path):
+        """
+        Count a request against the rate limit of path. Returns Okta's rate
+        limit headers, and True when the request is over the limit.
+        """
+        now = time.time()
+        with self._lock:
+            reset, used = self.rate_limit_windows.get(path, (0, 0))
+            if now >= reset:
+                reset = int(now) + self.rate_limit_window
+                used = 0
+            used += 1
+            self.rate_limit_windows[path] = (reset, used)
+        headers = {
+            'X-Rate-Limit-Limit': str(self.rate_limit),
+            'X-Rate-Limit-Remaining': str(max(0, self.rate_limit - used)),
+            'X-Rate-Limit-Reset': str(reset),
+        }
+        return headers, used > self.rate_limit
+
+    def json(self, data, status=200):
+        body = json.dumps(data).encode()
+        headers = {
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(body)),
+        }
+        return status, headers, body
+
+    def redirect(self, location):
+        return 302, {'Location': location, 'Content-Length': '0'}, b''
+
+    def discovery(self, **request):
+        base = self.issuer
+        return self.json(dict(
+            issuer = base,
+            authorization_endpoint = f'{ base }/v1/authorize',
+            token_endpoint = f'{ base }/v1/token',
+            userinfo_endpoint = f'{ base }/v1/userinfo',
+            end_session_endpoint = f'{ base }/v1/logout',
+            jwks_uri = f'{ base }/v1/keys',
+            revocation_endpoint = f'{ base }/v1/revoke',
+            introspection_endpoint = f'{ base }/v1/introspect',
+        ))
+
+    def keys(self, **request):
+        jwk = json.loads(RSAAlgorithm.to_jwk(self.key.public_key()))
+        jwk.update(kid=self.kid, use='sig', alg='RS256')
+        return self.json(dict(keys=[jwk]))
+
+    def authorize_endpoint(self, url, **request):
+        try:
+            return self.redirect(self.authorize(url))
+        except AssertionError as exc:
+            return self.json(
+                dict(error='invalid_request', error_description=str(exc)),
+                400,
+            )
+
+    def sign(self, claims):
+        now = int(time.time())
+        claims = dict(
+            claims,
+            iss = self.issuer,
+            iat = now,
+            exp = now + self.token_lifetime,
+        )
+        return jwt.encode(
+            claims,
+            self.key,
+            algorithm = 'RS256',
+            headers = dict(kid=self.kid),
+        )
+
+    def client_authenticated(self, headers):
+        expected = base64.b64encode(
+            f'{ self.client_id }:{ self.client_secret }'.encode()
+        ).decode()
+        return headers.get('Authorization') == f'Basic { expected }'
+
+    def issue_tokens(self, scope, userinfo, nonce=None):
+        scopes = scope.split()
+        with self._lock:
+            self.users[userinfo['sub']] = userinfo
+        response = dict(
+            token_type = 'Bearer',
+            expires_in = self.token_lifetime,
+            scope = scope,
+            access_token = self.sign(dict(
+                sub = userinfo['sub'],
+                aud = self.audience,
+                cid = self.client_id,
+                scp = scopes,
+                jti = secrets.token_hex(8),
+            )),
+            id_token = self.sign(dict(
+                userinfo,
+                aud = self.client_id,
+                nonce = nonce,
+            )),
+        )
+        if 'offline_access' in scopes:
+            refresh_token = secrets.token_urlsafe(32)
+            with self._lock:
+                self.refresh_tokens[refresh_token] = (scope, userinfo)
+            response['refresh_token'] = refresh_token
+        return response
+
+    def token(self, headers, form, **request):
+        if not self.client_authenticated(headers):
+            return self.json(dict(error='invalid_client'), 401)
+        grant_type = form.get('grant_type')
+        if grant_type == 'authorization_code':
+            with self._lock:
+                params = self.codes.pop(form.get('code'), None)
+            if (
+                params is None
+                or params['redirect_uri'] != form.get('redirect_uri')
+                or params['code_challenge']
+                    != code_challenge(form.get('code_verifier', ''))
+            ):
+                return self.json(dict(error='invalid_grant'), 400)
+            return self.json(self.issue_tokens(
+                params['scope'],
+                params['userinfo'],
+                nonce = params.get('nonce'),
+            ))
+        if grant_type == 'refresh_token':
+            # refresh tokens rotate, each is good once
+            with self._lock:
+                grant = self.refresh_tokens.pop(
+                    form.get('refresh_token'),
+                    None,
+                )
+            if grant is None:
+                return self.json(dict(error='invalid_grant'), 400)
+            scope, userinfo = grant
+            return self.json(self.issue_tokens(scope, userinfo))
+        return self.json(dict(error='unsupported_grant_type'), 400)
+
+    def userinfo_endpoint(self, headers, **request):
+        scheme, _, token = headers.get('Authorization', '').partition(' ')
+        try:
+            claims = jwt.decode(
+                token,
+                self.key.public_key(),
+                algorithms = ['RS256'],
+                audience = self.audience,
+            )
+        except jwt.InvalidTokenError:
+            return self.json(dict(error='invalid_token'), 401)
+        if token in self.revoked:
+            return self.json(dict(error='invalid_token'), 401)
+        return self.json(self.users.get(claims['sub'], self.userinfo))
+
+    def revoke(self, headers, form, **request):
+        if not self.client_authenticated(headers):
+            return self.json(dict(error='invalid_client'), 401)
+        token = form.get('token')
+        if not token:
+            return self.json(dict(error='invalid_request'), 400)
+        with self._lock:
+            self.revoked.add(token)
+            self.refresh_tokens.pop(token, None)
+        return 200, {'Content-Length': '0'}, b''
+
+    def logout(self, query, **request):
+        location = query.get('post_logout_redirect_uri')
+        if not location:
+            return 200, {'Content-Length': '0'}, b''
+        return self.redirect(
+            location + '?' + urlencode(dict(state=query.get('state', '')))
+        )
+
+
+class FakeOktaAdapter(BaseAdapter):
+    """
+    `requests` transport adapter sending every request to a `FakeOkta`.
+    """
+
+    def __init__(self, okta):
+        super().__init__()
+        self.okta = okta
+
+    def send(self, request, **kwargs):
+        status, headers, body = self.okta.handle(
+            request.method,
+            request.url,
+            request.headers,
+            request.body,
+        )
+        response = Response()
+        response.status_code = status
+        response.reason = HTTPStatus(status).phrase
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
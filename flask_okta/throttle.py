@@ -0,0 +1,231 @@
+import math
+import threading
+import time
+
+from .resilience import OktaUnavailable
+
+# share of an endpoint's limit left when calls start being spaced out
+DEFAULT_PACE_BELOW = 0.2
+
+# share of an endpoint's limit left when deferrable calls are skipped
+DEFAULT_DEFER_BELOW = 0.5
+
+# seconds a call may be held back, longer waits fail fast instead
+DEFAULT_MAX_WAIT = 2
+
+LIMIT_HEADER = 'X-Rate-Limit-Limit'
+REMAINING_HEADER = 'X-Rate-Limit-Remaining'
+RESET_HEADER = 'X-Rate-Limit-Reset'
+
+class OktaRateLimited(OktaUnavailable):
+    """
+    Okta's rate limit for an endpoint is spent until after the longest wait
+    allowed. Renders as 503 with Retry-After.
+    """
+
+
+class RateLimitBudget:
+    """
+    What Okta last said about one endpoint's rate limit, counted down by the
+    calls sent since.
+    """
+
+    __slots__ = (
+        'limit',
+        'remaining',
+        'reset',
+        'next_at',
+        'paced',
+        'waited',
+        'deferred',
+        'refused',
+        'rejected',
+    )
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        # unix time the window resets at
+        self.reset = 0
+        # earliest start of the next paced call
+        self.next_at = 0
+        self.paced = 0
+        self.waited = 0.0
+        self.deferred = 0
+        # calls failed fast, and 429s from Okta
+        self.refused = 0
+        self.rejected = 0
+
+
+class OktaThrottle:
+    """
+    Paces calls to Okta by the `X-Rate-Limit-*` headers of its responses.
+
+    Calls go out unhindered while plenty of an endpoint's limit is left.
+    Below pace_below of it, calls are spread evenly over what remains of the
+    window, each held back at most max_wait. Once it is spent, calls wait for
+    the reset or, if that is more than max_wait away, fail fast with
+    `OktaRateLimited`. From defer_below on, work that can wait is put off
+    so the rest goes to logins: background claim revalidation, token refreshes
+    while the access token has more than half of OKTA_REFRESH_LEEWAY left,
+    and revocations after logout. Calls a request is waiting on, like
+    /userinfo for a cache miss, are only paced.
+
+    Each process counts on its own, the headers of every response bring it
+    back to what Okta counted for all of them.
+    """
+
+    def __init__(
+        self,
+        pace_below = DEFAULT_PACE_BELOW,
+        defer_below = DEFAULT_DEFER_BELOW,
+        max_wait = DEFAULT_MAX_WAIT,
+        clock = time.time,
+    ):
+        """
+        :param pace_below:
+            Share of the limit left when calls start being spaced out.
+        :param defer_below:
+            Share of the limit left when deferrable calls are skipped.
+        :param max_wait:
+            Seconds a call is held back at most.
+        """
+        self.pace_below = pace_below
+        self.defer_below = defer_below
+        self.max_wait = max_wait
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._budgets = {}
+
+    def update(self, endpoint, headers, status):
+        """
+        Take the rate limit of endpoint from a response's headers.
+        """
+        remaining = headers.get(REMAINING_HEADER)
+        if remaining is None and status != 429:
+            return
+        try:
+            remaining = int(remaining or 0)
+            limit = int(headers.get(LIMIT_HEADER) or 0) or None
+            reset = int(headers.get(RESET_HEADER) or 0)
+        except ValueError:
+            return
+        with self._lock:
+            budget = self._budgets.get(endpoint)
+            if budget is None:
+                budget = self._budgets[endpoint] = RateLimitBudget()
+            if status == 429:
+                budget.rejected += 1
+                remaining = 0
+            budget.limit = limit or budget.limit
+            budget.remaining = remaining
+            budget.reset = reset or budget.reset
+
+    def _live_budget(self, endpoint, now):
+        budget = self._budgets.get(endpoint)
+        if budget is None or budget.remaining is None:
+            return None
+        if now >= budget.reset:
+            # a new window, the next response tells how much of it is left
+            budget.remaining = None
+            budget.next_at = 0
+            return None
+        return budget
+
+    def delay(self, endpoint):
+        """
+        Seconds to hold back a call to endpoint, 0 to send it now. The call
+        is counted as sent. Raises OktaRateLimited when the limit is spent
+        for longer than max_wait.
+        """
+        with self._lock:
+            now = self.clock()
+            budget = self._live_budget(endpoint, now)
+            if budget is None:
+                return 0
+            if budget.remaining <= 0:
+                # spent, the next call goes out once the window resets
+                wait = budget.reset - now
+                if wait > self.max_wait:
+                    budget.refused += 1
+                    raise OktaRateLimited(
+                        f'Okta { endpoint } rate limit reached, try again '
+                        f'later.',
+                        retry_after = math.ceil(wait),
+                    )
+            elif (
+                budget.limit is None
+                or budget.remaining < self.pace_below * budget.limit
+            ):
+                # what is left spread over the rest of the window, never
+                # holding a call longer than max_wait while some is left
+                spacing = (budget.reset - now) / budget.remaining
+                start = min(max(now, budget.next_at), now + self.max_wait)
+                budget.next_at = start + spacing
+                wait = start - now
+            else:
+                wait = 0
+            budget.remaining = max(0, budget.remaining - 1)
+            if wait:
+                budget.paced += 1
+                budget.waited += wait
+            return wait
+
+    def resend_after(self, endpoint, headers, status):
+        """
+        Take the rate limit of endpoint from a response. Seconds until the
+        call may be sent again when Okta refused it with 429, otherwise None.
+        """
+        self.update(endpoint, headers, status)
+        if status != 429:
+            return None
+        # refused unprocessed, so even a POST can go again once the window
+        # resets, if that is soon
+        return self.resend_delay(endpoint)
+
+    def resend_delay(self, endpoint):
+        """
+        Seconds until a call Okta refused with 429 may be sent again, None
+        when that is more than max_wait away.
+        """
+        with self._lock:
+            budget = self._budgets.get(endpoint)
+            if budget is None:
+                return None
+            wait = max(0, budget.reset - self.clock())
+            if wait > self.max_wait:
+                return None
+            return wait
+
+    def should_defer(self, endpoint):
+        """
+        True when a call to endpoint that can wait should be skipped for now.
+        """
+        with self._lock:
+            budget = self._live_budget(endpoint, self.clock())
+            if budget is None or budget.limit is None:
+                return False
+            if budget.remaining >= self.defer_below * budget.limit:
+                return False
+            budget.deferred += 1
+            return True
+
+    def stats(self):
+        """
+        Rate limit left and calls paced, deferred and refused, by endpoint.
+        """
+        now = self.clock()
+        with self._lock:
+            return {
+                endpoint: dict(
+                    limit = budget.limit,
+                    remaining = budget.remaining,
+                    reset_in = max(0, math.ceil(budget.reset - now)),
+                    paced = budget.paced,
+                    waited = round(budget.waited, 3),
+                    deferred = budget.deferred,
+                    refused = budget.refused,
+                    rejected = budget.rejected,
+                )
+                for endpoint, budget in self._budgets.items()
+            }
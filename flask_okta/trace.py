@@ -0,0 +1,156 @@
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+
+from flask import current_app
+from flask import g
+from flask import has_request_context
+from flask import request
+
+from .resilience import endpoint_name
+
+# login attempts kept for the debug timeline
+DEFAULT_TRACE_SIZE = 50
+
+# header a proxy or load balancer may set with its id for the request
+REQUEST_ID_HEADER = 'X-Request-Id'
+
+def get_request_id():
+    """
+    Id of the current request, from the proxy when it sent one.
+    """
+    request_id = g.get('_okta_request_id')
+    if request_id is None:
+        request_id = g._okta_request_id = (
+            request.headers.get(REQUEST_ID_HEADER)
+            or uuid.uuid4().hex[:12]
+        )
+    return request_id
+
+
+class FlowTracer:
+    """
+    Ring buffer of login attempts for debugging, by state.
+
+    An attempt starts at the redirect to Okta and continues in the callback
+    carrying the same state. While a request belongs to an attempt, flow
+    phases and responses from Okta are appended to it as events with their
+    offset from the start of the attempt. The oldest attempt is dropped once
+    maxsize are kept.
+    """
+
+    def __init__(self, maxsize=DEFAULT_TRACE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._traces = OrderedDict()
+
+    def begin(self, state):
+        """
+        Attach the current request to the attempt with state, starting a new
+        attempt for an unknown state.
+        """
+        now = self.clock()
+        route_start = g.get('_okta_route_start')
+        if route_start is not None:
+            # the attempt starts with the request, not with this call
+            now -= time.perf_counter() - route_start
+        with self._lock:
+            trace = self._traces.get(state)
+            if trace is None:
+                trace = self._traces[state] = dict(
+                    id = state[:8],
+                    started = now,
+                    status = None,
+                    requests = [],
+                    events = [],
+                )
+                while len(self._traces) > self.maxsize:
+                    self._traces.popitem(last=False)
+        g._okta_trace = trace
+        self.add_event(
+            'request',
+            f'{ request.method } { request.path }',
+            request_id = get_request_id(),
+            endpoint = request.endpoint,
+        )
+        trace['requests'].append(get_request_id())
+        return trace
+
+    def add_event(self, kind, label, duration=None, **detail):
+        """
+        Append an event to the current request's attempt, if any.
+
+        :param duration:
+            Seconds the event took, ending now.
+        """
+        if not has_request_context():
+            return
+        trace = g.get('_okta_trace')
+        if trace is None:
+            return
+        at = self.clock() - (duration or 0) - trace['started']
+        event = dict(
+            at = at,
+            kind = kind,
+            label = label,
+            duration = duration,
+            **detail
+        )
+        with self._lock:
+            trace['events'].append(event)
+
+    def finish(self, response):
+        """
+        Record the status of the response ending a request of an attempt.
+        """
+        trace = g.get('_okta_trace')
+        if trace is not None:
+            trace['status'] = response.status_code
+            self.add_event('response', str(response.status_code))
+        return response
+
+    def on_phase(self, sender, phase, duration):
+        self.add_event('phase', phase, duration)
+
+    def on_okta_response(
+        self,
+        sender,
+        method,
+        url,
+        status,
+        duration,
+        size,
+    ):
+        self.add_event(
+            'okta',
+            f'{ method } { endpoint_name(url) }',
+            duration,
+            status = status,
+            size = size,
+        )
+
+    def traces(self):
+        """
+        Attempts kept, most recent first, events in order of their start.
+        """
+        with self._lock:
+            traces = [
+                dict(trace, events=sorted(
+                    trace['events'],
+                    key = lambda event: event['at'],
+                ))
+                for trace in reversed(self._traces.values())
+            ]
+        return traces
+
+def trace_login(state):
+    """
+    Attach the current request to the login attempt with state when
+    debugging.
+    """
+    tracer = current_app.extensions['okta'].tracer
+    if tracer is not None and state:
+        tracer.begin(state)
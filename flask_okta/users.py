@@ -0,0 +1,111 @@
+import hashlib
+import json
+import time
+
+from .cache import TTLCache
+from .store import MemoryStore
+from .store import SQLiteStore
+
+# userinfo claims kept per user unless configured otherwise
+DEFAULT_USER_CLAIMS = ('sub', 'email', 'name')
+
+DEFAULT_MAX_USERS = 10000
+
+# seconds a user is kept after their last login
+DEFAULT_USER_TTL = 30 * 86400
+
+def claims_version(claims):
+    """
+    Digest of claims, the same in every process for the same claims.
+    """
+    data = json.dumps(claims, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+class UserStore:
+    """
+    Registry of users who logged in with Okta, keeping only a projection of
+    their userinfo claims. Backed by any `flask_okta.store.ExpiringStore`.
+    """
+
+    def __init__(
+        self,
+        store,
+        claims = DEFAULT_USER_CLAIMS,
+        ttl = DEFAULT_USER_TTL,
+    ):
+        """
+        :param store:
+            ExpiringStore holding claims by user id.
+        :param claims:
+            Names of the userinfo claims to keep. `sub` is always kept.
+        :param ttl:
+            Seconds a user is kept after their last login.
+        """
+        self.store = store
+        self.claims = tuple(dict.fromkeys(('sub',) + tuple(claims)))
+        self.ttl = ttl
+        # version of each user's claims this process last saw, see `version`
+        self.versions = TTLCache(maxsize=DEFAULT_MAX_USERS, ttl=ttl)
+
+    def project(self, userinfo):
+        """
+        The configured claims from userinfo.
+        """
+        return {
+            name: userinfo[name] for name in self.claims if name in userinfo
+        }
+
+    def version(self, user_id):
+        """
+        `claims_version` of the claims this process last stored or loaded for
+        user_id, an empty string once it deleted the user. None when this
+        process has not seen the user recently.
+        """
+        return self.versions.get(user_id)
+
+    def get(self, user_id):
+        """
+        Stored claims for user_id, or None.
+        """
+        claims = self.store.get(user_id)
+        if claims is not None:
+            self.versions.set(user_id, claims_version(claims))
+        return claims
+
+    def set(self, user_id, userinfo):
+        """
+        Store the projection of userinfo for user_id and return it.
+        """
+        claims = self.project(userinfo)
+        self.store.set(user_id, claims, time.time() + self.ttl)
+        self.versions.set(user_id, claims_version(claims))
+        return claims
+
+    def delete(self, user_id):
+        self.store.delete(user_id)
+        # matches no claims
+        self.versions.set(user_id, '')
+
+
+def memory_user_store(
+    maxsize = DEFAULT_MAX_USERS,
+    claims = DEFAULT_USER_CLAIMS,
+    ttl = DEFAULT_USER_TTL,
+):
+    """
+    Bounded, lock-protected user registry for the current process. Least
+    recently loaded users are evicted first.
+    """
+    return UserStore(MemoryStore(maxsize=maxsize), claims=claims, ttl=ttl)
+
+def sqlite_user_store(
+    path,
+    claims = DEFAULT_USER_CLAIMS,
+    ttl = DEFAULT_USER_TTL,
+):
+    """
+    User registry in a SQLite file shared by all workers on a host.
+    """
+    store = SQLiteStore(path, table='okta_users')
+    return UserStore(store, claims=claims, ttl=ttl)
@@ -1,19 +1,34 @@
-import requests
+import math
+import time
 
 from flask import Blueprint
 from flask import abort
 from flask import current_app
+from flask import g
 from flask import jsonify
 from flask import redirect
 from flask import request
-from flask import session
 from flask import url_for
-from flask_login import login_user
 
 from . import html
+from .aio import async_authenticated_userinfo
+from .aio import async_exchange_for_userinfo
+from .aio import call_after_authorization
+from .metrics import record_phase
+from .metrics import server_timing_header
+from .metrics import timed
 from .okta import authenticated_userinfo
 from .okta import exchange_for_userinfo
+from .okta import find_okta_tenant
+from .okta import get_access_token
+from .okta import get_okta_tenant
+from .okta import get_pending_logins
 from .okta import prepare_redirect_authentication
+from .ratelimit import RATE_LIMITED_VIEWS
+from .trace import trace_login
+
+# name of flask-okta's blueprint unless OKTA_BLUEPRINT_NAME says otherwise
+DEFAULT_BLUEPRINT_NAME = 'okta'
 
 def get_okta_extension():
     return current_app.extensions['okta']
@@ -35,7 +50,7 @@ def abort_for_callback(code, state):
     if not code:
         abort(403, 'code not returned')
 
-    if state != session['_okta_state']:
+    if state not in get_pending_logins():
         abort(400, f'states do not match.')
 
 def create_okta_blueprint(
@@ -43,21 +58,87 @@ def create_okta_blueprint(
     import_name,
     okta_redirect_rule,
     okta_post_logout_redirect_rule = None,
+    use_async = False,
+    tenant_in_path = False,
+    metrics_path = None,
+    health_path = None,
 ):
     """
     Blueprint to redirect for login and respond to callback.
+
+    :param use_async:
+        Register async variants of the views that talk to Okta.
+    :param tenant_in_path:
+        Serve the routes under a leading tenant path segment.
+    :param metrics_path:
+        Rule serving the metrics as JSON, None to not serve them. Only
+        registered when given, so the app's own rules are not shadowed.
+    :param health_path:
+        Rule serving the circuit breaker states, None to not serve them.
     """
     okta_bp = Blueprint(
         name = blueprint_name,
         import_name = import_name,
+        url_prefix = '/<okta_tenant>' if tenant_in_path else None,
     )
+    if tenant_in_path:
+        _init_tenant_url_processors(okta_bp)
     _init_routes(
         okta_bp,
         okta_redirect_rule,
         okta_post_logout_redirect_rule,
     )
+    if metrics_path:
+        _init_metrics_route(okta_bp, metrics_path)
+    if health_path:
+        _init_health_route(okta_bp, health_path)
+    if use_async:
+        _init_async_routes(okta_bp, okta_redirect_rule)
+    else:
+        _init_sync_routes(okta_bp, okta_redirect_rule)
     return okta_bp
 
+def _init_tenant_url_processors(okta_bp):
+    """
+    Keep the tenant path segment out of view arguments and fill it in for
+    url_for from the current request's tenant.
+    """
+
+    @okta_bp.url_value_preprocessor
+    def pop_tenant(endpoint, values):
+        # the tenant is resolved from the path, not from view arguments
+        values.pop('okta_tenant', None)
+
+    @okta_bp.url_defaults
+    def add_tenant(endpoint, values):
+        values.setdefault('okta_tenant', get_okta_tenant().name)
+
+def _init_metrics_route(okta_bp, metrics_path):
+    """
+    Add the metrics route to blueprint.
+    """
+
+    @okta_bp.route(metrics_path)
+    def metrics():
+        """
+        Histograms, counters and cache statistics for the Okta flow.
+        """
+        return jsonify(get_okta_extension().metrics.snapshot())
+
+def _init_health_route(okta_bp, health_path):
+    """
+    Add the health route to blueprint.
+    """
+
+    @okta_bp.route(health_path)
+    def health():
+        """
+        Circuit breaker states, 503 while any circuit to Okta is not closed.
+        """
+        health = get_okta_extension().health()
+        status = 200 if health['status'] == 'ok' else 503
+        return jsonify(health), status
+
 def _init_routes(
     okta_bp,
     okta_redirect_rule,
@@ -76,12 +157,83 @@ def _init_routes(
          post logout callback.
     """
 
+    # registered app wide ahead of refresh_before_expiry, as a blueprint
+    # function it would run after it
+    @okta_bp.before_app_request
+    def limit_rate():
+        """
+        Answer 429 to clients over their login rate, before any work.
+        """
+        if request.blueprint != okta_bp.name:
+            return None
+        limiter = get_okta_extension().rate_limiter
+        if limiter is None:
+            return None
+        view = request.endpoint.rpartition('.')[2]
+        if view not in RATE_LIMITED_VIEWS:
+            return None
+        wait = limiter.check()
+        if wait:
+            return (
+                'Too many login attempts.',
+                429,
+                {'Retry-After': str(math.ceil(wait))},
+            )
+        return None
+
+    @okta_bp.before_request
+    def start_route_timer():
+        g._okta_route_start = time.perf_counter()
+
+    @okta_bp.after_request
+    def record_route_timing(response):
+        """
+        Time the okta route and add Server-Timing when configured.
+        """
+        start = g.pop('_okta_route_start', None)
+        if start is not None:
+            record_phase(
+                f'route.{ request.endpoint }',
+                time.perf_counter() - start,
+            )
+        if current_app.config['OKTA_SERVER_TIMING']:
+            timings = g.get('_okta_timings')
+            if timings:
+                response.headers['Server-Timing'] = server_timing_header(
+                    timings
+                )
+        return response
+
+    @okta_bp.after_request
+    def finish_trace(response):
+        tracer = get_okta_extension().tracer
+        if tracer is not None:
+            tracer.finish(response)
+        return response
+
+    @okta_bp.before_app_request
+    def refresh_before_expiry():
+        """
+        Renew the access token ahead of expiry when configured to.
+        """
+        if not current_app.config['OKTA_REFRESH_PROACTIVE']:
+            return
+        if find_okta_tenant() is None:
+            # pages outside every tenant have no org to refresh with
+            return
+        get_access_token()
+
     @okta_bp.route('/redirect-for-okta-login')
     def redirect_for_okta_login():
         """
         Redirect to Okta for authentication using configured values.
         """
-        redirect_authentication = prepare_redirect_authentication()
+        redirect_authentication = prepare_redirect_authentication(
+            scope = current_app.config['OKTA_SCOPE'],
+            # flask-login sends users here with the page they wanted
+            next_url = request.args.get('next'),
+        )
+        trace_login(redirect_authentication.query['state'])
         is_debug = get_okta_debug()
         if is_debug:
             # debugging preview before redirect with link to continue
@@ -92,6 +244,37 @@ def _init_routes(
             response = redirect(redirect_authentication.url)
         return response
 
+    @okta_bp.route('/trace')
+    def trace():
+        """
+        Debugging timeline of recent login attempts.
+        """
+        abort_for_debug()
+        tracer = get_okta_extension().tracer
+        if tracer is None:
+            abort(404)
+        return html.display_traces(tracer.traces())
+
+    @okta_bp.route('/test-callback')
+    def test_callback():
+        """
+        Debugging callback to display faked Okta callback redirect.
+        """
+        abort_for_debug()
+
+        # NOTE
+        # - the code key was just passed back in as is.
+        code = request.args.get('code')
+        state = request.args.get('state')
+        trace_login(state)
+        abort_for_callback(code, state)
+        return html.display_callback()
+
+def _init_sync_routes(okta_bp, okta_redirect_rule):
+    """
+    Add okta routes that make blocking requests to Okta.
+    """
+
     @okta_bp.route(okta_redirect_rule)
     def authorization_code_callback():
         """
@@ -100,6 +283,7 @@ def _init_routes(
         # code and state from url query args
         code = request.args.get('code')
         state = request.args.get('state')
+        trace_login(state)
         # validate
         abort_for_callback(code, state)
         # backend exchange process for userinfo
@@ -107,7 +291,8 @@ def _init_routes(
         # callback to code using this extension for logging in user from
         # userinfo data
         okta = get_okta_extension()
-        return okta._after_authorization(userinfo)
+        with timed('after_authorization'):
+            return okta._after_authorization(userinfo)
 
     @okta_bp.route('/userinfo')
     def userinfo():
@@ -120,16 +305,32 @@ def _init_routes(
         userinfo = authenticated_userinfo()
         return jsonify(userinfo)
 
-    @okta_bp.route('/test-callback')
-    def test_callback():
+def _init_async_routes(okta_bp, okta_redirect_rule):
+    """
+    Add async okta routes that await Okta without holding a worker thread.
+    """
+
+    @okta_bp.route(okta_redirect_rule)
+    async def authorization_code_callback():
         """
-        Debugging callback to display faked Okta callback redirect.
+        Check response from Okta and use access token to login a user.
         """
-        abort_for_debug()
-
-        # NOTE
-        # - the code key was just passed back in as is.
         code = request.args.get('code')
         state = request.args.get('state')
+        trace_login(state)
         abort_for_callback(code, state)
-        return html.display_callback()
+        userinfo = await async_exchange_for_userinfo(code, state)
+        okta = get_okta_extension()
+        return await call_after_authorization(
+            okta._after_authorization,
+            userinfo,
+        )
+
+    @okta_bp.route('/userinfo')
+    async def userinfo():
+        """
+        Debugging userinfo endpoint.
+        """
+        abort_for_debug()
+        userinfo = await async_authenticated_userinfo()
+        return jsonify(userinfo)
@@ -1,4 +1,17 @@
-from flask_login import login_required
+import threading
+
+from collections import Counter
+
+from flask import current_app
+from flask import request
+
+from .view import DEFAULT_BLUEPRINT_NAME
+
+PUBLIC = 'public'
+PROTECTED = 'protected'
+
+# public by default for any app
+DEFAULT_PUBLIC_ENDPOINTS = ('static',)
 
 def wrap_view_functions(flask_app, wrapper):
     """
@@ -9,9 +22,188 @@ def wrap_view_functions(flask_app, wrapper):
         func = view_functions[endpoint]
         view_functions[endpoint] = wrapper(func)
 
-def wrap_app_login_required(flask_app):
+
+class LoginPolicy:
+    """
+    Table deciding which requests need a logged in user. A request's endpoint
+    is looked up first, then its blueprint, then its path prefix; anything
+    not listed gets the default, so routes registered later are protected
+    too.
+    """
+
+    def __init__(
+        self,
+        public_endpoints = DEFAULT_PUBLIC_ENDPOINTS,
+        public_blueprints = None,
+        public_prefixes = (),
+        protected_endpoints = (),
+        default = PROTECTED,
+    ):
+        """
+        :param public_endpoints:
+            Endpoints served without login.
+        :param public_blueprints:
+            Blueprints whose endpoints are served without login. Defaults to
+            flask-okta's own, which handles authentication itself, named by
+            the app's OKTA_BLUEPRINT_NAME when the gate is installed.
+        :param public_prefixes:
+            URL path prefixes served without login and without opening the
+            session.
+        :param protected_endpoints:
+            Endpoints requiring login even under a public blueprint.
+        :param default:
+            PUBLIC or PROTECTED, for anything not listed.
+        """
+        self.endpoints = dict.fromkeys(public_endpoints, PUBLIC)
+        self.endpoints.update(dict.fromkeys(protected_endpoints, PROTECTED))
+        self.blueprints = None
+        if public_blueprints is not None:
+            self.blueprints = frozenset(public_blueprints)
+        self.prefixes = tuple(public_prefixes)
+        self.default = default
+        # exact paths and prefixes served before the URL is matched, compiled
+        # from the url map on first use
+        self.fast_paths = None
+        self.fast_prefixes = None
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def compile(self, url_map):
+        """
+        Precompute the paths of public endpoints, so their requests can be
+        recognized before the session is opened.
+        """
+        paths = set()
+        prefixes = list(self.prefixes)
+        for rule in url_map.iter_rules():
+            if self.endpoints.get(rule.endpoint) != PUBLIC:
+                continue
+            static, variable, _ = rule.rule.partition('<')
+            if not variable:
+                paths.add(static)
+            elif static.endswith('/') and static != '/':
+                prefixes.append(static)
+        protected = frozenset(
+            rule.rule for rule in url_map.iter_rules()
+            if self.endpoints.get(rule.endpoint) == PROTECTED
+        )
+        self.fast_paths = frozenset(paths - protected)
+        self.fast_prefixes = tuple(prefixes)
+
+    def is_fast_path(self, app, path):
+        """
+        True for a public path not needing the session or user.
+        """
+        if self.fast_paths is None:
+            self.compile(app.url_map)
+        if path in self.fast_paths or path.startswith(self.fast_prefixes):
+            self.count('fast')
+            return True
+        return False
+
+    def decide(self, endpoint, blueprint, path):
+        decision = self.endpoints.get(endpoint)
+        if decision is None:
+            if blueprint in self.blueprints or path.startswith(self.prefixes):
+                decision = PUBLIC
+            else:
+                decision = self.default
+        return decision
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def stats(self):
+        """
+        Requests by path taken: public, protected and unauthorized. Fast
+        counts the public requests that also skipped the session.
+        """
+        with self._lock:
+            return dict(self.counts)
+
+
+class PolicySessionInterface:
     """
-    Wrap existing Flask view function with login_required. Usually for
-    initialized Dash application with existing Flask instance.
+    Wrap an app's session interface to hand public fast path requests a null
+    session instead of loading the session cookie. Attributes are read from
+    and set on the wrapped interface, like
+    `flask_okta.metrics.TimedSessionInterface`.
+    """
+
+    def __init__(self, wrapped, policy):
+        object.__setattr__(self, 'wrapped', wrapped)
+        object.__setattr__(self, 'policy', policy)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.wrapped, name, value)
+
+    def open_session(self, app, request):
+        if self.policy.is_fast_path(app, request.path):
+            return self.wrapped.make_null_session(app)
+        return self.wrapped.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.wrapped.save_session(app, session, response)
+
+
+def login_gate(policy):
+    """
+    before_request function enforcing login according to policy.
+    """
+    # only apps installing the gate need flask_login
+    from flask_login import current_user
+    from flask_login.config import EXEMPT_METHODS
+
+    def gate():
+        if request.endpoint is None:
+            # let routing errors through as 404 or 405
+            return
+        decision = policy.decide(
+            request.endpoint,
+            request.blueprint,
+            request.path,
+        )
+        if decision == PUBLIC:
+            policy.count('public')
+            return
+        policy.count('protected')
+        if (
+            request.method in EXEMPT_METHODS
+            or current_app.config.get('LOGIN_DISABLED')
+        ):
+            return
+        if not current_user.is_authenticated:
+            policy.count('unauthorized')
+            return current_app.login_manager.unauthorized()
+
+    return gate
+
+def wrap_app_login_required(flask_app, policy=None):
+    """
+    Require login for every request of a Flask instance, including routes
+    added later, except those public by policy. Usually for initialized Dash
+    application with existing Flask instance.
+
+    :param policy:
+        `LoginPolicy` instance. Defaults to public static files and
+        flask-okta's blueprint.
     """
-    wrap_view_functions(flask_app, login_required)
+    if policy is None:
+        policy = LoginPolicy()
+    if policy.blueprints is None:
+        policy.blueprints = frozenset([
+            flask_app.config.setdefault(
+                'OKTA_BLUEPRINT_NAME',
+                DEFAULT_BLUEPRINT_NAME,
+            ),
+        ])
+    flask_app.session_interface = PolicySessionInterface(
+        flask_app.session_interface,
+        policy,
+    )
+    flask_app.before_request(login_gate(policy))
+    return policy
@@ -0,0 +1,63 @@
+import pytest
+
+from flask import Flask
+from flask import jsonify
+
+from flask_okta import OktaManager
+from flask_okta.aio import AsyncOktaClient
+from flask_okta.testing import DEFAULT_USERINFO
+from flask_okta.testing import FakeOkta
+
+pytest.importorskip('httpx')
+
+@pytest.fixture
+def fake_okta():
+    return FakeOkta()
+
+@pytest.fixture
+def app(fake_okta):
+    app = Flask(__name__)
+    app.config.update(
+        fake_okta.app_config(),
+        SECRET_KEY = 'test',
+        OKTA_ASYNC = True,
+    )
+    okta = OktaManager(app)
+
+    @okta.after_authorization
+    async def after_authorization(userinfo):
+        return jsonify(userinfo)
+
+    @app.route('/me')
+    async def me():
+        return jsonify(await okta.async_userinfo())
+
+    return app
+
+@pytest.fixture
+def created_clients(monkeypatch):
+    created = []
+    create_client = AsyncOktaClient._create_client
+
+    def record_client(self):
+        client = create_client(self)
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(AsyncOktaClient, '_create_client', record_client)
+    return created
+
+def test_async_login(fake_okta, app):
+    client = app.test_client()
+    response = fake_okta.login(client)
+    assert response.json == DEFAULT_USERINFO
+    assert client.get('/me').json == DEFAULT_USERINFO
+
+def test_async_clients_closed_after_request(fake_okta, app, created_clients):
+    for _ in range(5):
+        fake_okta.login(app.test_client())
+    # each async view runs in a loop of its own, its pool ends with it
+    assert len(created_clients) == 5
+    assert all(client.is_closed for client in created_clients)
+    async_client = app.extensions['okta'].async_client
+    assert len(async_client._clients) == 0
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from flask_okta.cache import SingleFlight
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out.')
+        time.sleep(0.001)
+
+def run_concurrently(flight, func, callers):
+    """
+    Call func through flight from callers threads, returning once all but
+    the first are waiting on its call. Results and errors fill in as the
+    threads finish.
+    """
+    results = []
+    errors = []
+
+    def call():
+        try:
+            results.append(flight.do('key', func))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight.shared == callers - 1)
+    return threads, results, errors
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        release.wait()
+        return 'result'
+
+    threads, results, errors = run_concurrently(flight, func, 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ['result'] * 5
+    assert not errors
+
+def test_concurrent_calls_share_one_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def func():
+        release.wait()
+        raise ValueError('failed')
+
+    threads, results, errors = run_concurrently(flight, func, 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert not results
+    assert len(errors) == 3
+    assert all(isinstance(error, ValueError) for error in errors)
+
+def test_later_calls_run_again():
+    flight = SingleFlight()
+    calls = []
+    for _ in range(2):
+        flight.do('key', lambda: calls.append(1))
+    assert len(calls) == 2
+    assert flight.shared == 0
+
+def test_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 'a') == 'a'
+    assert flight.do('b', lambda: 'b') == 'b'
+
+def test_error_not_kept():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        flight.do('key', fail)
+    assert flight.do('key', lambda: 'result') == 'result'
@@ -0,0 +1,116 @@
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+import pytest
+
+from flask import Flask
+from flask import jsonify
+from flask import redirect
+from flask import url_for
+
+from flask_okta import OktaManager
+from flask_okta.testing import DEFAULT_USERINFO
+from flask_okta.testing import FakeOkta
+
+@pytest.fixture
+def fake_okta():
+    return FakeOkta()
+
+@pytest.fixture
+def app(fake_okta):
+    app = Flask(__name__)
+    app.config.update(
+        fake_okta.app_config(),
+        SECRET_KEY = 'test',
+        OKTA_SCOPE = 'openid email profile offline_access',
+        OKTA_REVOKE_ON_LOGOUT = True,
+    )
+    okta = OktaManager(app)
+
+    @okta.after_authorization
+    def after_authorization(userinfo):
+        return redirect(url_for('me'))
+
+    @app.route('/me')
+    def me():
+        return jsonify(okta.userinfo())
+
+    @app.route('/logout')
+    def logout():
+        post_logout_redirect_url = url_for('post_okta_logout', _external=True)
+        return redirect(okta.logout_url(post_logout_redirect_url))
+
+    @app.route(okta.post_logout_redirect_rule)
+    def post_okta_logout():
+        return 'logged out'
+
+    yield app
+    okta.revocations.shutdown()
+
+@pytest.fixture
+def okta(app):
+    return app.extensions['okta']
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_login_redirects_to_after_authorization(fake_okta, client):
+    response = fake_okta.login(client)
+    assert response.status_code == 302
+    assert response.location == '/me'
+
+def test_userinfo_after_login(fake_okta, client):
+    fake_okta.login(client)
+    response = client.get('/me')
+    assert response.status_code == 200
+    assert response.json == DEFAULT_USERINFO
+
+def test_userinfo_for_other_user(fake_okta, client):
+    userinfo = dict(DEFAULT_USERINFO, sub='00uother000000000000')
+    fake_okta.login(client, userinfo=userinfo)
+    assert client.get('/me').json['sub'] == '00uother000000000000'
+
+def test_userinfo_served_from_cache(fake_okta, client):
+    fake_okta.login(client)
+    client.get('/me')
+    client.get('/me')
+    userinfo_requests = [
+        path for method, path in fake_okta.requests
+        if path.endswith('/userinfo')
+    ]
+    # the callback's request fills the cache
+    assert len(userinfo_requests) == 1
+
+def test_callback_rejects_unknown_state(fake_okta, client):
+    fake_okta.login(client)
+    response = client.get(
+        '/authorization-code/callback',
+        query_string = dict(code='code', state='unknown'),
+    )
+    assert response.status_code == 400
+
+def test_userinfo_without_login(client):
+    assert client.get('/me').status_code == 401
+
+def test_logout(fake_okta, okta, client):
+    fake_okta.login(client)
+    response = client.get('/logout')
+    assert response.status_code == 302
+    assert response.location.startswith(fake_okta.issuer)
+    query = parse_qs(urlsplit(response.location).query)
+    assert query['post_logout_redirect_uri'] == [
+        'http://localhost' + okta.post_logout_redirect_rule,
+    ]
+
+    # the browser follows the redirect to Okta, which sends it back
+    status, headers, _ = fake_okta.handle('GET', response.location, {}, b'')
+    assert status == 302
+    back = urlsplit(headers['Location'])
+    response = client.get(back.path, query_string=back.query)
+    assert response.data == b'logged out'
+
+    # the tokens are gone from the session and revoked at Okta
+    assert client.get('/me').status_code == 401
+    okta.revocations.shutdown()
+    assert len(fake_okta.revoked) == 2
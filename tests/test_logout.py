@@ -0,0 +1,65 @@
+import pytest
+
+from flask import Flask
+from flask import redirect
+
+from flask_okta import OktaManager
+from flask_okta.session import HANDLE_KEY
+from flask_okta.session import LOGIN_KEYS
+from flask_okta.testing import DEFAULT_USERINFO
+from flask_okta.testing import FakeOkta
+
+ADMIN = dict(DEFAULT_USERINFO, groups=['admin'])
+
+@pytest.fixture
+def fake_okta():
+    return FakeOkta()
+
+@pytest.fixture(params=[None, 'memory'])
+def app(request, fake_okta):
+    # default configuration, with and without a token store
+    app = Flask(__name__)
+    app.config.update(
+        fake_okta.app_config(),
+        SECRET_KEY = 'test',
+        OKTA_TOKEN_STORE = request.param,
+    )
+    okta = OktaManager(app, after_authorization=lambda userinfo: 'in')
+
+    @app.route('/admin')
+    @okta.require_groups('admin')
+    def admin():
+        return 'admin'
+
+    @app.route('/logout')
+    def logout():
+        return redirect(okta.logout_url())
+
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_require_groups_after_login(fake_okta, client):
+    fake_okta.login(client, userinfo=ADMIN)
+    assert client.get('/admin').status_code == 200
+
+def test_require_groups_refuses_other_groups(fake_okta, client):
+    fake_okta.login(client)
+    assert client.get('/admin').status_code == 403
+
+def test_require_groups_refuses_after_logout(fake_okta, client):
+    fake_okta.login(client, userinfo=ADMIN)
+    assert client.get('/logout').status_code == 302
+    assert client.get('/admin').status_code == 401
+
+def test_logout_clears_login(fake_okta, app, client):
+    fake_okta.login(client, userinfo=ADMIN)
+    client.get('/logout')
+    with client.session_transaction() as flask_session:
+        assert not set(LOGIN_KEYS).intersection(flask_session)
+        assert HANDLE_KEY not in flask_session
+    token_store = app.extensions['okta'].token_store
+    if token_store is not None:
+        assert len(token_store) == 0
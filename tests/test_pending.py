@@ -0,0 +1,119 @@
+import pytest
+
+from flask import Flask
+
+from flask_okta import OktaManager
+from flask_okta.pending import PendingLogins
+from flask_okta.pending import is_safe_next_url
+from flask_okta.store import MemoryStore
+from flask_okta.testing import FakeOkta
+
+class Clock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(FakeOkta().app_config(), SECRET_KEY='test')
+    OktaManager(app)
+    with app.test_request_context():
+        yield app
+
+@pytest.fixture(params=['session', 'memory'])
+def store(request, clock):
+    if request.param == 'memory':
+        return MemoryStore(clock=clock)
+    return None
+
+@pytest.fixture
+def pending(app, store, clock):
+    return PendingLogins(store=store, ttl=600, per_session=3, clock=clock)
+
+def test_claim(pending):
+    pending.add('state', 'verifier', nonce='nonce', next_url='/home')
+    assert 'state' in pending
+    assert pending.claim('state') == dict(
+        code_verifier = 'verifier',
+        nonce = 'nonce',
+        next = '/home',
+    )
+    assert 'state' not in pending
+
+def test_claim_once(pending):
+    pending.add('state', 'verifier')
+    assert pending.claim('state') is not None
+    assert pending.claim('state') is None
+
+def test_claim_unknown(pending):
+    pending.add('state', 'verifier')
+    assert pending.claim('other') is None
+    assert 'state' in pending
+
+def test_claim_expired(clock, store, pending):
+    pending.add('state', 'verifier')
+    clock.now += 600
+    assert pending.claim('state') is None
+    if store is not None:
+        assert store.get('state') is None
+
+def test_claim_before_expiry(clock, pending):
+    pending.add('state', 'verifier')
+    clock.now += 599
+    assert pending.claim('state') is not None
+
+def test_tabs_sign_in_separately(pending):
+    pending.add('first', 'first verifier')
+    pending.add('second', 'second verifier')
+    assert pending.claim('second')['code_verifier'] == 'second verifier'
+    assert pending.claim('first')['code_verifier'] == 'first verifier'
+
+def test_per_session_cap_drops_oldest(clock, store, pending):
+    for state in ('a', 'b', 'c', 'd'):
+        pending.add(state, 'verifier')
+        clock.now += 1
+    assert 'a' not in pending
+    if store is not None:
+        assert store.get('a') is None
+    for state in ('b', 'c', 'd'):
+        assert pending.claim(state) is not None
+
+def test_expired_do_not_count_toward_cap(clock, pending):
+    pending.add('a', 'verifier')
+    clock.now += 600
+    for state in ('b', 'c', 'd'):
+        pending.add(state, 'verifier')
+    for state in ('b', 'c', 'd'):
+        assert pending.claim(state) is not None
+
+def test_unsafe_next_url_dropped(pending):
+    pending.add('state', 'verifier', next_url='https://evil.example.com/')
+    assert pending.claim('state')['next'] is None
+
+@pytest.mark.parametrize('url', [
+    '/',
+    '/home',
+    '/reports?page=2',
+])
+def test_safe_next_url(url):
+    assert is_safe_next_url(url)
+
+@pytest.mark.parametrize('url', [
+    None,
+    '',
+    'home',
+    'https://evil.example.com/',
+    '//evil.example.com/',
+    '/\\evil.example.com',
+])
+def test_unsafe_next_url(url):
+    assert not is_safe_next_url(url)
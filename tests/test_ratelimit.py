@@ -0,0 +1,85 @@
+import pytest
+
+from flask_okta.ratelimit import MemoryBuckets
+from flask_okta.ratelimit import SQLiteBuckets
+
+class Clock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets(request, clock, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteBuckets(str(tmp_path / 'buckets.sqlite3'), clock=clock)
+    return MemoryBuckets(clock=clock)
+
+def test_starts_full(buckets):
+    for _ in range(3):
+        assert buckets.take('key', rate=1, burst=3) == 0
+
+def test_denied_when_empty(buckets):
+    for _ in range(3):
+        buckets.take('key', rate=0.5, burst=3)
+    # one token short at half a token per second
+    assert buckets.take('key', rate=0.5, burst=3) == 2
+
+def test_denial_spends_nothing(buckets):
+    for _ in range(4):
+        buckets.take('key', rate=0.5, burst=3)
+    assert buckets.take('key', rate=0.5, burst=3) == 2
+
+def test_refills_at_rate(clock, buckets):
+    for _ in range(3):
+        buckets.take('key', rate=0.5, burst=3)
+    clock.now += 2
+    assert buckets.take('key', rate=0.5, burst=3) == 0
+    assert buckets.take('key', rate=0.5, burst=3) == 2
+
+def test_partial_refill_shortens_wait(clock, buckets):
+    for _ in range(3):
+        buckets.take('key', rate=0.5, burst=3)
+    clock.now += 1
+    assert buckets.take('key', rate=0.5, burst=3) == pytest.approx(1)
+
+def test_refill_capped_at_burst(clock, buckets):
+    buckets.take('key', rate=1, burst=3)
+    clock.now += 100
+    for _ in range(3):
+        assert buckets.take('key', rate=1, burst=3) == 0
+    assert buckets.take('key', rate=1, burst=3) == 1
+
+def test_cost(buckets):
+    assert buckets.take('key', rate=1, burst=3, cost=2) == 0
+    assert buckets.take('key', rate=1, burst=3, cost=2) == 1
+
+def test_keys_limited_separately(buckets):
+    for _ in range(3):
+        buckets.take('a', rate=1, burst=3)
+    assert buckets.take('a', rate=1, burst=3) == 1
+    assert buckets.take('b', rate=1, burst=3) == 0
+
+def test_sqlite_buckets_shared_between_instances(clock, tmp_path):
+    path = str(tmp_path / 'buckets.sqlite3')
+    first = SQLiteBuckets(path, clock=clock)
+    second = SQLiteBuckets(path, clock=clock)
+    for _ in range(3):
+        first.take('key', rate=1, burst=3)
+    assert second.take('key', rate=1, burst=3) == 1
+
+def test_memory_buckets_bounded(clock):
+    buckets = MemoryBuckets(maxsize=2, clock=clock)
+    for key in ('a', 'b', 'c'):
+        buckets.take(key, rate=1, burst=1)
+    assert len(buckets) == 2
+    # the oldest bucket was dropped and comes back full
+    assert buckets.take('a', rate=1, burst=1) == 0
+    assert buckets.take('c', rate=1, burst=1) == 1
@@ -0,0 +1,91 @@
+import pytest
+
+from flask_okta.resilience import CLOSED
+from flask_okta.resilience import HALF_OPEN
+from flask_okta.resilience import OPEN
+from flask_okta.resilience import Breakers
+from flask_okta.resilience import CircuitBreaker
+from flask_okta.resilience import OktaUnavailable
+
+class Clock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(threshold=3, reset_timeout=30, clock=clock)
+
+def test_closed_below_threshold(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+def test_success_resets_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+def test_opens_at_threshold(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()['opened'] == 1
+
+def test_retry_after_counts_down(clock, breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.retry_after() == 30
+    clock.now += 10.5
+    assert breaker.retry_after() == 20
+
+def test_half_open_lets_one_trial_through(clock, breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # the trial is in flight, everyone else still fails fast
+    assert not breaker.allow()
+
+def test_trial_success_closes(clock, breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+def test_trial_failure_reopens(clock, breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+    assert breaker.stats()['opened'] == 2
+
+def test_breakers_check_raises_while_open():
+    breakers = Breakers(threshold=1, reset_timeout=30)
+    breakers.check('token').record_failure()
+    with pytest.raises(OktaUnavailable) as excinfo:
+        breakers.check('token')
+    assert excinfo.value.retry_after == 30
+    # other endpoints have their own circuit
+    assert breakers.check('userinfo').allow()
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+from flask_okta.shared import SharedCache
+from flask_okta.store import MemoryStore
+
+class Clock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Fill:
+
+    def __init__(self, value='new', ttl=60, error=None):
+        self.value = value
+        self.ttl = ttl
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.value, self.ttl
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def store(clock):
+    return MemoryStore(clock=clock)
+
+@pytest.fixture
+def cache(store, clock):
+    return SharedCache(
+        store,
+        prefix = 'test:',
+        stale_ttl = 300,
+        fill_timeout = 10,
+        poll_interval = 0.001,
+        clock = clock,
+    )
+
+def hold_fill_lock(store, clock, key):
+    # another worker filling key
+    store.add(f'test:{ key }:fill', 'other', clock() + 10)
+
+def test_fills_missing(cache):
+    fill = Fill()
+    assert cache.get_or_fill('key', fill) == 'new'
+    assert fill.calls == 1
+    assert cache.get('key') == 'new'
+    assert cache.stats()['fill'] == 1
+
+def test_serves_fresh(cache):
+    cache.set('key', 'old', 60)
+    fill = Fill()
+    assert cache.get_or_fill('key', fill) == 'old'
+    assert fill.calls == 0
+
+def test_refills_expired(clock, cache):
+    cache.set('key', 'old', 60)
+    clock.now += 60
+    fill = Fill()
+    assert cache.get_or_fill('key', fill) == 'new'
+    assert fill.calls == 1
+
+def test_releases_fill_lock(store, cache):
+    cache.get_or_fill('key', Fill())
+    assert store.get('test:key:fill') is None
+
+def test_serves_stale_while_another_fills(clock, store, cache):
+    cache.set('key', 'old', 60)
+    clock.now += 60
+    hold_fill_lock(store, clock, 'key')
+    fill = Fill()
+    assert cache.get_or_fill('key', fill) == 'old'
+    assert fill.calls == 0
+    assert cache.stats()['stale'] == 1
+
+def test_get_does_not_serve_stale(clock, cache):
+    cache.set('key', 'old', 60)
+    clock.now += 60
+    assert cache.get('key') is None
+
+def test_stale_dropped_after_stale_ttl(clock, store, cache):
+    cache.set('key', 'old', 60)
+    clock.now += 60 + 300
+    assert store.get('test:key') is None
+
+def test_serves_stale_when_fill_fails(clock, cache):
+    cache.set('key', 'old', 60)
+    clock.now += 60
+    fill = Fill(error=RuntimeError('Okta is down'))
+    assert cache.get_or_fill('key', fill) == 'old'
+    assert cache.stats()['stale_error'] == 1
+
+def test_fill_error_without_stale_raises(cache):
+    with pytest.raises(RuntimeError):
+        cache.get_or_fill('key', Fill(error=RuntimeError('Okta is down')))
+
+def test_waits_for_another_fill(clock, store, cache):
+    hold_fill_lock(store, clock, 'key')
+
+    def other_worker():
+        while not cache.stats()['wait']:
+            time.sleep(0.001)
+        cache.set('key', 'theirs', 60)
+
+    thread = threading.Thread(target=other_worker)
+    thread.start()
+    fill = Fill()
+    assert cache.get_or_fill('key', fill) == 'theirs'
+    thread.join()
+    assert fill.calls == 0
+
+def test_takes_over_timed_out_fill_lock(clock, store, cache):
+    cache.set('key', 'old', 60)
+    clock.now += 60
+    hold_fill_lock(store, clock, 'key')
+    assert cache.get_or_fill('key', Fill()) == 'old'
+    # the other worker's lock ran out
+    clock.now += 10
+    assert cache.get_or_fill('key', Fill()) == 'new'
+
+def test_refills_unaccepted(cache):
+    cache.set('key', 'old', 60)
+    fill = Fill()
+    value = cache.get_or_fill('key', fill, accept=lambda value: value != 'old')
+    assert value == 'new'
+    assert fill.calls == 1
+
+def test_zero_ttl_not_stored(cache):
+    assert cache.get_or_fill('key', Fill(ttl=0)) == 'new'
+    assert cache.get('key') is None
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from flask_okta.store import MemoryStore
+from flask_okta.store import SQLiteStore
+
+class Clock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, clock, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteStore(str(tmp_path / 'store.sqlite3'), clock=clock)
+    return MemoryStore(clock=clock)
+
+def test_pop(store):
+    store.set('key', {'value': 1}, 1060)
+    assert store.pop('key') == {'value': 1}
+    assert store.get('key') is None
+
+def test_pop_once(store):
+    store.set('key', 'value', 1060)
+    store.pop('key')
+    assert store.pop('key', 'default') == 'default'
+
+def test_pop_expired(clock, store):
+    store.set('key', 'value', 1060)
+    clock.now = 1060
+    assert store.pop('key') is None
+    clock.now = 1000
+    assert store.get('key') is None
+
+def test_pop_concurrently_taken_once(store):
+    store.set('key', 'value', 1060)
+    barrier = threading.Barrier(8)
+    taken = []
+
+    def take():
+        barrier.wait()
+        taken.append(store.pop('key'))
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert taken.count('value') == 1
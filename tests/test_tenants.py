@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from flask import Flask
+from flask import jsonify
+
+from flask_okta import OktaManager
+from flask_okta.testing import DEFAULT_USERINFO
+from flask_okta.testing import FakeOkta
+
+@pytest.fixture
+def fake_okta():
+    return FakeOkta()
+
+@pytest.fixture
+def app(fake_okta):
+    app = Flask(__name__)
+    tenant_config = fake_okta.app_config(
+        redirect_uri = 'http://localhost/acme/authorization-code/callback',
+    )
+    app.config.update(
+        SECRET_KEY = 'test',
+        OKTA_TENANTS = {'acme': tenant_config},
+        OKTA_TENANT_FROM = 'path',
+        OKTA_SCOPE = 'openid email profile offline_access',
+        OKTA_REFRESH_PROACTIVE = True,
+        OKTA_TRANSPORT = fake_okta,
+    )
+    okta = OktaManager(app, after_authorization=lambda userinfo: 'in')
+
+    @app.route('/home')
+    def home():
+        return 'home'
+
+    @app.route('/acme/me')
+    def me():
+        return jsonify(okta.userinfo())
+
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def login(fake_okta, client):
+    fake_okta.login(client, login_path='/acme/redirect-for-okta-login')
+
+def expire_soon(client):
+    with client.session_transaction() as flask_session:
+        flask_session['_okta_expires_at'] = time.time() + 10
+
+def token_requests(fake_okta):
+    return [
+        path for method, path in fake_okta.requests
+        if path.endswith('/token')
+    ]
+
+def test_page_outside_tenants(client):
+    assert client.get('/home').status_code == 200
+
+def test_page_outside_tenants_after_login(fake_okta, client):
+    login(fake_okta, client)
+    expire_soon(client)
+    assert client.get('/home').status_code == 200
+    # no tenant to refresh with
+    assert len(token_requests(fake_okta)) == 1
+
+def test_tenant_page_refreshes(fake_okta, client):
+    login(fake_okta, client)
+    expire_soon(client)
+    response = client.get('/acme/me')
+    assert response.status_code == 200
+    assert response.json == DEFAULT_USERINFO
+    assert len(token_requests(fake_okta)) == 2
+
+def test_unknown_tenant(fake_okta, client):
+    login(fake_okta, client)
+    assert client.get('/other/redirect-for-okta-login').status_code == 404
@@ -0,0 +1,95 @@
+import pytest
+
+from flask_okta.throttle import OktaRateLimited
+from flask_okta.throttle import OktaThrottle
+
+class Clock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def rate_limit(limit, remaining, reset):
+    return {
+        'X-Rate-Limit-Limit': str(limit),
+        'X-Rate-Limit-Remaining': str(remaining),
+        'X-Rate-Limit-Reset': str(reset),
+    }
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def throttle(clock):
+    return OktaThrottle(max_wait=2, clock=clock)
+
+def test_unknown_endpoint_goes_out(throttle):
+    assert throttle.delay('token') == 0
+    assert not throttle.should_defer('token')
+    assert throttle.resend_delay('token') is None
+
+def test_plenty_left_goes_out(throttle):
+    throttle.update('token', rate_limit(100, 90, 1060), 200)
+    assert throttle.delay('token') == 0
+    assert throttle.stats()['token']['remaining'] == 89
+
+def test_paced_below_pace_share(throttle):
+    # 10 calls left for 20 seconds, one every 2 seconds
+    throttle.update('token', rate_limit(100, 10, 1020), 200)
+    assert throttle.delay('token') == 0
+    assert throttle.delay('token') == 2
+    # never held back longer than max_wait while some is left
+    assert throttle.delay('token') == 2
+    stats = throttle.stats()['token']
+    assert stats['paced'] == 2
+    assert stats['waited'] == 4
+
+def test_spent_waits_for_reset(throttle):
+    throttle.update('token', rate_limit(100, 0, 1001), 200)
+    assert throttle.delay('token') == 1
+
+def test_spent_beyond_max_wait_fails_fast(throttle):
+    throttle.update('token', rate_limit(100, 0, 1005), 200)
+    with pytest.raises(OktaRateLimited) as excinfo:
+        throttle.delay('token')
+    assert excinfo.value.retry_after == 5
+    assert throttle.stats()['token']['refused'] == 1
+
+def test_new_window_goes_out(clock, throttle):
+    throttle.update('token', rate_limit(100, 0, 1005), 200)
+    clock.now = 1005
+    assert throttle.delay('token') == 0
+
+def test_should_defer_below_defer_share(throttle):
+    throttle.update('token', rate_limit(100, 60, 1060), 200)
+    assert not throttle.should_defer('token')
+    throttle.update('token', rate_limit(100, 40, 1060), 200)
+    assert throttle.should_defer('token')
+    assert throttle.stats()['token']['deferred'] == 1
+
+def test_should_defer_until_window_resets(clock, throttle):
+    throttle.update('token', rate_limit(100, 10, 1060), 200)
+    assert throttle.should_defer('token')
+    clock.now = 1060
+    assert not throttle.should_defer('token')
+
+def test_resend_after_429(throttle):
+    wait = throttle.resend_after('token', rate_limit(100, 0, 1001), 429)
+    assert wait == 1
+    assert throttle.stats()['token']['rejected'] == 1
+
+def test_no_resend_beyond_max_wait(throttle):
+    headers = rate_limit(100, 0, 1010)
+    assert throttle.resend_after('token', headers, 429) is None
+
+def test_no_resend_for_other_statuses(throttle):
+    headers = rate_limit(100, 5, 1010)
+    assert throttle.resend_after('token', headers, 200) is None
+
+def test_429_without_headers_counts_as_spent(throttle):
+    throttle.update('token', {}, 429)
+    assert throttle.stats()['token']['remaining'] == 0
@@ -0,0 +1,11 @@
+from flask.sessions import SecureCookieSessionInterface
+
+from flask_okta.wrappers import LoginPolicy
+from flask_okta.wrappers import PolicySessionInterface
+
+def test_policy_session_interface_passes_attributes_through():
+    wrapped = SecureCookieSessionInterface()
+    interface = PolicySessionInterface(wrapped, LoginPolicy())
+    interface.salt = 'configured'
+    assert wrapped.salt == 'configured'
+    assert interface.salt == 'configured'